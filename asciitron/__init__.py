@@ -1,14 +1,33 @@
 # -*- coding: utf-8 -*-
 
 import argparse
+import os
 
-from server import TronServer
-from client import TronClient
+from server import TronServer, AsyncioServer, Supervisor, logger
+from server import settings as server_settings
+from client import TronClient, HeadlessClient, Replay
+from common.recording import Recording
+from common.protocol import MAX_PLAYER_ID
+from bench import load
+
+def arena(text):
+    """WIDTHxHEIGHT of serve --arena."""
+    try:
+        width, height = [int(n) for n in text.lower().split("x")]
+    except ValueError:
+        raise argparse.ArgumentTypeError("expected WIDTHxHEIGHT, e.g. "
+                                         "2000x2000")
+    if not (3 <= width <= 32767 and 3 <= height <= 32767):
+        raise argparse.ArgumentTypeError("3 to 32767 fields per side")
+    return width, height
 
 def main():
     parser = argparse.ArgumentParser(description='TronClient Game')
     parser.add_argument('-p', '--port', dest='port', type=int, 
                         default=9158, help='communication port, default: 9158')
+    parser.add_argument('-u', '--udp', action='store_true',
+                        help='play over UDP on the port (serve: in addition '
+                        'to TCP)')
     
     subparsers = parser.add_subparsers()
     
@@ -17,26 +36,170 @@ def main():
     client_parser.add_argument('playerid', type=int, help='player id')
     client_parser.add_argument('--beep', action='store_true',
                         help='beeps during game countdown to notify the user')
+    client_parser.add_argument('--latency', action='store_true',
+                        help='report input and drawing latencies at the end')
+    client_parser.add_argument('--headless', action='store_true',
+                        help='play without curses, a scripted pilot steers')
+    client_parser.add_argument('--no-prediction', action='store_true',
+                        help='wait for the server to tell about crashes')
+
+    watch_parser = subparsers.add_parser('watch', help='Watch a game')
+    watch_parser.add_argument('server', help='server hostname')
+    watch_parser.add_argument('--room', type=int, default=0,
+                        help='room number, default: the first running game')
+    watch_parser.add_argument('--headless', action='store_true',
+                        help='watch without curses')
 
     server_parser = subparsers.add_parser('serve', help='Serve a game')
     server_parser.add_argument('playercount', type=int, help='number of players')
+    server_parser.add_argument('--engine',
+                        choices=['epoll', 'select', 'asyncio'],
+                        help='event engine, default: best available')
+    server_parser.add_argument('--authoritative', action='store_true',
+                        default=None, help='simulate the game on the server, '
+                        'clients only send direction changes')
+    server_parser.add_argument('--rooms', type=int, default=None,
+                        help='games hosted at once, default: unlimited')
+    server_parser.add_argument('--workers', type=int, default=None,
+                        help='worker processes sharing the games, default: 1')
+    server_parser.add_argument('--metrics-port', type=int, default=None,
+                        help='serve metrics on this local port (one per worker)')
+    server_parser.add_argument('--metrics-file', default=None,
+                        help='write metrics to this file periodically')
+    server_parser.add_argument('--record', default=None,
+                        help='record every game into this directory')
+    server_parser.add_argument('--bots', dest='ai_bots', type=int,
+                        default=None, help='AI players in every game (counted in '
+                        'playercount), default: 0')
+    server_parser.add_argument('--arena', type=arena, default=None,
+                        help='board size WIDTHxHEIGHT, clients scroll their '
+                        'view, default: the smallest terminal')
+    server_parser.add_argument('--checkpoint', default=None,
+                        help='checkpoint the running games into this file, '
+                        'restarted with it they resume')
+    server_parser.add_argument('--log-level',
+                        choices=['debug', 'info', 'warning', 'error'],
+                        help='minimum level logged, default: info')
+    server_parser.add_argument('--log-file', default=None,
+                        help='log to this file instead of stdout')
+
+    replay_parser = subparsers.add_parser('replay', help='Replay a recorded game')
+    replay_parser.add_argument('recording', help='recording file (serve --record)')
+    replay_parser.add_argument('--speed', type=float, default=1.0,
+                        help='playback speed, default: 1 (real time)')
+    replay_parser.add_argument('--fast', action='store_true',
+                        help='replay as fast as possible')
+    replay_parser.add_argument('--seek', type=float, default=0,
+                        help='start at this second of the game')
+    replay_parser.add_argument('--headless', action='store_true',
+                        help='replay without curses')
+
+    bench_parser = subparsers.add_parser('bench',
+                        help='Load test a local server with scripted bots')
+    load.add_arguments(bench_parser)
 
     args = parser.parse_args()
     args = vars(args)
     
-    if args.has_key('hostname'):
+    if args.has_key('bots'):
+        # Run the load test
+        load.main(args)
+    elif args.has_key('recording'):
+        # Replay a game
+        recording = Recording(args['recording'])
+        if args['headless']:
+            tron = HeadlessClient(hostname=None, player_id=0, port=args['port'])
+        else:
+            tron = TronClient(hostname=None, player_id=0, port=args['port'],
+                              beep=False)
+        replay = Replay(tron, recording, speed=not args['fast'] and args['speed'],
+                        start=args['seek'])
+        try:
+            if replay.run():
+                replay.finish()
+        finally:
+            tron.stop()
+    elif args.has_key('server'):
+        # Watch a game
+        if args['headless']:
+            tron = HeadlessClient(hostname=args['server'], player_id=0,
+                                  port=args['port'], watch=args['room'],
+                                  udp=args['udp'])
+        else:
+            tron = TronClient(hostname=args['server'], player_id=0,
+                              port=args['port'], beep=False, watch=args['room'],
+                              udp=args['udp'])
+        try:
+            tron.run()
+        finally:
+            tron.stop()
+    elif args.has_key('hostname'):
         # Connect to a server
-        tron = TronClient(hostname=args['hostname'], 
-                    player_id=args['playerid'],
-                    port=args['port'],
-                    beep=args['beep'])
+        if args['headless']:
+            tron = HeadlessClient(hostname=args['hostname'],
+                        player_id=args['playerid'],
+                        port=args['port'],
+                        latency=args['latency'],
+                        predict=not args['no_prediction'],
+                        udp=args['udp'])
+        else:
+            tron = TronClient(hostname=args['hostname'], 
+                        player_id=args['playerid'],
+                        port=args['port'],
+                        beep=args['beep'],
+                        latency=args['latency'],
+                        predict=not args['no_prediction'],
+                        udp=args['udp'])
         try:
             tron.run()
         finally:
             tron.stop()
     else:
         # Run a server
-        server = TronServer(player_count=args['playercount'], port=args['port'])
+        logger.configure(level=args['log_level'], filename=args['log_file'])
+        options = dict(engine=args['engine'],
+                       authoritative=args['authoritative'],
+                       max_rooms=args['rooms'],
+                       metrics_port=args['metrics_port'],
+                       metrics_file=args['metrics_file'],
+                       record=args['record'],
+                       bots=args['ai_bots'],
+                       arena=args['arena'],
+                       checkpoint=args['checkpoint'])
+        if (args['ai_bots'] or 0) >= args['playercount']:
+            parser.error("bots take at most playercount - 1 seats")
+        if (args['ai_bots'] or 0) >= MAX_PLAYER_ID:
+            parser.error("bots take at most %d of the player ids 1-%d" %
+                         (MAX_PLAYER_ID - 1, MAX_PLAYER_ID))
+        workers = args['workers'] or server_settings.WORKERS
+        checkpoint = args['checkpoint'] or server_settings.CHECKPOINT
+        record = args['record'] or server_settings.RECORD_DIR
+        if record and not (os.path.isdir(record) and
+                           os.access(record, os.W_OK | os.X_OK)):
+            parser.error("can't write recordings to %s" % record)
+        if checkpoint and workers > 1:
+            parser.error("checkpoints are written by one process")
+        if args['udp']:
+            if workers > 1:
+                parser.error("UDP is served from one process")
+            if checkpoint:
+                parser.error("checkpointed games are resumed over TCP only")
+            options['udp'] = True
+        if (args['engine'] or server_settings.ENGINE) == 'asyncio':
+            if workers > 1:
+                parser.error("the asyncio engine serves from one process")
+            if args['udp']:
+                parser.error("the asyncio engine serves TCP only")
+            del options['engine']
+            server = AsyncioServer(player_count=args['playercount'],
+                                   port=args['port'], **options)
+        elif workers > 1:
+            server = Supervisor(workers, player_count=args['playercount'],
+                                port=args['port'], **options)
+            server.start()
+        else:
+            server = TronServer(player_count=args['playercount'],
+                                port=args['port'], **options)
         try:
             server.serve()
         except KeyboardInterrupt:
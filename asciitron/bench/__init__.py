@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+
+"""
+Benchmarks for asciitron. Every module can be run on its own, e.g.:
+
+    python -m asciitron.bench.eventloop
+"""
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    k = min(len(values) - 1, int(round(p / 100.0 * (len(values) - 1))))
+    return values[k]
+
+def table(header, rows):
+    widths = [max(len(str(row[i])) for row in [header] + rows)
+              for i in xrange(len(header))]
+    line = "  ".join("%%%ds" % w for w in widths)
+    print line % tuple(header)
+    print "  ".join("-" * w for w in widths)
+    for row in rows:
+        print line % tuple(row)
+
+def spawn_server(player_count, port, server_class=None, **kwargs):
+    """
+    Forks a TronServer, or a server_class taking the same arguments (output
+    silenced), returns its pid.
+    """
+    import os
+    import sys
+    import time
+    pid = os.fork()
+    if pid == 0:
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, sys.stdout.fileno())
+        if server_class is None:
+            from ..server import TronServer as server_class
+        server = server_class(player_count=player_count, port=port, **kwargs)
+        try:
+            server.serve()
+        except KeyboardInterrupt:
+            server.stop()
+        finally:
+            os._exit(0)
+    time.sleep(.2) # give it some time to bind
+    return pid
+
+def stop_server(pid):
+    import os
+    import signal
+    os.kill(pid, signal.SIGINT)
+    os.waitpid(pid, 0)
+
+def cpu_time(pid):
+    """User + system CPU seconds used by process pid so far (Linux only)."""
+    import os
+    fields = open("/proc/%d/stat" % pid).read().rsplit(")", 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / float(os.sysconf('SC_CLK_TCK'))
@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+
+"""
+The AI players (common/ai.py, serve --bots).
+
+Speed: decisions per second on boards filled by 9 cycles (see trails.py),
+pure Python and NumPy (if installed), and the share of a SPEED_NORMAL tick
+9 bots need.
+
+Strength: GAMES games of the AI against a baseline on a small board, both
+start at random fields; every turn both move at once (in random order, the
+first one takes a field both want), like in the server. "random" picks any
+free direction, "staircase" is the bench bots' run (bots.py). The
+baselines against each other are the reference.
+"""
+
+import random
+import time
+
+from ..common import ai
+from ..common import *
+from ..server import settings
+from . import table
+from . import trails
+
+BOARDS = ((200, 60), (1000, 1000), (2000, 2000))
+CYCLES = 9
+DECISIONS = 2.0 # seconds measured per board and implementation
+STRENGTH_BOARD = (60, 30)
+GAMES = 200
+TURN_EVERY = 10 # staircase
+
+def speed(vectorized):
+    rows = []
+    for width, height in BOARDS:
+        board = Segments(width, height)
+        heads = {}
+        steps = trails.drive(width, height)
+        # Halfway through the game
+        for x, y, player_id in steps[:len(steps) // 2]:
+            board.occupy(x, y, player_id)
+            heads[player_id] = (x, y)
+        heads = heads.values()[:CYCLES]
+        count = 0
+        start = time.time()
+        while time.time() - start < DECISIONS:
+            for x, y in heads:
+                ai.choose(board, x, y, DIR_RIGHT,
+                          [head for head in heads if head != (x, y)],
+                          vectorized=vectorized)
+            count += len(heads)
+        decision = (time.time() - start) / count
+        rows.append(("%dx%d" % (width, height),
+                     vectorized and "numpy" or "python",
+                     "%.0f" % (1 / decision), "%.2f" % (decision * 1000),
+                     "%.0f%%" % (decision * CYCLES * 100000 /
+                                 settings.SPEED_NORMAL)))
+    return rows
+
+def free_directions(board, x, y, direction):
+    result = []
+    for d, (dx, dy) in DIR_DELTA.items():
+        if d != DIR_OPPOSITE[direction] and \
+            0 < x + dx < board.width - 1 and 0 < y + dy < board.height - 1 \
+            and not board.get(x + dx, y + dy):
+            result.append(d)
+    return result
+
+def play(rnd, strategies):
+    """Plays one game, returns the index of the winner (None: a draw)."""
+    width, height = STRENGTH_BOARD
+    board = Segments(width, height)
+    cycles = []
+    for i, strategy in enumerate(strategies):
+        while True:
+            x = rnd.randint(int(width * 0.1), int(width * 0.9))
+            y = rnd.randint(int(height * 0.1), int(height * 0.9))
+            if (x, y) not in [(c[1], c[2]) for c in cycles]:
+                break
+        direction = rnd.choice(DIR_DELTA.keys())
+        if strategy == "staircase":
+            direction = DIR_RIGHT
+        cycles.append([i + 1, x, y, direction, strategy, 0])
+    alive = cycles[:]
+    while len(alive) > 1:
+        moves = []
+        for cycle in alive:
+            player_id, x, y, direction, strategy, steps = cycle
+            if strategy == "ai":
+                direction = ai.choose(board, x, y, direction,
+                                      [(c[1], c[2]) for c in alive
+                                       if c is not cycle])
+            elif strategy == "random":
+                direction = rnd.choice(free_directions(board, x, y, direction)
+                                       or [direction])
+            else:
+                direction = (steps + 1) % TURN_EVERY and DIR_RIGHT or DIR_DOWN
+            moves.append((cycle, direction))
+        rnd.shuffle(moves)
+        for cycle, direction in moves:
+            dx, dy = DIR_DELTA[direction]
+            x, y = cycle[1] + dx, cycle[2] + dy
+            if not (0 < x < width - 1 and 0 < y < height - 1) or \
+                board.get(x, y):
+                alive.remove(cycle)
+                board.clear_player(cycle[0])
+                continue
+            board.occupy(x, y, cycle[0])
+            cycle[1:4] = [x, y, direction]
+            cycle[5] += 1
+    if alive:
+        return alive[0][0] - 1
+    return None
+
+def strength():
+    rows = []
+    for strategies in (("ai", "random"), ("ai", "staircase"),
+                       ("random", "random"), ("random", "staircase")):
+        rnd = random.Random(1)
+        wins = [0, 0]
+        for _ in xrange(GAMES):
+            winner = play(rnd, strategies)
+            if winner is not None:
+                wins[winner] += 1
+        rows.append(("%s vs %s" % strategies, GAMES,
+                     "%.0f%%" % (wins[0] * 100.0 / GAMES),
+                     "%.0f%%" % (wins[1] * 100.0 / GAMES),
+                     "%.0f%%" % ((GAMES - sum(wins)) * 100.0 / GAMES)))
+    return rows
+
+def main():
+    rows = speed(False)
+    if ai.numpy is not None:
+        rows += speed(True)
+    table(("board", "implementation", "decisions/s", "ms/decision",
+           "%d bots of a tick" % CYCLES), rows)
+    print
+    table(("game", "games", "first wins", "second wins", "both crashed"),
+          strength())
+
+if __name__ == '__main__':
+    main()
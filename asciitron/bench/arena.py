@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+
+"""
+Area of interest filtering (serve --arena, settings.AOI_CELL): PLAYERS bots
+with 200x60 terminals play client-driven on a 2000x2000 arena, once with
+every player getting every position (AOI_CELL = 0) and once filtered to the
+positions around its cycle. The bots start spread over the whole arena or
+clustered in one corner of it (then most of them are in each other's view
+anyway). Reports, after the countdown, per client:
+
+    bytes/s, records/s  received, records are position updates
+    caught up/s         records of them older than CATCH_UP seconds: the
+                        trails in cells a bot's view moved into
+    fan-out p50/p99     from a bot sending a position to another bot's
+                        receipt (only bots that got it, no caught up ones)
+
+the bots crashed until the end (clustered ones run into each other, which
+lowers the load) and the server CPU time per tick (one round of PLAYERS
+positions).
+"""
+
+import random
+import time
+
+from ..server import settings
+from . import spawn_server, stop_server, percentile, cpu_time, table
+from .bots import Bot, run_bots
+
+PORT = 9240
+PLAYERS = 50
+ARENA = (2000, 2000)
+CLUSTER = (300, 150) # fields of the corner the clustered bots start in
+DURATION = 10.0
+CATCH_UP = 0.25 # seconds, two ticks
+
+class ArenaBot(Bot):
+    """Starts at a random field of region (left, top, width, height)."""
+
+    caught_up = 0
+
+    def handle_packet(self, packet):
+        fanout = len(self.fanout)
+        Bot.handle_packet(self, packet)
+        if len(self.fanout) > fanout and self.fanout[-1] > CATCH_UP:
+            self.fanout.pop()
+            self.caught_up += 1
+        if packet[1] == 1:
+            left, top, width, height = self.region
+            self.x = random.randint(left, left + width - 1)
+            self.y = random.randint(top, top + height - 1)
+
+def run(server, port, spread):
+    """Plays one game on the server (pid) at port, returns the numbers."""
+    if spread:
+        # Staircases run right and down, leave them room for DURATION
+        region = (10, 10, ARENA[0] - 200, ARENA[1] - 50)
+    else:
+        region = (10, 10) + CLUSTER
+    bots = []
+    for player_id in xrange(1, PLAYERS + 1):
+        bot = ArenaBot(player_id, port)
+        bot.region = region
+        bots.append(bot)
+        run_bots(bots, .05)
+    peers = dict((bot.player_id, bot) for bot in bots)
+    for bot in bots:
+        bot.peers = peers
+    run_bots(bots, settings.SECONDS + 1.5)
+    for bot in bots:
+        bot.bytes_in = bot.positions = bot.caught_up = 0
+        del bot.fanout[:]
+    cpu = cpu_time(server)
+    start = time.time()
+    run_bots(bots, DURATION)
+    elapsed = time.time() - start
+    cpu = cpu_time(server) - cpu
+    received = [(bot.bytes_in, bot.positions, bot.caught_up)
+                for bot in bots]
+    fanout = [t for bot in bots for t in bot.fanout]
+    crashed = len([bot for bot in bots if bot.crashed])
+    for bot in bots:
+        bot.close()
+    run_bots(bots, .2)
+    ticks = elapsed * 1000 / bots[0].speed
+    per_client = [sum(column) / elapsed / len(bots)
+                  for column in zip(*received)]
+    return per_client + [percentile(fanout, 50), percentile(fanout, 99),
+                         crashed, cpu / ticks]
+
+def main():
+    settings.SECONDS = 1 # the forked servers inherit these
+    cell = settings.AOI_CELL or 32
+    rows = []
+    for aoi in (0, cell):
+        settings.AOI_CELL = aoi
+        for spread in (True, False):
+            port = PORT + len(rows)
+            server = spawn_server(PLAYERS, port, arena=ARENA)
+            try:
+                result = run(server, port, spread)
+            finally:
+                stop_server(server)
+            bytes_s, records_s, caught_up, p50, p99, crashed, cpu = result
+            rows.append((aoi and "%d" % aoi or "off",
+                         spread and "spread" or "clustered",
+                         "%.0f" % bytes_s, "%.1f" % records_s,
+                         "%.1f" % caught_up,
+                         "%.1f" % (p50 * 1000), "%.1f" % (p99 * 1000),
+                         crashed, "%.2f" % (cpu * 1000)))
+    table(("AOI cell", "start", "bytes/s", "records/s", "caught up/s",
+           "fan-out p50 (ms)", "fan-out p99 (ms)", "crashed",
+           "server ms/tick"), rows)
+
+if __name__ == '__main__':
+    main()
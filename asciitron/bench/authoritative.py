@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+
+"""
+Client-driven vs. server-authoritative mode with 9 players: inbound packets
+per second and server CPU usage during a running game.
+"""
+
+import sys
+
+from ..server import settings
+from . import spawn_server, stop_server, cpu_time, table
+from .bots import connect_bots, run_bots
+
+PLAYERS = 9
+DURATION = 5.0 # seconds measured after the countdown
+PORT = 9170
+
+def run(authoritative, port=PORT):
+    server = spawn_server(PLAYERS, port, authoritative=authoritative)
+    try:
+        bots = connect_bots(PLAYERS, port, width=400, height=200)
+        run_bots(bots, settings.SECONDS + .5) # countdown
+
+        packets = sum(bot.packets_out for bot in bots)
+        cpu = cpu_time(server)
+        run_bots(bots, DURATION)
+        packets = sum(bot.packets_out for bot in bots) - packets
+        cpu = cpu_time(server) - cpu
+        alive = len([bot for bot in bots if not bot.crashed])
+
+        for bot in bots:
+            bot.close()
+    finally:
+        stop_server(server)
+
+    return packets / DURATION, cpu / DURATION * 100, alive
+
+def main():
+    rows = []
+    for authoritative in (False, True):
+        pps, cpu, alive = run(authoritative, PORT + int(authoritative))
+        rows.append((authoritative and "authoritative" or "client-driven",
+                     "%.1f" % pps, "%.1f" % cpu, "%d/%d" % (alive, PLAYERS)))
+        sys.stdout.flush()
+    table(("mode", "inbound packets/s", "server CPU %", "alive at end"), rows)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+
+"""
+Slow consumers: a room of 9 players (socketpairs with small send buffers)
+where everybody moves every tick. 7 clients read everything, one reads 1 KB
+every 10 ticks ("slow") and one never reads ("stalled").
+
+"unbounded" queues everything (no high-water mark, no limit), "backpressure"
+uses the OUTPUT_HIGH_WATER/OUTPUT_LIMIT settings. Every run happens in a
+forked process to report its own peak memory.
+"""
+
+import os
+import resource
+import socket
+import sys
+import time
+
+from ..server import settings
+from .broadcast import create_room
+from . import table
+
+PLAYERS = 9
+TICKS = 20000
+SLOW, STALLED = 8, 9 # player ids
+
+def drain(sock, size=65536):
+    received = 0
+    while received < size:
+        try:
+            data = sock.recv(min(65536, size - received))
+        except socket.error:
+            break
+        if not data:
+            break
+        received += len(data)
+    return received
+
+def create():
+    """The room of PLAYERS players, returns it and player id -> player."""
+    room = create_room(PLAYERS)
+    players = {}
+    for player_id, player in enumerate(room.players):
+        player.player_id = player_id + 1
+        player.connection.socket.setsockopt(socket.SOL_SOCKET,
+                                            socket.SO_SNDBUF, 4096)
+        player.peer.setblocking(0)
+        players[player.player_id] = player
+    return room, players
+
+def play(room, players, ticks=TICKS):
+    server = room.server
+
+    backlog = {SLOW: 0, STALLED: 0}
+    received = 0
+    start = time.time()
+    for tick in xrange(ticks):
+        for player_id in players:
+            room.broadcast(player_id, 2, tick % 1000 + 1, player_id)
+        room.flush()
+        for player_id, player in players.items():
+            if player not in room.players:
+                continue
+            if player_id in backlog:
+                backlog[player_id] = max(backlog[player_id],
+                                         player.buf_out.size +
+                                         player.deferred_bytes)
+            player.connection.handle_write()
+            if player_id == SLOW:
+                if tick % 10 == 0:
+                    drain(player.peer, 1024)
+            elif player_id != STALLED:
+                received += drain(player.peer)
+    elapsed = time.time() - start
+    return (elapsed, backlog[SLOW], backlog[STALLED], server.coalesced_bytes,
+            server.dropped_bytes, server.evicted, received)
+
+def measure(high_water, limit):
+    rfd, wfd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(rfd)
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, sys.stdout.fileno())
+        settings.OUTPUT_HIGH_WATER = high_water
+        settings.OUTPUT_LIMIT = limit
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        result = play(*create())
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss
+        os.write(wfd, " ".join(map(str, result + (rss,))))
+        os._exit(0)
+    os.close(wfd)
+    result = os.read(rfd, 1000).split()
+    os.close(rfd)
+    os.waitpid(pid, 0)
+    return [float(result[0])] + map(int, result[1:])
+
+def main():
+    rows = []
+    for name, high_water, limit in (
+            ("unbounded", sys.maxint, sys.maxint),
+            ("backpressure", settings.OUTPUT_HIGH_WATER,
+             settings.OUTPUT_LIMIT)):
+        (elapsed, slow, stalled, coalesced, dropped, evicted, received,
+         rss) = measure(high_water, limit)
+        rows.append((name, slow // 1024, stalled // 1024, coalesced // 1024,
+                     dropped // 1024, evicted, received // 1024, rss,
+                     "%.3f" % (elapsed / TICKS * 1000)))
+    table(("output", "slow peak KB", "stalled peak KB", "coalesced KB",
+           "dropped KB", "evicted", "others got KB", "peak KB",
+           "ms per tick"), rows)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,212 @@
+# -*- coding: utf-8 -*-
+
+"""
+Scripted players speaking the raw protocol, without curses. Many bots are
+driven by one select loop (run_bots), which makes it cheap to load a server
+with lots of connections.
+
+Bots run a staircase: TURN_EVERY steps to the right, one step down.
+"""
+
+import select
+import socket
+import struct
+import random
+import time
+
+from ..common import *
+
+TURN_EVERY = 10
+
+class Bot(object):
+    def __init__(self, player_id, port, width=200, height=60,
+                 host='127.0.0.1', version=PROTOCOL_VERSION):
+        self.player_id = player_id
+        self.version = version # highest protocol version to ask for
+        self.width = width
+        self.height = height
+        self.connect(host, port)
+        self.buf_in = InputBuffer()
+        self.decoder = Decoder()
+
+        self.authoritative = False
+        self.started_at = None # game start (after the countdown)
+        self.speed = 120
+        self.next_step = None
+        self.steps = 0
+        self.direction = DIR_RIGHT
+        self.x = 0
+        self.y = 0
+        self.crashed = False
+        self.closed = False
+        self.won = None
+
+        self.packets_in = 0
+        self.packets_out = 0
+        self.bytes_in = 0
+        self.positions = 0 # position updates received
+        self.received_at = 0 # time of the last recv
+        self.sent = {} # (x, y) -> time it was told to the server
+        self.peers = {} # player id -> Bot in the same room
+        self.fanout = [] # seconds from a peer's send to our receipt
+
+    def connect(self, host, port):
+        self.socket = socket.create_connection((host, port))
+        self.socket.setblocking(0)
+
+    def fileno(self):
+        return self.socket.fileno()
+
+    def send(self, cmd, x, y, misc=0):
+        try:
+            self.socket.send(struct.pack(FMT_TOSERVER, cmd, x, y, misc))
+        except socket.error:
+            self.close()
+        else:
+            self.packets_out += 1
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.socket.close()
+
+    def handle_read(self):
+        try:
+            count = self.buf_in.recv_from(self.socket)
+        except socket.error:
+            count = 0
+        if not count:
+            self.close()
+            return
+        self.bytes_in += count
+        self.received_at = time.time()
+        for packet in self.decoder.decode(self.buf_in):
+            self.handle_packet(packet)
+
+    def handle_packet(self, packet):
+        player_id, cmd, x, y, speed, nitro, misc = packet
+        self.packets_in += 1
+        if speed > 0:
+            self.speed = speed
+        if cmd == 0:
+            if misc >= 2 and self.version >= 2:
+                self.send(1, min(misc, self.version), 0)
+            self.send(0, self.width, self.height, self.player_id)
+        elif cmd == 1:
+            self.authoritative = misc == 1
+            self.started_at = time.time() + player_id
+            self.next_step = self.started_at
+            self.x = random.randint(int(x * 0.1), int(x * 0.3))
+            self.y = random.randint(int(y * 0.1), int(y * 0.5))
+        elif cmd == 2:
+            self.positions += 1
+            peer = self.peers.get(player_id)
+            if peer is not None and peer is not self:
+                sent = peer.sent.get((x, y))
+                if sent is not None:
+                    self.fanout.append(self.received_at - sent)
+            if self.authoritative and player_id == self.player_id:
+                self.x, self.y = x, y
+        elif cmd in (3, 4) and player_id == self.player_id:
+            self.crashed = True
+            self.won = cmd == 4
+        elif cmd == 8:
+            self.send(8, 0, 0)
+        elif cmd == 9:
+            self.close()
+
+    def timeout(self, now):
+        if self.next_step is None or self.crashed or self.closed:
+            return None
+        return max(0, self.next_step - now)
+
+    def act(self, now):
+        if self.next_step is None or now < self.next_step or self.crashed:
+            return
+        self.next_step += self.speed / 1000.0
+        self.steps += 1
+
+        direction = (self.steps % TURN_EVERY == 0) and DIR_DOWN or DIR_RIGHT
+        if self.authoritative:
+            if direction != self.direction:
+                self.send(22, direction, 0)
+        else:
+            dx, dy = DIR_DELTA[direction]
+            self.x += dx
+            self.y += dy
+            self.sent[(self.x, self.y)] = now
+            self.send(2, self.x, self.y)
+        self.direction = direction
+
+class DatagramBot(Bot):
+    """Bot playing over UDP (see common/datagram.py)."""
+
+    def connect(self, host, port):
+        self.channel = DatagramChannel(host, port)
+        self.socket = self.channel.socket
+        self.channel.open()
+
+    def send(self, cmd, x, y, misc=0):
+        if not self.channel.send(cmd, x, y, misc):
+            self.close()
+        else:
+            self.packets_out += 1
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.channel.close()
+
+    def handle_read(self):
+        packets = self.channel.receive()
+        if packets is None:
+            self.close()
+            return
+        self.bytes_in = self.channel.bytes_in
+        self.received_at = time.time()
+        for packet in packets:
+            self.handle_packet(packet)
+
+    def timeout(self, now):
+        timeout = Bot.timeout(self, now)
+        if self.closed:
+            return timeout
+        resend = self.channel.timeout(now)
+        if timeout is None or resend < timeout:
+            return resend
+        return timeout
+
+    def act(self, now):
+        Bot.act(self, now)
+        if not self.closed and not self.channel.resend(now):
+            self.close()
+
+def run_bots(bots, duration):
+    """Drives all bots for duration seconds."""
+    end = time.time() + duration
+    while True:
+        now = time.time()
+        if now >= end:
+            break
+        active = [bot for bot in bots if not bot.closed]
+        if not active:
+            break
+        timeout = end - now
+        for bot in active:
+            t = bot.timeout(now)
+            if t is not None and t < timeout:
+                timeout = t
+        r, _, _ = select.select(active, [], [], timeout)
+        for bot in r:
+            bot.handle_read()
+        now = time.time()
+        for bot in active:
+            bot.act(now)
+
+def connect_bots(count, port, first_id=1, **kwargs):
+    bots = []
+    for i in xrange(count):
+        bots.append(Bot(first_id + i, port, **kwargs))
+        # Let the server assign the id before the next one shows up
+        run_bots(bots, .05)
+    return bots
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+
+"""
+Broadcast fan-out: one tick in which every player reports a new position.
+
+"legacy" packs every event once per recipient and appends it to a str
+buffer; "frame" is Room.broadcast/flush, packing every event once and
+queueing the frame by reference. Bytes copied counts the bytes written into
+new strings (packing, joining, appending to buffers).
+"""
+
+import os
+import socket
+import struct
+import sys
+import time
+
+from ..common import *
+from ..server.tronserver import TronServer, SocketConnection
+from ..server.game import Player
+from . import table
+
+PLAYERS = (2, 9, 50, 200, 500)
+ROUNDS = 20
+
+class LegacyPlayer(object):
+    def __init__(self):
+        self.buf_out = ""
+        self.speed = 120
+        self.nitrotank = 100
+
+    def send(self, player_id, cmd, x, y, misc=0):
+        self.buf_out += struct.pack(FMT_TOPLAYER, player_id, cmd, x, y,
+                                    int(self.speed), int(self.nitrotank), misc)
+
+def legacy(count):
+    players = [LegacyPlayer() for _ in xrange(count)]
+    copied = 0
+    start = time.time()
+    for player_id in xrange(count):
+        for player in players:
+            player.send(player_id, 2, player_id, 1)
+            copied += FMT_SIZE_TOPLAYER * 2 # pack + append
+    return time.time() - start, copied
+
+def frame(room, count):
+    copied = 0
+    start = time.time()
+    for player_id in xrange(count):
+        room.broadcast(player_id, 2, player_id, 1)
+        copied += FMT_SIZE_TOPLAYER # pack
+    copied += FMT_SIZE_TOPLAYER * count # join
+    room.flush()
+    elapsed = time.time() - start
+
+    for player in room.players:
+        player.buf_out = OutputQueue()
+    return elapsed, copied
+
+def create_room(count, room_class=None):
+    """A room of count players connected to socketpairs, returns the room."""
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, "w")
+    try:
+        server = TronServer(player_count=count, port=0)
+        if room_class is not None:
+            server.room_class = room_class
+        room = server.find_room()
+        for _ in xrange(count):
+            conn, peer = socket.socketpair()
+            connection = SocketConnection(server, conn, ("bench", 0))
+            server.engine.register(connection)
+            player = Player(server, connection)
+            player.peer = peer
+            room.join(player)
+    finally:
+        sys.stdout = stdout
+    return room
+
+def main():
+    rows = []
+    for count in PLAYERS:
+        room = create_room(count)
+        results = {}
+        for name, run in (("legacy", legacy),
+                          ("frame", lambda n: frame(room, n))):
+            elapsed, copied = 0, 0
+            for _ in xrange(ROUNDS):
+                t, copied = run(count)
+                elapsed += t
+            results[name] = (elapsed / ROUNDS, copied)
+        for name in ("legacy", "frame"):
+            elapsed, copied = results[name]
+            rows.append((count, name, copied, "%.3f" % (elapsed * 1000),
+                         "%.1fx" % (results["legacy"][0] / elapsed)))
+        room.server.socket.close()
+    table(("players", "method", "bytes copied/tick", "ms/tick", "speedup"),
+          rows)
+
+if __name__ == '__main__':
+    main()
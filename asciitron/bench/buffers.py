@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+
+"""
+Stress test of the connection buffers: 100k packets through one connection,
+each direction, with the old str buffers ("legacy") and with
+InputBuffer/OutputQueue. Every run happens in a forked process to report its
+own peak memory (maxrss growth).
+"""
+
+import os
+import resource
+import socket
+import struct
+import threading
+import time
+
+from ..common import *
+from . import table
+
+PACKETS = 100000
+BURST = 5000 # packets written at once by the peer
+
+def receive_legacy(sock):
+    buf_in, count = "", 0
+    while count < PACKETS:
+        buf = sock.recv(8192)
+        buf_in += buf
+        while len(buf_in) >= FMT_SIZE_TOSERVER:
+            struct.unpack(FMT_TOSERVER, buf_in[:FMT_SIZE_TOSERVER])
+            buf_in = buf_in[FMT_SIZE_TOSERVER:]
+            count += 1
+
+def receive_buffer(sock):
+    buf_in, count = InputBuffer(), 0
+    while count < PACKETS:
+        buf_in.recv_from(sock)
+        count += len(buf_in.unpack_all(PACKET_TOSERVER))
+
+def inbound(receive):
+    sock, peer = socket.socketpair()
+    burst = struct.pack(FMT_TOSERVER, 2, 1, 1, 0) * BURST
+
+    def writer():
+        for _ in xrange(PACKETS // BURST):
+            peer.sendall(burst)
+    thread = threading.Thread(target=writer)
+    thread.start()
+    receive(sock)
+    thread.join()
+
+def send_legacy(sock):
+    buf_out = ""
+    for i in xrange(PACKETS):
+        buf_out += struct.pack(FMT_TOPLAYER, 1, 2, i, 1, 120, 100, 0)
+    while buf_out:
+        buf_out = buf_out[sock.send(buf_out):]
+
+def send_queue(sock):
+    buf_out = OutputQueue()
+    frame = []
+    for i in xrange(PACKETS):
+        frame.append(struct.pack(FMT_TOPLAYER, 1, 2, i, 1, 120, 100, 0))
+        if len(frame) == 50: # one frame per tick
+            buf_out.append("".join(frame))
+            frame = []
+    while buf_out:
+        buf_out.consume(sock.send(buf_out.peek()))
+
+def outbound(send):
+    sock, peer = socket.socketpair()
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 8192)
+
+    def reader():
+        left = PACKETS * FMT_SIZE_TOPLAYER
+        while left:
+            left -= len(peer.recv(8192))
+    thread = threading.Thread(target=reader)
+    thread.start()
+    send(sock)
+    thread.join()
+
+def measure(run, *args):
+    """Runs run(*args) in a child process, returns (seconds, peak KB)."""
+    rfd, wfd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(rfd)
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        start = time.time()
+        run(*args)
+        elapsed = time.time() - start
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss
+        os.write(wfd, "%f %d" % (elapsed, rss))
+        os._exit(0)
+    os.close(wfd)
+    result = os.read(rfd, 100)
+    os.close(rfd)
+    os.waitpid(pid, 0)
+    elapsed, rss = result.split()
+    return float(elapsed), int(rss)
+
+def main():
+    rows = []
+    for direction, run, variants in (
+        ("in", inbound, (("legacy", receive_legacy),
+                         ("InputBuffer", receive_buffer))),
+        ("out", outbound, (("legacy", send_legacy),
+                           ("OutputQueue", send_queue)))):
+        for name, variant in variants:
+            elapsed, rss = measure(run, variant)
+            rows.append((direction, name, "%.3f" % elapsed,
+                         "%.0f" % (PACKETS / elapsed), rss))
+    table(("direction", "buffer", "seconds", "packets/s", "peak KB"), rows)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,249 @@
+# -*- coding: utf-8 -*-
+
+"""
+Checkpoints of the running games (serve --checkpoint).
+
+Cost: ROOMS rooms of 9 cycles play the games of trails.py (200x60 boards,
+one step every SPEED_NORMAL ms each) in TICK ms ticks of simulated time,
+with a checkpoint of one of the CHECKPOINT_SLICES slices of the rooms every
+CHECKPOINT_INTERVAL / CHECKPOINT_SLICES, as the server's timer does.
+Reported are the time per checkpoint, the same spread over the ticks
+(against the TICK budget) and the bytes written, then the cost of writing
+the whole state at the end of the games (a compaction, or what every
+checkpoint would cost without the incremental writes).
+
+Kill and restart: KILL_ROOMS rooms of two bots play client-driven for PLAY
+seconds, then the server is killed (SIGKILL) and started again with the
+same file. Reported are the time from the restart until the bots have
+their seats back (the bench waits 200 ms for the new server to bind first,
+the bots retry every 100 ms like the client; the ones whose game was over
+before the kill have no seat to resume), the fields of their trails lost
+(sent after the last checkpoint) and the rooms going on afterwards.
+"""
+
+import os
+import signal
+import socket
+import sys
+import tempfile
+import time
+
+from ..common import *
+from ..server import settings
+from ..server.tronserver import TronServer
+from ..server.game import Player
+from ..server.bots import BotConnection
+from . import spawn_server, percentile, table, trails
+from .bots import Bot, run_bots
+
+ROOMS = (10, 100, 200)
+BOARD = (200, 60)
+GAME = 60.0 # seconds of simulated time
+PORT = 9250
+KILL_ROOMS = 10
+PLAY = 3.0 # seconds before the kill
+RETRY = .1 # seconds between the bots' reconnects
+
+class QuietPlayer(Player):
+    """Player of the cost bench, nothing is sent."""
+
+    def queue(self, data):
+        pass
+
+def create_server(filename):
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, "w")
+    try:
+        return TronServer(player_count=trails.PLAYERS, port=0,
+                          checkpoint=filename)
+    finally:
+        sys.stdout = stdout
+
+def start_room(server):
+    """A running room of trails.PLAYERS QuietPlayers."""
+    room = server.find_room()
+    for player_id in xrange(1, trails.PLAYERS + 1):
+        player = QuietPlayer(server, BotConnection(player_id))
+        player.cancel_timers()
+        player.player_id = player_id
+        player.width, player.height = BOARD
+        room.join(player)
+    room.start()
+    server.flush_rooms()
+    return room
+
+def cost(count, steps, seconds=GAME):
+    """
+    Plays count rooms for seconds of simulated time, returns the numbers of
+    their checkpoints.
+    """
+    filename = tempfile.mktemp(".ck")
+    server = create_server(filename)
+    checkpoint = server.checkpoint
+    try:
+        rooms = [start_room(server) for _ in xrange(count)]
+        players = dict((room, dict((player.player_id, player)
+                                   for player in room.players))
+                       for room in rooms)
+        checkpoint.write() # the new rooms, as a whole
+        # Every cycle steps each SPEED_NORMAL ms
+        per_tick = float(trails.PLAYERS) * settings.TICK / settings.SPEED_NORMAL
+        ticks = int(seconds * 1000 / settings.TICK)
+        interval = max(1, int(settings.CHECKPOINT_INTERVAL * 1000 /
+                              settings.CHECKPOINT_SLICES / settings.TICK))
+        times = []
+        written = checkpoint.written
+        position = 0.0
+        for tick in xrange(1, ticks + 1):
+            start, position = int(position), position + per_tick
+            for x, y, player_id in steps[start:int(position)]:
+                for room in rooms:
+                    players[room][player_id].move_to(x, y)
+            server.flush_rooms()
+            if tick % interval == 0:
+                start = time.time()
+                checkpoint.write()
+                times.append(time.time() - start)
+        written = checkpoint.written - written
+        fields = sum(len(room.map.trails(0, 0, room.width, room.height))
+                     for room in rooms)
+        start = time.time()
+        checkpoint.compact(time.time())
+        compaction = time.time() - start
+        return times, written, ticks, fields, compaction
+    finally:
+        checkpoint.close()
+        os.unlink(filename)
+
+class ResumingBot(Bot):
+    """Bot resuming its seat after the server restarted."""
+
+    def __init__(self, *args, **kwargs):
+        Bot.__init__(self, *args, **kwargs)
+        self.ticket = None
+        self.resuming = False
+        self.resumed_at = None
+        self.restored = set() # own fields in the board the server sent
+        self.peer_positions = 0 # of the other bot, after the resume
+
+    def reconnect(self, port):
+        """True if connected again, the seat is asked for then."""
+        try:
+            self.connect('127.0.0.1', port)
+        except socket.error:
+            return False
+        self.buf_in = InputBuffer()
+        self.decoder = Decoder()
+        self.closed = False
+        self.resuming = True
+        self.next_step = None # until the seat is back
+        return True
+
+    def handle_packet(self, packet):
+        player_id, cmd, x, y, speed, nitro, misc = packet
+        if cmd == 0 and self.resuming:
+            if misc >= 2:
+                self.send(1, min(misc, self.version), 0)
+            self.send(7, self.ticket[0], self.ticket[1], self.player_id)
+            return
+        if cmd == 1 and self.resuming:
+            return # the board follows, not a new game
+        if cmd == 2 and self.resuming and player_id == self.player_id:
+            self.restored.add((x, y))
+        elif cmd == 2 and self.resumed_at and player_id != self.player_id:
+            self.peer_positions += 1
+        elif cmd == 16:
+            self.ticket = (x, y)
+        elif cmd == 17:
+            self.resuming = False
+            self.resumed_at = time.time()
+            self.x, self.y = x, y
+            self.next_step = self.resumed_at
+        Bot.handle_packet(self, packet)
+
+def kill_and_restart(filename, rooms=KILL_ROOMS, port=PORT):
+    """
+    Returns the bots, the ones whose game was over before the kill, the
+    ones which resumed, their delays from the restart, the fields each lost
+    and the number of rooms going on.
+    """
+    server = spawn_server(2, port, checkpoint=filename)
+    bots = []
+    try:
+        for _ in xrange(rooms):
+            for player_id in (1, 2):
+                bot = ResumingBot(player_id, port)
+                bots.append(bot)
+                # Rooms are filled in order
+                end = time.time() + 5
+                while not bot.packets_in and time.time() < end:
+                    run_bots(bots, .01)
+        run_bots(bots, settings.SECONDS + 1 + PLAY)
+    finally:
+        os.kill(server, signal.SIGKILL)
+        os.waitpid(server, 0)
+    killed = time.time()
+    run_bots(bots, .1) # they notice
+    restart = time.time()
+    server = spawn_server(2, port, checkpoint=filename)
+    try:
+        # Crashed or won, nothing to resume
+        over = [bot for bot in bots if bot.crashed]
+        waiting = [bot for bot in bots if not bot.crashed]
+        end = restart + settings.RESUME_TIMEOUT
+        while waiting and time.time() < end:
+            for bot in waiting:
+                if bot.closed and not bot.reconnect(port):
+                    continue
+            run_bots([bot for bot in waiting if not bot.closed], RETRY)
+            waiting = [bot for bot in waiting if bot.resumed_at is None]
+        run_bots(bots, 2) # the games go on
+    finally:
+        os.kill(server, signal.SIGINT)
+        os.waitpid(server, 0)
+    resumed = [bot for bot in bots if bot.resumed_at is not None]
+    lost = [len([field for field, at in bot.sent.iteritems()
+                 if at < killed and field not in bot.restored])
+            for bot in resumed]
+    going_on = len([i for i in xrange(0, len(bots), 2)
+                    if bots[i].peer_positions or bots[i + 1].peer_positions])
+    delays = [bot.resumed_at - restart for bot in resumed]
+    return bots, over, resumed, delays, lost, going_on
+
+def main():
+    steps = trails.drive(*BOARD)
+    rows = []
+    for count in ROOMS:
+        times, written, ticks, fields, compaction = cost(count, steps)
+        per_tick = sum(times) / ticks
+        rows.append((count, len(times),
+                     "%.3f" % (percentile(times, 50) * 1000),
+                     "%.3f" % (percentile(times, 99) * 1000),
+                     "%.4f" % (per_tick * 1000),
+                     "%.2f%%" % (per_tick * 100000 / settings.TICK),
+                     written // len(times), fields,
+                     "%.1f" % (compaction * 1000)))
+    table(("rooms", "checkpoints", "p50 (ms)", "p99 (ms)", "ms/tick",
+           "of a %d ms tick" % settings.TICK, "bytes/checkpoint",
+           "fields at the end", "full write (ms)"), rows)
+    print
+
+    settings.SECONDS = 1 # the forked servers inherit it
+    filename = tempfile.mktemp(".ck")
+    try:
+        bots, over, resumed, delays, lost, going_on = \
+            kill_and_restart(filename)
+    finally:
+        if os.path.exists(filename):
+            os.unlink(filename)
+    table(("bots", "game over before", "resumed", "resume p50 (ms)",
+           "resume max (ms)", "fields lost avg", "fields lost max",
+           "rooms going on"),
+          [(len(bots), len(over), len(resumed),
+            "%.0f" % (percentile(delays, 50) * 1000),
+            "%.0f" % (max(delays or [0]) * 1000),
+            "%.1f" % (sum(lost) / float(len(lost) or 1)), max(lost or [0]),
+            "%d/%d" % (going_on, KILL_ROOMS))])
+
+if __name__ == '__main__':
+    main()
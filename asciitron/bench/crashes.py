@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+
+"""
+End of round detection. "scan" filters the players for the alive ones on
+every check (as Room did before it kept the alive set), "incremental" is
+Room.alive, updated on join, crash and leave.
+
+The scenarios crash several players within the same tick (plus one who
+leaves) and compare the outcome of both: the results (cmd 3 = crashed,
+4 = won) and the final state have to be the same (tests/test_crashes.py
+checks them). Then Room.update is timed while a crowded game is running.
+"""
+
+import time
+
+from ..common import *
+from ..server.game import Room
+from . import table
+from .broadcast import create_room
+
+PLAYERS = (2, 9, 50, 200, 250) # player ids are bytes on the map
+UPDATES = 2000
+
+# Players crashing per tick, "leave" disconnects one
+SCENARIOS = (
+    ("3 ticks, 1 survivor", 9, ([1, 2, 3], [4, 5, 6], [7, 8])),
+    ("all in one tick", 9, ([1, 2, 3, 4, 5, 6, 7, 8, 9],)),
+    ("last two together", 9, ([1, 2, 3, 4, 5, 6, 7], [8, 9])),
+    ("leave, then crashes", 5, (["leave", 2], [3, 4])),
+    ("duel, both crash", 2, ([1, 2],)),
+)
+
+class ScanRoom(Room):
+    """Room counting the alive players by a scan every time."""
+
+    def _alive(self):
+        return set(filter(lambda p: not p.crashed, self.players))
+
+    alive = property(_alive, lambda self, value: None)
+
+def start(room):
+    room.width, room.height = 200, len(room.players) + 2
+    room.map = Grid(room.width, room.height)
+    for player_id, player in enumerate(room.players):
+        player.player_id = player_id + 1
+        player.last_activity = time.time() # not idle when the game is over
+        player.move_to(10, player_id + 1)
+    room.game_state = "running"
+    room.frame = []
+    room.changed.clear()
+
+def play(room_class, count, ticks):
+    room = create_room(count, room_class)
+    start(room)
+    players = dict((player.player_id, player) for player in room.players)
+    results = []
+    for crashes in ticks:
+        for player_id in crashes:
+            if player_id == "leave":
+                room.players[0].remove()
+            else:
+                players[player_id].move_to(0, player_id) # into the wall
+        room.update(time.time())
+        results.append(" ".join("%d:%d" % (event[0], event[1])
+                                for event in room.frame
+                                if event[1] in (3, 4)))
+        room.frame = []
+        room.changed.clear()
+    room.server.socket.close()
+    return " | ".join(results), room.game_state
+
+def measure(room_class, count):
+    room = create_room(count, room_class)
+    start(room)
+    now = time.time()
+    begin = time.time()
+    for _ in xrange(UPDATES):
+        room.update(now)
+    elapsed = time.time() - begin
+    room.server.socket.close()
+    return elapsed / UPDATES
+
+def main():
+    rows = []
+    for name, count, ticks in SCENARIOS:
+        scan = play(ScanRoom, count, ticks)
+        incremental = play(Room, count, ticks)
+        rows.append((name, incremental[0], incremental[1],
+                     scan == incremental and "same" or "DIFFERS"))
+    table(("scenario", "results per tick", "state", "vs scan"), rows)
+    print
+
+    rows = []
+    for count in PLAYERS:
+        scan = measure(ScanRoom, count)
+        incremental = measure(Room, count)
+        rows.append((count, "%.2f" % (scan * 1e6),
+                     "%.2f" % (incremental * 1e6),
+                     "%.1fx" % (scan / incremental)))
+    table(("players", "scan us/update", "incremental us/update", "speedup"),
+          rows)
+
+if __name__ == '__main__':
+    main()
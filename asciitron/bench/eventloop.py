@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+
+"""
+Event engine benchmark: loop iterations per second and p99 event-dispatch
+latency of the server loop with 2, 9 and 500 simulated connections.
+
+In every pass one random connection becomes readable (a client sent a
+packet), which is the common case during a game. "legacy" is the old
+TronServer.serve loop rebuilding its select lists on every pass.
+"""
+
+import random
+import select
+import socket
+import struct
+import sys
+import time
+
+from ..server.engine import create_engine, available_engines
+from . import percentile, table
+
+CONNECTIONS = (2, 9, 500)
+DURATION = 2.0 # seconds per run
+
+class Connection(object):
+    def __init__(self):
+        self.socket, self.peer = socket.socketpair()
+        self.buf_out = ""
+        self.latencies = []
+
+    def fileno(self):
+        return self.socket.fileno()
+
+    def handle_read(self):
+        sent_at, = struct.unpack("d", self.socket.recv(8))
+        self.latencies.append(time.time() - sent_at)
+
+    def close(self):
+        self.socket.close()
+        self.peer.close()
+
+class LegacyEngine(object):
+    """Mimics the old loop: lists rebuilt and filtered on every pass."""
+
+    name = "legacy"
+
+    def __init__(self):
+        self.conns = []
+
+    def register(self, obj):
+        self.conns.append(obj)
+
+    def poll(self, timeout):
+        rlist = list(self.conns)
+        wlist = filter(lambda f: len(f.buf_out) > 0, self.conns)
+        xlist = self.conns
+        return select.select(rlist, wlist, xlist, timeout)
+
+    def close(self):
+        pass
+
+def run(engine, count, duration=DURATION):
+    conns = [Connection() for _ in xrange(count)]
+    for conn in conns:
+        engine.register(conn)
+
+    iterations = 0
+    start = time.time()
+    while time.time() - start < duration:
+        random.choice(conns).peer.send(struct.pack("d", time.time()))
+        for conn in engine.poll(.3)[0]:
+            conn.handle_read()
+        iterations += 1
+    elapsed = time.time() - start
+
+    latencies = []
+    for conn in conns:
+        latencies.extend(conn.latencies)
+        conn.close()
+    engine.close()
+
+    return iterations / elapsed, percentile(latencies, 99) * 1e6
+
+def main():
+    rows = []
+    for count in CONNECTIONS:
+        engines = [LegacyEngine] + [lambda n=n: create_engine(n)
+                                    for n in available_engines()]
+        for factory in engines:
+            engine = factory()
+            ips, p99 = run(engine, count)
+            rows.append((count, engine.name, "%.0f" % ips, "%.1f" % p99))
+            sys.stdout.flush()
+    table(("connections", "engine", "iterations/s", "p99 dispatch (us)"), rows)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+
+"""
+Log flood: the server logs to a pipe nobody reads (a stuck terminal), while
+one client floods it with unknown commands (a warning each) and two bots
+play a game next to it. Reports what the bots see:
+
+    print        records written synchronously (LOG_QUEUE = 0), no rate limit
+    queued       background writer, no rate limit (the queue overflows)
+    rate limit   background writer and the default LOG_RATE
+"""
+
+import os
+import signal
+import socket
+import struct
+import sys
+import time
+
+from ..common import *
+from ..server import settings
+from . import percentile, table
+from .bots import Bot, run_bots
+
+PORT = 9194
+DURATION = 3.0
+FLOOD = 100 # unknown commands per 10 ms
+
+def spawn_server(queue_size, rate):
+    """Forks a server logging into a pipe which is never read."""
+    rfd, wfd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(rfd)
+        os.dup2(wfd, sys.stdout.fileno())
+        from ..server import TronServer, logger
+        settings.LOG_RATE = rate
+        logger.configure(queue_size=queue_size)
+        server = TronServer(player_count=2, port=PORT)
+        try:
+            server.serve()
+        finally:
+            os._exit(0)
+    os.close(wfd)
+    time.sleep(.2) # give it some time to bind
+    return pid, rfd
+
+def run(queue_size, rate):
+    pid, rfd = spawn_server(queue_size, rate)
+    try:
+        bots = [Bot(1, PORT), Bot(2, PORT)]
+        bots[0].peers = bots[1].peers = dict((bot.player_id, bot)
+                                              for bot in bots)
+        run_bots(bots, .1)
+        flooder = socket.create_connection(('127.0.0.1', PORT))
+        flooder.setblocking(0)
+        flooder.send(struct.pack(FMT_TOSERVER, 0, 80, 24, 1)) # second room
+        garbage = struct.pack(FMT_TOSERVER, 99, 0, 0, 0) * FLOOD
+
+        end = time.time() + settings.SECONDS + .5 + DURATION
+        measuring = False
+        while time.time() < end:
+            if not measuring and time.time() >= end - DURATION:
+                # Countdown is over
+                measuring = True
+                records = sum(bot.packets_in for bot in bots)
+                for bot in bots:
+                    del bot.fanout[:]
+            try:
+                flooder.send(garbage)
+            except socket.error:
+                pass
+            run_bots(bots, .01)
+        records = sum(bot.packets_in for bot in bots) - records
+        fanout = [t for bot in bots for t in bot.fanout]
+        for bot in bots:
+            bot.close()
+        flooder.close()
+    finally:
+        os.kill(pid, signal.SIGKILL) # a blocked server can't stop itself
+        os.waitpid(pid, 0)
+        os.close(rfd)
+    return records / DURATION, fanout
+
+def main():
+    rows = []
+    for name, queue_size, rate in (("print", 0, sys.maxint),
+                                   ("queued", settings.LOG_QUEUE, sys.maxint),
+                                   ("rate limit", settings.LOG_QUEUE,
+                                    settings.LOG_RATE)):
+        records, fanout = run(queue_size, rate)
+        rows.append((name, "%.0f" % records, len(fanout),
+                     "%.2f" % (percentile(fanout, 50) * 1000),
+                     "%.2f" % (percentile(fanout, 99) * 1000)))
+    table(("log", "records/s to bots", "positions seen", "fan-out p50 (ms)",
+           "fan-out p99 (ms)"), rows)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+
+"""
+Occupancy map: dict of (x, y) tuples + list of coords per player ("dict",
+the old TronServer.map/Player.coords) vs. Grid + array trail ("grid") on a
+500x200 board completely covered by the trails of 9 players.
+
+Reports the memory of the full map (measured in a forked process), the time
+of one step (collision check + occupying the field) and the time to remove
+one player's trail.
+"""
+
+import array
+import os
+import resource
+import time
+
+from ..common import Grid
+from . import table
+
+WIDTH, HEIGHT = 500, 200
+PLAYERS = 9
+
+def owner(x, y):
+    # Every player owns a band of rows
+    return 1 + y * PLAYERS // HEIGHT
+
+def fill_dict():
+    board, coords = {}, dict((p, []) for p in xrange(1, PLAYERS + 1))
+    start = time.time()
+    for y in xrange(HEIGHT):
+        for x in xrange(WIDTH):
+            player_id = owner(x, y)
+            if not board.has_key((x, y)):
+                coords[player_id].append((x, y))
+                board[(x, y)] = player_id
+    elapsed = time.time() - start
+
+    start = time.time()
+    for x, y in coords[1]:
+        del board[(x, y)]
+    coords[1] = []
+    return board, elapsed, time.time() - start
+
+def fill_grid():
+    board = Grid(WIDTH, HEIGHT)
+    trails = dict((p, array.array('i')) for p in xrange(1, PLAYERS + 1))
+    start = time.time()
+    for y in xrange(HEIGHT):
+        for x in xrange(WIDTH):
+            player_id = owner(x, y)
+            if not board.get(x, y): # as in Player.move_to
+                trails[player_id].append(y * board.width + x)
+                board.occupy(x, y, player_id)
+    elapsed = time.time() - start
+
+    start = time.time()
+    board.clear_player(1)
+    trails[1] = array.array('i')
+    return board, elapsed, time.time() - start
+
+def measure(fill):
+    rfd, wfd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(rfd)
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        board, step, clear = fill()
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss
+        os.write(wfd, "%d %f %f" % (rss, step, clear))
+        os._exit(0)
+    os.close(wfd)
+    result = os.read(rfd, 100).split()
+    os.close(rfd)
+    os.waitpid(pid, 0)
+    return int(result[0]), float(result[1]), float(result[2])
+
+def main():
+    rows = []
+    steps = WIDTH * HEIGHT
+    for name, fill in (("dict", fill_dict), ("grid", fill_grid)):
+        rss, step, clear = measure(fill)
+        rows.append((name, rss, "%.3f" % (step / steps * 1e6),
+                     "%.3f" % (clear * 1000)))
+    table(("map", "memory KB", "us/step", "remove trail (ms)"), rows)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+
+"""
+End-to-end load test, also run by the bench subcommand:
+
+    asciitron.py bench --bots 200
+
+Starts a local server, connects the bots (player_count per room) and lets
+them play. Reports
+
+    packets/s in     packets the server received per second
+    records/s out    records the bots received per second (all of them)
+    fan-out p50/p99  time from a bot sending its position to the other bots
+                     of its room receiving it (client-driven mode only)
+    KB per player    server memory (RSS) growth divided by the players
+    CPU ms per tick  server CPU time per game tick (TICK in authoritative
+                     mode, the normal speed otherwise)
+"""
+
+import argparse
+
+from ..server import settings
+from . import spawn_server, stop_server, cpu_time, percentile, table
+from .bots import Bot, run_bots
+
+PORT = 9190
+
+def rss(pid):
+    """Resident memory of process pid in KB (Linux only)."""
+    for line in open("/proc/%d/status" % pid):
+        if line.startswith("VmRSS:"):
+            return int(line.split()[1])
+    return 0
+
+def run(bots=200, player_count=2, duration=5.0, authoritative=False,
+        port=PORT, **kwargs):
+    """Returns the numbers, kwargs go to spawn_server."""
+    bots -= bots % player_count # whole rooms only
+    server = spawn_server(player_count, port, authoritative=authoritative,
+                          **kwargs)
+    try:
+        memory = rss(server)
+        clients = []
+        for i in xrange(bots):
+            # Every player_count connections in a row fill one room
+            clients.append(Bot(i % player_count + 1, port, width=400,
+                               height=200))
+        for i in xrange(0, bots, player_count):
+            room = clients[i:i + player_count]
+            peers = dict((bot.player_id, bot) for bot in room)
+            for bot in room:
+                bot.peers = peers
+        run_bots(clients, settings.SECONDS + .5) # hellos and countdowns
+        memory = rss(server) - memory
+
+        packets_in = sum(bot.packets_out for bot in clients)
+        records_out = sum(bot.packets_in for bot in clients)
+        for bot in clients:
+            del bot.fanout[:]
+        cpu = cpu_time(server)
+        run_bots(clients, duration)
+        cpu = cpu_time(server) - cpu
+        packets_in = sum(bot.packets_out for bot in clients) - packets_in
+        records_out = sum(bot.packets_in for bot in clients) - records_out
+        fanout = [t for bot in clients for t in bot.fanout]
+        alive = len([bot for bot in clients if not bot.crashed])
+
+        for bot in clients:
+            bot.close()
+    finally:
+        stop_server(server)
+
+    tick = (authoritative and settings.TICK or settings.SPEED_NORMAL) / 1000.0
+    return {
+        'bots': bots,
+        'packets_in': packets_in / duration,
+        'records_out': records_out / duration,
+        'fanout_p50': percentile(fanout, 50),
+        'fanout_p99': percentile(fanout, 99),
+        'memory': float(memory) / bots,
+        'cpu_tick': cpu / (duration / tick),
+        'cpu': cpu / duration * 100,
+        'alive': alive,
+    }
+
+def main(args=None):
+    if args is None:
+        parser = argparse.ArgumentParser(description='asciitron load test')
+        parser.add_argument('-p', '--port', dest='port', type=int,
+                            default=PORT, help='server port')
+        add_arguments(parser)
+        args = vars(parser.parse_args())
+    result = run(bots=args['bots'], player_count=args['playercount'],
+                 duration=args['duration'],
+                 authoritative=args['authoritative'],
+                 port=args['port'])
+    table(("bots", "packets/s in", "records/s out", "fan-out p50 (ms)",
+           "fan-out p99 (ms)", "KB per player", "CPU ms per tick",
+           "server CPU %", "alive at end"),
+          [(result['bots'], "%.0f" % result['packets_in'],
+            "%.0f" % result['records_out'],
+            "%.2f" % (result['fanout_p50'] * 1000),
+            "%.2f" % (result['fanout_p99'] * 1000),
+            "%.1f" % result['memory'], "%.3f" % (result['cpu_tick'] * 1000),
+            "%.1f" % result['cpu'],
+            "%d/%d" % (result['alive'], result['bots']))])
+
+def add_arguments(parser):
+    parser.add_argument('--bots', type=int, default=200,
+                        help='bot connections, default: 200')
+    parser.add_argument('--playercount', type=int, default=2,
+                        help='players per game, default: 2')
+    parser.add_argument('--duration', type=float, default=5.0,
+                        help='seconds measured after the countdown')
+    parser.add_argument('--authoritative', action='store_true',
+                        help='run the server in server-authoritative mode')
+
+if __name__ == '__main__':
+    main()
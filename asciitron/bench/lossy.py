@@ -0,0 +1,262 @@
+# -*- coding: utf-8 -*-
+
+"""
+TCP and UDP (serve --udp) under packet loss. A LossProxy between the bots
+and the server delays everything by DELAY ms one way and loses LOSSES of it
+in both directions; ROOMS rooms of two staircase bots play client-driven.
+Reports, for the positions of the other player of the room:
+
+    gap p50/p99/max  time between two updates arriving (a bot steps every
+                     120 ms, anything longer is a stall)
+    stalls           gaps over STALL ms
+    fan-out p50/p99  from the peer sending a position to its receipt
+    missed           positions sent but never received
+
+Lost packets are simulated in user space (tc netem needs privileges): a
+lost UDP datagram is dropped, a lost TCP segment is held back RTO ms, as
+the kernel's retransmission would, and with it everything sent after it on
+that connection (head-of-line blocking). The bots send too little for fast
+retransmit, so the RTO is its minimum on Linux.
+
+The proxy can be used for manual tests, too (TCP and UDP on proxy-port):
+
+    python -m asciitron.bench.lossy --proxy 9231 9230 20 5
+    asciitron.py -u -p 9231 connect localhost 1
+"""
+
+import errno
+import heapq
+import os
+import random
+import select
+import socket
+import sys
+import time
+
+from ..server import settings
+from . import spawn_server, stop_server, percentile, table
+from .bots import Bot, DatagramBot, run_bots
+
+PORT = 9230
+PROXY_PORT = 9231
+DELAY = 20 # ms, one way
+LOSSES = (0, 1, 5) # percent
+RTO = 200 # ms
+ROOMS = 10
+DURATION = 10.0
+STALL = 250 # ms
+
+class LossProxy(object):
+    """Forwards TCP connections and UDP datagrams to target_port."""
+
+    def __init__(self, port, target_port, delay, loss, seed=1):
+        self.listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.listener.bind(('127.0.0.1', port))
+        self.listener.listen(128)
+        self.datagrams = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.datagrams.bind(('127.0.0.1', port))
+        self.target = ('127.0.0.1', target_port)
+        self.delay = delay / 1000.0
+        self.loss = loss / 100.0
+        self.random = random.Random(seed)
+        self.peers = {} # TCP socket -> the other end
+        self.due = {} # TCP socket -> when the last data for it arrives
+        self.upstream = {} # client address -> UDP socket to the server
+        self.clients = {} # UDP socket to the server -> client address
+        self.queue = [] # (due, sequence, destination, address, data)
+        self.sequence = 0
+
+    def push(self, due, destination, address, data):
+        self.sequence += 1
+        heapq.heappush(self.queue, (due, self.sequence, destination, address,
+                                    data))
+
+    def stream(self, sock):
+        try:
+            data = sock.recv(65536)
+        except socket.error:
+            data = ""
+        destination = self.peers[sock]
+        due = time.time() + self.delay
+        if data and self.random.random() < self.loss:
+            due += RTO / 1000.0
+        # In order: nothing overtakes a segment that is held back
+        due = max(due, self.due.get(destination, 0))
+        self.due[destination] = due
+        self.push(due, destination, None, data)
+        if not data:
+            # Closed, forget this end (the close is delayed, too)
+            del self.peers[sock]
+
+    def datagram(self, sock):
+        try:
+            data, address = sock.recvfrom(65536)
+        except socket.error:
+            return
+        if sock is self.datagrams:
+            upstream = self.upstream.get(address)
+            if upstream is None:
+                upstream = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+                upstream.connect(self.target)
+                self.upstream[address] = upstream
+                self.clients[upstream] = address
+            destination, address = upstream, None
+        else:
+            destination, address = self.datagrams, self.clients[sock]
+        if self.random.random() >= self.loss:
+            self.push(time.time() + self.delay, destination, address, data)
+
+    def deliver(self, destination, address, data):
+        try:
+            if address is not None:
+                destination.sendto(data, address)
+            elif destination.type == socket.SOCK_DGRAM:
+                destination.send(data)
+            elif data:
+                destination.sendall(data)
+            else:
+                destination.close()
+                self.peers.pop(destination, None)
+                self.due.pop(destination, None)
+        except socket.error, e:
+            if e.args[0] == errno.ECONNREFUSED:
+                return # ICMP of an earlier datagram
+            if destination.type == socket.SOCK_STREAM:
+                destination.close()
+                self.peers.pop(destination, None)
+
+    def serve(self):
+        while True:
+            timeout = None
+            if self.queue:
+                timeout = max(0, self.queue[0][0] - time.time())
+            r, _, _ = select.select([self.listener, self.datagrams] +
+                                    self.peers.keys() + self.clients.keys(),
+                                    [], [], timeout)
+            for sock in r:
+                if sock is self.listener:
+                    client, address = self.listener.accept()
+                    server = socket.create_connection(self.target)
+                    for end in (client, server):
+                        end.setsockopt(socket.IPPROTO_TCP,
+                                       socket.TCP_NODELAY, 1)
+                    self.peers[client] = server
+                    self.peers[server] = client
+                elif sock in self.peers:
+                    self.stream(sock)
+                elif sock is self.datagrams or sock in self.clients:
+                    self.datagram(sock)
+            now = time.time()
+            while self.queue and self.queue[0][0] <= now:
+                _, _, destination, address, data = heapq.heappop(self.queue)
+                self.deliver(destination, address, data)
+
+def spawn_proxy(port, target_port, delay, loss):
+    pid = os.fork()
+    if pid == 0:
+        try:
+            LossProxy(port, target_port, delay, loss).serve()
+        finally:
+            os._exit(0)
+    time.sleep(.2)
+    return pid
+
+class Watching(object):
+    """Notes when the positions of the other players arrive."""
+
+    def handle_packet(self, packet):
+        super(Watching, self).handle_packet(packet)
+        player_id, cmd, x, y = packet[:4]
+        if cmd == 2 and player_id != self.player_id:
+            self.arrivals.setdefault(player_id, []).append(self.received_at)
+            self.seen.add((player_id, x, y))
+
+class TCPBot(Watching, Bot):
+    pass
+
+class UDPBot(Watching, DatagramBot):
+    pass
+
+def connect(bot_class, player_id, port):
+    """Connects a bot, returns it once the server said hello."""
+    bot = bot_class(player_id, port, width=400, height=200)
+    bot.arrivals = {} # player id -> times its positions arrived
+    bot.seen = set() # (player id, x, y) received
+    end = time.time() + 5
+    while not bot.packets_in and not bot.closed and time.time() < end:
+        # Rooms are filled in order, the next one waits for this one
+        run_bots([bot], .01)
+    return bot
+
+def run(bot_class, port):
+    """Plays ROOMS rooms through the proxy at port, returns the numbers."""
+    bots = []
+    for i in xrange(ROOMS):
+        room = [connect(bot_class, player_id, port)
+                for player_id in (1, 2)]
+        peers = dict((bot.player_id, bot) for bot in room)
+        for bot in room:
+            bot.peers = peers
+        bots.extend(room)
+    run_bots(bots, settings.SECONDS + 2.5) # countdowns, the staggered start
+    start = time.time()
+    for bot in bots:
+        bot.arrivals.clear()
+        del bot.fanout[:]
+    run_bots(bots, DURATION)
+    end = time.time()
+    run_bots(bots, 1) # let the last positions arrive
+    gaps = []
+    for bot in bots:
+        for times in bot.arrivals.itervalues():
+            times = [t for t in times if t <= end]
+            gaps.extend(b - a for a, b in zip(times, times[1:]))
+    missed = sent = 0
+    for bot in bots:
+        for peer in bot.peers.itervalues():
+            if peer is bot:
+                continue
+            for (x, y), at in peer.sent.iteritems():
+                if start <= at <= end:
+                    sent += 1
+                    if (peer.player_id, x, y) not in bot.seen:
+                        missed += 1
+    fanout = [t for bot in bots for t in bot.fanout]
+    for bot in bots:
+        bot.close()
+    run_bots(bots, .2)
+    return gaps, fanout, missed, sent
+
+def main():
+    settings.SECONDS = 1 # the forked server inherits it
+    server = spawn_server(2, PORT, udp=True)
+    rows = []
+    try:
+        for loss in LOSSES:
+            proxy = spawn_proxy(PROXY_PORT, PORT, DELAY, loss)
+            try:
+                for name, bot_class in (("TCP", TCPBot), ("UDP", UDPBot)):
+                    gaps, fanout, missed, sent = run(bot_class, PROXY_PORT)
+                    rows.append(("%d%%" % loss, name, len(gaps),
+                                 "%.0f" % (percentile(gaps, 50) * 1000),
+                                 "%.0f" % (percentile(gaps, 99) * 1000),
+                                 "%.0f" % (max(gaps or [0]) * 1000),
+                                 len([g for g in gaps if g > STALL / 1000.0]),
+                                 "%.1f" % (percentile(fanout, 50) * 1000),
+                                 "%.1f" % (percentile(fanout, 99) * 1000),
+                                 "%d/%d" % (missed, sent)))
+            finally:
+                stop_server(proxy)
+    finally:
+        stop_server(server)
+    table(("loss", "transport", "gaps", "gap p50 (ms)", "gap p99 (ms)",
+           "max (ms)", "stalls > %d ms" % STALL, "fan-out p50 (ms)",
+           "fan-out p99 (ms)", "missed"), rows)
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ["--proxy"]:
+        port, target_port, delay, loss = map(int, sys.argv[2:6])
+        LossProxy(port, target_port, delay, loss).serve()
+    else:
+        main()
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+
+"""
+Cost of the instrumentation: server CPU per tick of the load test (200 bots,
+authoritative mode) without metrics, with metrics collected for the port
+and with the port being scraped every 100 ms.
+"""
+
+import os
+import socket
+import sys
+import time
+
+from . import table
+from . import load
+
+PORT = 9195
+METRICS_PORT = 9199
+
+def scraper(port):
+    """Forks a process fetching the metrics every 100 ms, returns its pid."""
+    pid = os.fork()
+    if pid == 0:
+        try:
+            while True:
+                time.sleep(.1)
+                try:
+                    sock = socket.create_connection(('127.0.0.1', port))
+                    sock.sendall("GET /metrics HTTP/1.0\r\n\r\n")
+                    while sock.recv(65536):
+                        pass
+                    sock.close()
+                except socket.error:
+                    pass
+        finally:
+            os._exit(0)
+    return pid
+
+def main():
+    rows = []
+    for i, (name, kwargs, scrape) in enumerate((
+            ("off", {}, False),
+            ("on", {'metrics_port': METRICS_PORT}, False),
+            ("on, scraped", {'metrics_port': METRICS_PORT + 1}, True))):
+        scraping = scrape and scraper(kwargs['metrics_port'])
+        try:
+            result = load.run(bots=200, authoritative=True, port=PORT + i,
+                              **kwargs)
+        finally:
+            if scraping:
+                os.kill(scraping, 9)
+                os.waitpid(scraping, 0)
+        rows.append((name, "%.3f" % (result['cpu_tick'] * 1000),
+                     "%.1f" % result['cpu']))
+        sys.stdout.flush()
+    table(("metrics", "CPU ms per tick", "server CPU %"), rows)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+
+"""
+Crash prediction under network latency. A DelayProxy between the client and
+the server delays every chunk by a fixed time in both directions; a
+headless client (player_count = 1, small board) runs its staircase into the
+wall. Reports the time from the crashing step to the crash being shown,
+with the local prediction and without it (waiting for cmd 3).
+
+The proxy can be used for manual tests, too:
+
+    python -m asciitron.bench.prediction --proxy 9158 9159 60
+    asciitron.py -p 9159 connect localhost 1
+"""
+
+import heapq
+import os
+import select
+import socket
+import sys
+import time
+
+from ..server import settings
+from ..client import HeadlessClient
+from . import spawn_server, stop_server, percentile, table
+
+PORT = 9195
+PROXY_PORT = 9196
+DELAYS = (0, 30, 60, 150) # ms, one way
+RUNS = 4
+
+class DelayProxy(object):
+    """Forwards TCP connections to target_port, delaying the data."""
+
+    def __init__(self, port, target_port, delay):
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.socket.bind(('127.0.0.1', port))
+        self.socket.listen(5)
+        self.target_port = target_port
+        self.delay = delay / 1000.0
+        self.peers = {} # socket -> the other end
+        self.queue = [] # (due, sequence, destination, data)
+        self.sequence = 0
+
+    def serve(self):
+        while True:
+            timeout = None
+            if self.queue:
+                timeout = max(0, self.queue[0][0] - time.time())
+            r, _, _ = select.select([self.socket] + self.peers.keys(), [], [],
+                                    timeout)
+            for sock in r:
+                if sock is self.socket:
+                    client, address = self.socket.accept()
+                    server = socket.create_connection(('127.0.0.1',
+                                                       self.target_port))
+                    self.peers[client] = server
+                    self.peers[server] = client
+                    continue
+                if sock not in self.peers:
+                    continue
+                try:
+                    data = sock.recv(65536)
+                except socket.error:
+                    data = ""
+                self.sequence += 1
+                heapq.heappush(self.queue, (time.time() + self.delay,
+                                            self.sequence, self.peers[sock],
+                                            data))
+                if not data:
+                    # Closed, forget this end (the close is delayed, too)
+                    del self.peers[sock]
+            now = time.time()
+            while self.queue and self.queue[0][0] <= now:
+                due, sequence, destination, data = heapq.heappop(self.queue)
+                try:
+                    if data:
+                        destination.sendall(data)
+                    else:
+                        destination.close()
+                        self.peers.pop(destination, None)
+                except socket.error:
+                    pass
+
+def spawn_proxy(port, target_port, delay):
+    pid = os.fork()
+    if pid == 0:
+        try:
+            DelayProxy(port, target_port, delay).serve()
+        finally:
+            os._exit(0)
+    time.sleep(.2)
+    return pid
+
+class CrashClient(HeadlessClient):
+    """Leaves as soon as the server confirmed its crash."""
+
+    def check_crash(self, player_id):
+        HeadlessClient.check_crash(self, player_id)
+        if player_id == self.player_id:
+            self.network.disconnect()
+
+def crash(predict):
+    """Plays one round, returns the client."""
+    client = CrashClient('127.0.0.1', 1, PROXY_PORT, width=30, height=12,
+                         predict=predict)
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, "w")
+    try:
+        client.run()
+    except SystemExit:
+        pass
+    finally:
+        sys.stdout = stdout
+        client.network.disconnect()
+    return client
+
+def main():
+    settings.SECONDS = 1 # the forked server inherits it
+    server = spawn_server(1, PORT)
+    rows = []
+    try:
+        for delay in DELAYS:
+            proxy = spawn_proxy(PROXY_PORT, PORT, delay)
+            try:
+                for predict in (False, True):
+                    shown = []
+                    counts = [0, 0, 0, 0]
+                    for _ in xrange(RUNS):
+                        client = crash(predict)
+                        shown.extend(client.probe.samples.get("crash->shown",
+                                                              []))
+                        prediction = client.prediction
+                        for i, value in enumerate((prediction.predicted,
+                                                   prediction.confirmed,
+                                                   prediction.rolled_back,
+                                                   prediction.missed)):
+                            counts[i] += value
+                    rows.append((delay, predict and "predicted" or "server",
+                                 len(shown),
+                                 "%.1f" % (percentile(shown, 50) * 1000),
+                                 "%.1f" % (max(shown or [0]) * 1000))
+                                + tuple(counts))
+            finally:
+                stop_server(proxy)
+    finally:
+        stop_server(server)
+    table(("one-way ms", "crash", "crashes", "shown after p50 (ms)",
+           "max (ms)", "predicted", "confirmed", "rolled back", "missed"),
+          rows)
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ["--proxy"]:
+        port, target_port, delay = map(int, sys.argv[2:5])
+        DelayProxy(port, target_port, delay).serve()
+    else:
+        main()
@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+
+"""
+Bytes on the wire (server -> clients) per game-second with 9 players
+speaking protocol v1 or v2.
+"""
+
+import sys
+
+from ..server import settings
+from . import spawn_server, stop_server, table
+from .bots import connect_bots, run_bots
+
+PLAYERS = 9
+DURATION = 5.0 # seconds measured after the countdown
+PORT = 9175
+
+def run(version, port=PORT):
+    server = spawn_server(PLAYERS, port)
+    try:
+        bots = connect_bots(PLAYERS, port, width=400, height=200,
+                            version=version)
+        run_bots(bots, settings.SECONDS + .5) # countdown
+
+        received = sum(bot.bytes_in for bot in bots)
+        positions = sum(bot.positions for bot in bots)
+        run_bots(bots, DURATION)
+        received = sum(bot.bytes_in for bot in bots) - received
+        positions = sum(bot.positions for bot in bots) - positions
+
+        for bot in bots:
+            bot.close()
+    finally:
+        stop_server(server)
+    return received / DURATION, float(received) / max(positions, 1)
+
+def main():
+    rows = []
+    for version in (1, 2):
+        per_second, per_position = run(version, PORT + version)
+        rows.append(("v%d" % version, "%.0f" % per_second,
+                     "%.0f" % (per_second / PLAYERS), "%.2f" % per_position))
+        sys.stdout.flush()
+    table(("protocol", "bytes/s (all)", "bytes/s per client",
+           "bytes per position"), rows)
+
+if __name__ == '__main__':
+    main()
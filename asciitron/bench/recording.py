@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+
+"""
+Game recording: the load test with and without serve --record (fan-out
+latency and CPU of the serve loop), the size of the recordings, and how
+fast they replay to a headless client, from the start and seeking to the
+last snapshot.
+"""
+
+import glob
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from ..common.recording import Recording
+from ..client import HeadlessClient, Replay
+from . import table
+from .load import run
+
+BOTS = 200
+DURATION = 10.0 # long enough for a snapshot (RECORD_SNAPSHOT)
+
+def replay(filename, start=0):
+    """Returns (seconds, frames) of a replay as fast as possible."""
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, "w")
+    try:
+        begin = time.time()
+        recording = Recording(filename)
+        client = HeadlessClient(None, 0, 0, width=400, height=200)
+        player = Replay(client, recording, speed=0, start=start)
+        player.run()
+        return time.time() - begin, player.records
+    finally:
+        sys.stdout = stdout
+
+def main():
+    directory = tempfile.mkdtemp()
+    try:
+        rows = []
+        for name, record in (("off", None), ("on", directory)):
+            result = run(bots=BOTS, duration=DURATION, record=record)
+            rows.append((name, "%.2f" % (result['fanout_p50'] * 1000),
+                         "%.2f" % (result['fanout_p99'] * 1000),
+                         "%.3f" % (result['cpu_tick'] * 1000),
+                         "%.1f" % result['cpu']))
+        table(("recording", "fan-out p50 (ms)", "fan-out p99 (ms)",
+               "CPU ms per tick", "server CPU %"), rows)
+        print
+
+        files = glob.glob(os.path.join(directory, "*.tron"))
+        size = sum(os.path.getsize(filename) for filename in files)
+        longest = max(files, key=os.path.getsize)
+        recording = Recording(longest)
+        duration = recording.duration() / 1000.0
+        last = recording.snapshots[-1][0] / 1000.0
+        full, frames = replay(longest)
+        seek, seek_frames = replay(longest, last)
+        table(("games", "bytes per player and second", "game seconds",
+               "snapshots", "replay (ms)", "frames", "x real time",
+               "seek to %.0f s (ms)" % last),
+              [(len(files), "%.0f" % (float(size) / BOTS / duration),
+                "%.1f" % duration, len(recording.snapshots),
+                "%.1f" % (full * 1000), frames, "%.0f" % (duration / full),
+                "%.1f" % (seek * 1000))])
+    finally:
+        shutil.rmtree(directory)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+
+"""
+Terminal output of the client with 9 players: a refresh per drawn character
+plus a refreshed status line every tick ("legacy", the old Gamepad) vs. the
+frame based Renderer. Runs headless on a pseudo terminal and counts the
+bytes curses writes to it and the terminal updates (a write each) per tick.
+Halfway through, player 1 crashes and its whole trail is removed.
+"""
+
+import os
+import pty
+import sys
+import time
+import fcntl
+import struct
+import termios
+
+from . import table
+
+PLAYERS = 9
+TICKS = 300
+WIDTH, HEIGHT = 160, 50
+
+def legacy(stdscr, positions):
+    updates = 0
+    for tick, moves in enumerate(positions):
+        for x, y, char in moves:
+            stdscr.addch(y, x, ord(char))
+            stdscr.refresh()
+            updates += 1
+        stdscr.addstr(HEIGHT - 1, 5, "Speed: %4d  Nitro tank: %3d%%" %
+                      (833, tick % 100))
+        stdscr.refresh()
+        updates += 1
+    return updates
+
+def frames(stdscr, positions):
+    from ..client.renderer import Renderer
+    renderer = Renderer(stdscr)
+    for tick, moves in enumerate(positions):
+        for x, y, char in moves:
+            renderer.put(x, y, char)
+        renderer.text(HEIGHT - 1, 5, "Speed: %4d  Nitro tank: %3d%%" %
+                      (833, tick % 100))
+        # Frames are capped in time, pretend a tick has passed
+        renderer.next_frame = 0
+        renderer.flush()
+    return renderer.frames
+
+def moves():
+    """Every player runs along its own row, one field per tick."""
+    positions = [[(1 + tick % (WIDTH - 2), 2 + p * 5, str(p + 1))
+                  for p in xrange(PLAYERS)] for tick in xrange(TICKS)]
+    crash = TICKS // 2
+    for tick in xrange(crash):
+        positions[crash].append((1 + tick % (WIDTH - 2), 2, ' '))
+    return positions
+
+def measure(draw):
+    """Runs draw on a fresh pty, returns (bytes, updates, seconds)."""
+    pid, fd = pty.fork()
+    if pid == 0:
+        import curses
+        os.environ['TERM'] = 'xterm'
+        fcntl.ioctl(sys.stdout.fileno(), termios.TIOCSWINSZ,
+                    struct.pack("HHHH", HEIGHT, WIDTH, 0, 0))
+        stdscr = curses.initscr()
+        positions = moves()
+        start = time.time()
+        updates = draw(stdscr, positions)
+        elapsed = time.time() - start
+        curses.endwin()
+        os.write(sys.stdout.fileno(), "\nRESULT %d %f\n" % (updates, elapsed))
+        os._exit(0)
+
+    output = []
+    while True:
+        try:
+            data = os.read(fd, 65536)
+        except OSError:
+            break
+        if not data:
+            break
+        output.append(data)
+    os.waitpid(pid, 0)
+    output = "".join(output)
+    drawn, _, result = output.rpartition("\nRESULT ")
+    updates, elapsed = result.split()[:2]
+    return len(drawn), int(updates), float(elapsed)
+
+def main():
+    rows = []
+    for name, draw in (("legacy", legacy), ("renderer", frames)):
+        written, updates, elapsed = measure(draw)
+        rows.append((name, written, "%.0f" % (float(written) / TICKS),
+                     "%.1f" % (float(updates) / TICKS),
+                     "%.3f" % (elapsed / TICKS * 1000)))
+    table(("drawing", "bytes to tty", "bytes per tick", "updates per tick",
+           "ms per tick"), rows)
+
+if __name__ == '__main__':
+    main()
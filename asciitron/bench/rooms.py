@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+
+"""
+Many concurrent 2-player games in one server process (authoritative mode):
+step lateness (how long after its due time a room's next step actually
+ran) and server CPU usage with 10 and 200 rooms.
+"""
+
+import os
+import signal
+import sys
+import time
+
+from ..server import settings
+from ..server.tronserver import TronServer
+from ..server.game import Room
+from . import percentile, cpu_time, table
+from .bots import Bot, run_bots
+
+DURATION = 5.0 # seconds measured after the countdown
+PORT = 9180
+
+class TimedRoom(Room):
+    lateness = []
+
+    def tick(self, now):
+        # Ticks without movement are caught up later, the first step counts
+        due = self.next_tick is not None and self.next_step_at()
+        if due and now >= due:
+            TimedRoom.lateness.append(now - due)
+        return Room.tick(self, now)
+
+class TimedServer(TronServer):
+    room_class = TimedRoom
+
+def spawn(port):
+    """Forks a TimedServer, returns (pid, pipe to read the results from)."""
+    rfd, wfd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(rfd)
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, sys.stdout.fileno())
+        server = TimedServer(player_count=2, port=port, authoritative=True)
+
+        def reset(signum, frame):
+            del TimedRoom.lateness[:]
+        signal.signal(signal.SIGUSR1, reset)
+        try:
+            server.serve()
+        except KeyboardInterrupt:
+            lateness = TimedRoom.lateness
+            os.write(wfd, "%f %f %f %d" % (percentile(lateness, 50),
+                                           percentile(lateness, 99),
+                                           max(lateness or [0]),
+                                           len(lateness)))
+        finally:
+            os._exit(0)
+    os.close(wfd)
+    time.sleep(.2) # give it some time to bind
+    return pid, rfd
+
+def run(rooms, port=PORT):
+    server, rfd = spawn(port)
+    try:
+        bots = []
+        for i in xrange(rooms * 2):
+            # Ids 1 and 2 take turns, every pair fills one room
+            bots.append(Bot(i % 2 + 1, port, width=400, height=200))
+        run_bots(bots, settings.SECONDS + .5) # hellos and countdowns
+
+        os.kill(server, signal.SIGUSR1)
+        cpu = cpu_time(server)
+        run_bots(bots, DURATION)
+        cpu = cpu_time(server) - cpu
+        alive = len([bot for bot in bots if not bot.crashed])
+
+        for bot in bots:
+            bot.close()
+    finally:
+        os.kill(server, signal.SIGINT)
+        result = os.read(rfd, 100).split()
+        os.close(rfd)
+        os.waitpid(server, 0)
+    p50, p99, worst, ticks = result
+    return (float(p50), float(p99), float(worst), int(ticks),
+            cpu / DURATION * 100, alive)
+
+def main():
+    rows = []
+    for i, rooms in enumerate((10, 200)):
+        p50, p99, worst, ticks, cpu, alive = run(rooms, PORT + i)
+        rows.append((rooms, "%.2f" % (p50 * 1000), "%.2f" % (p99 * 1000),
+                     "%.2f" % (worst * 1000), ticks, "%.1f" % cpu,
+                     "%d/%d" % (alive, rooms * 2)))
+        sys.stdout.flush()
+    table(("rooms", "late p50 (ms)", "late p99 (ms)", "late max (ms)",
+           "updates", "server CPU %", "alive at end"), rows)
+
+if __name__ == '__main__':
+    main()
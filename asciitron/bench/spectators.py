@@ -0,0 +1,288 @@
+# -*- coding: utf-8 -*-
+
+"""
+Spectators (cmd 6).
+
+In-process: a running room of 9 players which all move every tick, watched
+by 0, 100 or 500 connections (socketpairs, a tenth of them never read).
+"as players" queues every frame to the watchers like to players (how they
+would have to be served without spectators), "spectators" is Spectator and
+Room.flush_spectators, one chunk every SPECTATOR_TICKS ticks. Reported are
+the loop time per tick spent on the players and on the watchers, what the
+stalled watchers cost, and whether the others ended up with the board of
+the server (a sample of them is decoded).
+
+End to end: a local server with one match of 2 bots, 500 watchers joining
+while it runs: fan-out to the bots, server CPU and how long positions take
+to the watchers.
+"""
+
+import os
+import select
+import socket
+import sys
+import time
+
+from ..common import *
+from ..server import settings
+from ..server.tronserver import SocketConnection
+from ..server.game import Player
+from . import spawn_server, stop_server, cpu_time, percentile, table
+from .bots import Bot, run_bots
+from .broadcast import create_room
+from .backpressure import drain
+
+PLAYERS = 9
+WATCHERS = (0, 100, 500)
+TICKS = 3000
+SPECTATOR_TICKS = 5 # SPECTATOR_INTERVAL in ticks
+STALLED_EVERY = 10 # every 10th watcher never reads
+SAMPLE = 10 # watchers decoded to check their board
+HIGH_WATER = 16 * 1024 # smaller than the default, to get stalls in TICKS
+STALL = .2
+DURATION = 5.0
+PORT = 9210
+
+def start(room):
+    room.width, room.height = 400, 200
+    room.map = Grid(room.width, room.height)
+    room.game_state = "running"
+    for player_id, player in enumerate(room.players):
+        player.player_id = player_id + 1
+        player.version = 2
+
+def connect(server):
+    """A v2 Player on a socketpair, with small buffers."""
+    conn, peer = socket.socketpair()
+    conn.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 4096)
+    peer.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+    peer.setblocking(0)
+    connection = SocketConnection(server, conn, ("bench", 0))
+    server.engine.register(connection)
+    player = Player(server, connection)
+    player.version = 2
+    return player, peer
+
+def receive(peer, buf, decoder, positions):
+    """Reads and decodes what a sampled watcher got."""
+    try:
+        while buf.recv_from(peer) > 0:
+            pass
+    except socket.error:
+        pass
+    for packet in decoder.decode(buf):
+        if packet[1] == 2:
+            positions[packet[0]] = (packet[2], packet[3])
+
+def play(watchers, spectators):
+    """Returns the numbers of one run, see main()."""
+    room = create_room(PLAYERS)
+    start(room)
+    players = room.players[:]
+    server = room.server
+    conns = [] # (connection, peer, stalled)
+    for i in xrange(watchers):
+        player, peer = connect(server)
+        if spectators:
+            server.watch(player, room.number)
+            conn = room.spectators[-1]
+        else:
+            player.hello_timer.cancel()
+            room.join(player)
+            conn = player
+        conns.append((conn, peer, i % STALLED_EVERY == STALLED_EVERY - 1))
+    sample = [(peer, InputBuffer(), Decoder(), {})
+              for conn, peer, stalled in conns if not stalled][:SAMPLE]
+    for peer, buf, decoder, positions in sample:
+        decoder.version = 2
+    for player in players:
+        player.peer.setblocking(0)
+
+    player_time = watcher_time = 0
+    for tick in xrange(TICKS):
+        begin = time.time()
+        for player in players:
+            room.broadcast(player.player_id, 2, tick % 396 + 2,
+                           player.player_id * 20)
+        room.flush() # "as players": queues to the watchers, too
+        for player in players:
+            if player.buf_out:
+                player.connection.handle_write()
+        now = time.time()
+        player_time += now - begin
+
+        if spectators and tick % SPECTATOR_TICKS == 0:
+            room.flush_spectators()
+        for conn, peer, stalled in conns:
+            # Only the writable ones are called by the serve loop
+            if conn.buf_out:
+                conn.connection.handle_write()
+        server.timers.run(time.time())
+        watcher_time += time.time() - now
+
+        for player in players:
+            drain(player.peer)
+        for watcher in sample:
+            receive(*watcher)
+        for conn, peer, stalled in conns[SAMPLE:]:
+            if not stalled:
+                drain(peer)
+
+    if spectators:
+        room.flush_spectators()
+        for conn, peer, stalled in conns:
+            conn.connection.handle_write()
+        for watcher in sample:
+            receive(*watcher)
+    board = room.encoder.positions
+    in_sync = len([1 for peer, buf, decoder, positions in sample
+                   if positions == board])
+    dropped = len([1 for conn, peer, stalled in conns
+                   if not server.engine.is_registered(conn.connection)])
+    server.socket.close()
+    return (player_time / TICKS, watcher_time / TICKS, server.skipped_bytes,
+            dropped, in_sync, len(sample))
+
+def measure(watchers, spectators):
+    """Runs play() in a forked process with the bench settings."""
+    rfd, wfd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(rfd)
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, sys.stdout.fileno())
+        settings.SPECTATOR_HIGH_WATER = HIGH_WATER
+        settings.SPECTATOR_STALL = STALL
+        try:
+            os.write(wfd, " ".join(map(str, play(watchers, spectators))))
+        finally:
+            os._exit(0)
+    os.close(wfd)
+    result = os.read(rfd, 1000).split()
+    os.close(rfd)
+    os.waitpid(pid, 0)
+    return map(float, result[:2]) + map(int, result[2:])
+
+class Watcher(Bot):
+    """Bot which only watches (cmd 6)."""
+
+    def __init__(self, port):
+        Bot.__init__(self, 0, port)
+        self.last = {} # player id -> last position
+
+    def handle_packet(self, packet):
+        if packet[1] == 0:
+            self.send(1, PROTOCOL_VERSION, 0)
+            self.send(6, 0, 0)
+            return
+        Bot.handle_packet(self, packet)
+        if packet[1] == 2:
+            self.last[packet[0]] = packet[2:4]
+
+    def timeout(self, now):
+        return None
+
+    def act(self, now):
+        pass
+
+def run_clients(bots, watchers, duration):
+    """run_bots with lots of watchers, they are polled by epoll."""
+    poll = select.epoll()
+    clients = {}
+    for client in bots + watchers:
+        if not client.closed:
+            clients[client.fileno()] = client
+            poll.register(client.fileno(), select.EPOLLIN)
+    end = time.time() + duration
+    try:
+        while True:
+            now = time.time()
+            if now >= end:
+                break
+            timeout = end - now
+            for bot in bots:
+                t = bot.timeout(now)
+                if t is not None and t < timeout:
+                    timeout = t
+            for fd, event in poll.poll(timeout):
+                client = clients.get(fd)
+                if client is not None:
+                    client.handle_read()
+                    if client.closed:
+                        del clients[fd]
+            now = time.time()
+            for bot in bots:
+                bot.act(now)
+    finally:
+        poll.close()
+
+def end_to_end(watchers, port):
+    server = spawn_server(2, port)
+    try:
+        bots = [Bot(1, port, width=400, height=200),
+                Bot(2, port, width=400, height=200)]
+        peers = dict((bot.player_id, bot) for bot in bots)
+        for bot in bots:
+            bot.peers = peers
+        run_bots(bots, settings.SECONDS + .5)
+
+        watching = []
+        for i in xrange(watchers):
+            watcher = Watcher(port)
+            watcher.peers = peers
+            watching.append(watcher)
+            if i % 50 == 49:
+                run_clients(bots, watching, .01)
+        run_clients(bots, watching, .5) # snapshots
+        for client in bots + watching:
+            del client.fanout[:]
+        cpu = cpu_time(server)
+        run_clients(bots, watching, DURATION)
+        cpu = cpu_time(server) - cpu
+
+        # Last positions, the bots don't move anymore
+        board = dict((bot.player_id, (bot.x, bot.y)) for bot in bots)
+        run_clients([], watching, .5)
+        in_sync = len([1 for watcher in watching if watcher.last == board])
+        fanout = [t for bot in bots for t in bot.fanout]
+        delay = [t for watcher in watching for t in watcher.fanout]
+        for client in bots + watching:
+            client.close()
+    finally:
+        stop_server(server)
+    return (percentile(fanout, 50), percentile(fanout, 99), cpu / DURATION,
+            percentile(delay, 50), percentile(delay, 99), in_sync)
+
+def main():
+    rows = []
+    for watchers in WATCHERS:
+        for name, spectators in (("as players", False),
+                                 ("spectators", True)):
+            if not watchers and spectators:
+                continue
+            (player_time, watcher_time, skipped, dropped, in_sync,
+             sampled) = measure(watchers, spectators)
+            rows.append((watchers, watchers and name or "-",
+                         "%.3f" % (player_time * 1000),
+                         "%.3f" % (watcher_time * 1000),
+                         skipped // 1024, dropped,
+                         sampled and "%d/%d" % (in_sync, sampled) or "-"))
+    table(("watchers", "served", "players ms/tick", "watchers ms/tick",
+           "skipped KB", "dropped", "boards in sync"), rows)
+    print
+
+    rows = []
+    for i, watchers in enumerate((0, 500)):
+        p50, p99, cpu, delay50, delay99, in_sync = end_to_end(watchers,
+                                                              PORT + i)
+        rows.append((watchers, "%.2f" % (p50 * 1000), "%.2f" % (p99 * 1000),
+                     "%.1f" % (cpu * 100),
+                     watchers and "%.1f" % (delay50 * 1000) or "-",
+                     watchers and "%.1f" % (delay99 * 1000) or "-",
+                     watchers and "%d/%d" % (in_sync, watchers) or "-"))
+    table(("spectators", "fan-out p50 (ms)", "fan-out p99 (ms)",
+           "server CPU %", "to spectators p50 (ms)",
+           "to spectators p99 (ms)", "boards in sync"), rows)
+
+if __name__ == '__main__':
+    main()
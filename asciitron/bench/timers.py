@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+
+"""
+Timer accuracy: the server schedules a probe timer every PROBE_EVERY
+seconds (due 0-50 ms later) next to its heartbeats, timeouts and room
+updates, and records how late each probe fires. Measured with an idle
+server and with bots playing (client-driven and authoritative mode).
+"""
+
+import os
+import random
+import signal
+import sys
+import time
+
+from ..server import settings
+from ..server.tronserver import TronServer
+from . import percentile, cpu_time, table
+from .bots import Bot, run_bots
+
+DURATION = 5.0 # seconds measured after the countdown
+PORT = 9200
+PROBE_EVERY = .01
+
+class ProbedServer(TronServer):
+    def __init__(self, *args, **kwargs):
+        TronServer.__init__(self, *args, **kwargs)
+        self.lateness = []
+        self.schedule()
+
+    def schedule(self):
+        now = time.time()
+        self.timers.call_at(now + PROBE_EVERY, self.schedule)
+        due = now + random.uniform(0, .05)
+        self.timers.call_at(due, self.probe, due)
+
+    def probe(self, due):
+        self.lateness.append(time.time() - due)
+
+def spawn(port, authoritative):
+    """Forks a ProbedServer, returns (pid, pipe to read the results from)."""
+    rfd, wfd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(rfd)
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, sys.stdout.fileno())
+        server = ProbedServer(player_count=2, port=port,
+                              authoritative=authoritative)
+
+        def reset(signum, frame):
+            del server.lateness[:]
+        signal.signal(signal.SIGUSR1, reset)
+        try:
+            server.serve()
+        except KeyboardInterrupt:
+            lateness = server.lateness
+            os.write(wfd, "%f %f %f %d" % (percentile(lateness, 50),
+                                           percentile(lateness, 99),
+                                           max(lateness or [0]),
+                                           len(lateness)))
+        finally:
+            os._exit(0)
+    os.close(wfd)
+    time.sleep(.2) # give it some time to bind
+    return pid, rfd
+
+def run(bots, authoritative, port, duration=DURATION):
+    server, rfd = spawn(port, authoritative)
+    try:
+        clients = []
+        for i in xrange(bots):
+            clients.append(Bot(i % 2 + 1, port, width=400, height=200))
+        if clients:
+            run_bots(clients, settings.SECONDS + .5) # hellos and countdowns
+
+        os.kill(server, signal.SIGUSR1)
+        cpu = cpu_time(server)
+        if clients:
+            run_bots(clients, duration)
+        else:
+            time.sleep(duration)
+        cpu = cpu_time(server) - cpu
+
+        for bot in clients:
+            bot.close()
+    finally:
+        os.kill(server, signal.SIGINT)
+        result = os.read(rfd, 100).split()
+        os.close(rfd)
+        os.waitpid(server, 0)
+    p50, p99, worst, count = result
+    return float(p50), float(p99), float(worst), int(count), cpu / duration
+
+def main():
+    rows = []
+    for i, (bots, authoritative) in enumerate(((0, False), (200, False),
+                                               (200, True))):
+        p50, p99, worst, count, cpu = run(bots, authoritative, PORT + i)
+        rows.append((bots, authoritative and "authoritative" or "client",
+                     count, "%.2f" % (p50 * 1000), "%.2f" % (p99 * 1000),
+                     "%.2f" % (worst * 1000), "%.1f" % (cpu * 100)))
+    table(("bots", "mode", "timers", "late p50 (ms)", "late p99 (ms)",
+           "late max (ms)", "server CPU %"), rows)
+
+if __name__ == '__main__':
+    main()
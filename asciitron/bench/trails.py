@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+
+"""
+Trail storage in long games on large boards: Grid plus an array of the
+fields of every trail (as Player.trail was), Grid alone and Segments (runs,
+settings.TRAILS = "segments").
+
+9 cycles drive until they are boxed in or have travelled LENGTH fields,
+turning on average every TURN fields (and in front of obstacles) to the
+side with more room. The steps are played into every map
+(collision check + occupying the field, as in Player.move_to), then
+QUERIES random fields are looked up and one trail removed. Memory is what
+the map holds (sys.getsizeof of its parts).
+"""
+
+import array
+import random
+import sys
+import time
+
+from ..common import *
+from . import table
+
+BOARDS = ((200, 60), (1000, 1000), (2000, 2000))
+PLAYERS = 9
+LENGTH = 20000 # fields per cycle at most
+TURN = 60
+QUERIES = 100000
+
+DELTA = ((1, 0), (0, 1), (-1, 0), (0, -1))
+SIGHT = 400 # fields a cycle looks ahead
+
+def room(board, x, y, direction):
+    """Free fields in front of x, y, up to SIGHT."""
+    dx, dy = DELTA[direction]
+    for n in xrange(SIGHT):
+        x, y = x + dx, y + dy
+        if not (0 < x < board.width - 1 and 0 < y < board.height - 1) or \
+            board.get(x, y):
+            return n
+    return SIGHT
+
+def drive(width, height, seed=1):
+    """Returns the steps (x, y, player id) of one game."""
+    rnd = random.Random(seed)
+    board = Grid(width, height)
+    cycles = []
+    for player_id in xrange(1, PLAYERS + 1):
+        x = width * player_id // (PLAYERS + 1)
+        cycles.append([player_id, x, height // 2, player_id % 4, 0])
+    steps = []
+    while cycles:
+        for cycle in cycles[:]:
+            player_id, x, y, direction, length = cycle
+            sides = [(direction + 1) % 4, (direction - 1) % 4]
+            if rnd.random() < 1.0 / TURN or not room(board, x, y, direction):
+                direction = max(sides, key=lambda side: room(board, x, y,
+                                                              side))
+            if not room(board, x, y, direction):
+                cycles.remove(cycle) # boxed in
+                continue
+            dx, dy = DELTA[direction]
+            x, y = x + dx, y + dy
+            board.occupy(x, y, player_id)
+            steps.append((x, y, player_id))
+            cycle[1:] = [x, y, direction, length + 1]
+            if length + 1 >= LENGTH:
+                cycles.remove(cycle)
+    return steps
+
+def footprint(board):
+    if isinstance(board, Grid):
+        return sys.getsizeof(board.cells)
+    size = sum(sys.getsizeof(d) for d in (board.rows, board.columns,
+                                          board.heads))
+    for line in board.rows.values() + board.columns.values():
+        size += sys.getsizeof(line) + sys.getsizeof(line.starts) + \
+            sys.getsizeof(line.ends) + sys.getsizeof(line.owners)
+    return size
+
+def play(name, width, height, steps, queries):
+    """Returns (bytes, s per step, s per query, s to remove a trail)."""
+    if name == "segments":
+        board = Segments(width, height)
+    else:
+        board = Grid(width, height)
+    trails = dict((player_id, array.array('i'))
+                  for player_id in xrange(1, PLAYERS + 1))
+    keep_trail = name == "grid + trail"
+    get, occupy = board.get, board.occupy
+    start = time.time()
+    for x, y, player_id in steps:
+        if not get(x, y):
+            if keep_trail:
+                trails[player_id].append(y * width + x)
+            occupy(x, y, player_id)
+    step = (time.time() - start) / len(steps)
+    size = footprint(board)
+    if keep_trail:
+        size += sum(sys.getsizeof(trail) for trail in trails.itervalues())
+
+    start = time.time()
+    for x, y in queries:
+        get(x, y)
+    query = (time.time() - start) / len(queries)
+
+    start = time.time()
+    board.clear_player(1)
+    trails[1] = array.array('i')
+    return size, step, query, time.time() - start, board
+
+def main():
+    rows = []
+    rnd = random.Random(2)
+    for width, height in BOARDS:
+        steps = drive(width, height)
+        queries = [(rnd.randrange(width), rnd.randrange(height))
+                   for i in xrange(QUERIES)]
+        for name in ("grid + trail", "grid", "segments"):
+            size, step, query, clear, board = play(name, width, height, steps,
+                                                   queries)
+            runs = name == "segments" and board.runs() or "-"
+            rows.append(("%dx%d" % (width, height), len(steps), name, runs,
+                         size // 1024, "%.3f" % (step * 1e6),
+                         "%.3f" % (query * 1e6), "%.3f" % (clear * 1000)))
+    table(("board", "fields", "map", "runs", "memory KB", "us/step",
+           "us/query", "remove trail (ms)"), rows)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+
+"""
+The same load (see load.py) served by the TronServer's own epoll loop and by
+the AsyncioServer (trollius on Python 2, uvloop if installed), client-driven
+and authoritative.
+"""
+
+from ..server import TronServer, AsyncioServer
+from . import table
+from . import load
+
+BOTS = 200
+DURATION = 5.0
+PORT = 9220
+
+def main():
+    rows = []
+    port = PORT
+    for authoritative in (False, True):
+        for name, kwargs in (("epoll", dict(server_class=TronServer,
+                                            engine="epoll")),
+                             ("asyncio", dict(server_class=AsyncioServer))):
+            result = load.run(bots=BOTS, duration=DURATION,
+                              authoritative=authoritative, port=port,
+                              **kwargs)
+            port += 1
+            rows.append((authoritative and "authoritative" or "client",
+                         name, "%.0f" % result['packets_in'],
+                         "%.2f" % (result['fanout_p50'] * 1000),
+                         "%.2f" % (result['fanout_p99'] * 1000),
+                         "%.3f" % (result['cpu_tick'] * 1000),
+                         "%.1f" % result['cpu'],
+                         "%d/%d" % (result['alive'], result['bots'])))
+    table(("mode", "server", "packets/s in", "fan-out p50 (ms)",
+           "fan-out p99 (ms)", "CPU ms per tick", "server CPU %",
+           "alive at end"), rows)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+
+"""
+Sharding 200 two-player games (authoritative mode) across 1, 2 and 4 worker
+processes: how the games are spread and the CPU usage of every worker.
+
+The busiest worker limits the host: with one core per worker, the games a
+host can run scale with 100 / (CPU % of the busiest worker). That estimate
+is reported as "games at 100%" and does not need as many cores as workers
+on the benchmark machine.
+"""
+
+import os
+import signal
+import sys
+import time
+
+from ..server import settings
+from ..server.supervisor import Supervisor
+from . import cpu_time, table
+from .bots import Bot, run_bots
+
+ROOMS = 200
+DURATION = 5.0 # seconds measured after the countdown
+PORT = 9185
+
+def spawn(workers, port, player_count=2, **kwargs):
+    """Forks a Supervisor, returns (its pid, worker pids)."""
+    rfd, wfd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(rfd)
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, sys.stdout.fileno())
+        supervisor = Supervisor(workers, player_count=player_count,
+                                port=port, **kwargs)
+        supervisor.start()
+        os.write(wfd, " ".join(map(str, supervisor.pids())))
+        os.close(wfd)
+        try:
+            supervisor.serve()
+        except KeyboardInterrupt:
+            supervisor.stop()
+        finally:
+            os._exit(0)
+    os.close(wfd)
+    pids = map(int, os.read(rfd, 1000).split())
+    os.close(rfd)
+    time.sleep(.2)
+    return pid, pids
+
+def run(workers, port=PORT):
+    supervisor, pids = spawn(workers, port, authoritative=True)
+    try:
+        bots = []
+        for i in xrange(ROOMS * 2):
+            bots.append(Bot(i % 2 + 1, port, width=400, height=200))
+        run_bots(bots, settings.SECONDS + .5) # hellos and countdowns
+
+        cpu = [cpu_time(pid) for pid in pids]
+        run_bots(bots, DURATION)
+        cpu = [cpu_time(pid) - c for pid, c in zip(pids, cpu)]
+        alive = len([bot for bot in bots if not bot.crashed])
+
+        for bot in bots:
+            bot.close()
+    finally:
+        os.kill(supervisor, signal.SIGINT)
+        os.waitpid(supervisor, 0)
+    return [c / DURATION * 100 for c in cpu], alive
+
+def main():
+    rows = []
+    for i, workers in enumerate((1, 2, 4)):
+        cpu, alive = run(workers, PORT + i)
+        rows.append((workers, " ".join("%.1f" % c for c in cpu),
+                     "%.1f" % sum(cpu), "%.0f" % (ROOMS * 100 / max(cpu)),
+                     "%d/%d" % (alive, ROOMS * 2)))
+        sys.stdout.flush()
+    table(("workers", "CPU % per worker", "CPU % total", "games at 100%",
+           "alive at end"), rows)
+
+if __name__ == '__main__':
+    main()
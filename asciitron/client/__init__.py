@@ -1,3 +1,5 @@
 # -*- coding: utf-8 -*-
 
-from tronclient import TronClient
\ No newline at end of file
+from tronclient import TronClient
+from headless import HeadlessClient
+from replay import Replay
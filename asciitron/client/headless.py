@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+
+"""
+Headless client (connect --headless): the normal TronClient with its Network
+and movement logic, but without curses. A Pilot presses the keys, messages
+go to stdout.
+"""
+
+import time
+
+from renderer import Renderer
+from tronclient import TronClient
+
+TURN_EVERY = 10 # steps until the pilot turns
+
+class NullScreen(object):
+	"""Stands in for the curses screen, prints the messages."""
+
+	def __init__(self, height=60, width=200):
+		self.height = height
+		self.width = width
+
+	def getmaxyx(self):
+		return self.height, self.width
+
+	def addstr(self, *args):
+		print args[-1].rstrip("\n")
+
+	def getch(self):
+		return -1
+
+	def getkey(self):
+		return ""
+
+	def __getattr__(self, name):
+		# refresh, clear, timeout, ... do nothing
+		return lambda *args: None
+
+class NullRenderer(Renderer):
+	"""Counts frames without drawing them."""
+
+	def flush(self, force=False):
+		if not (force or self.pending()):
+			return False
+		self.dirty = {}
+		self.texts = {}
+		self.frames += 1
+		return True
+
+class Pilot(object):
+	"""
+	Runs a staircase, like the benchmark bots: TURN_EVERY steps to the
+	right, one step down.
+	"""
+
+	def __init__(self):
+		self.steps = 0
+
+	def next_key(self):
+		self.steps += 1
+		return ord(self.steps % TURN_EVERY and 'd' or 's')
+
+class HeadlessClient(TronClient):
+	renderer_class = NullRenderer
+
+	def __init__(self, hostname, player_id, port, width=200, height=60,
+				 latency=False, predict=True, watch=None, udp=False):
+		self.screen_size = height, width
+		self.pilot = Pilot()
+		TronClient.__init__(self, hostname, player_id, port, beep=False,
+							latency=latency, predict=predict, watch=watch,
+							udp=udp)
+
+	def init_screen(self):
+		return NullScreen(*self.screen_size)
+
+	def stop(self):
+		if self.latency:
+			print self.probe.report()
+			print self.prediction.report()
+
+	def countdown(self, seconds, x, y):
+		print "Game starts in %s seconds..." % seconds
+		self.start_time = time.time() + seconds
+
+	def show_banner(self, text):
+		print text
+
+	def inputs(self):
+		return [self.network.socket]
+
+	def timed(self):
+		# The pilot steers in server-authoritative mode, too
+		return not self.collided and not self.spectator and \
+			self.prediction.pending is None
+
+	def step(self):
+		self.press(self.pilot.next_key())
+		if self.authoritative:
+			return self.speed / 1000.0
+		return TronClient.step(self)
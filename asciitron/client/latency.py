@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+
+"""
+Latency measurement of the client loop (connect --latency).
+"""
+
+import time
+
+class LatencyProbe(object):
+	"""
+	Collects the time between start(name) and the following stop(name),
+	e.g. "key->packet" from a keypress to the packet telling the server, or
+	"packet->draw" from receiving a position to the frame showing it.
+	Repeated start() calls keep the earliest time.
+	"""
+
+	def __init__(self):
+		self.pending = {} # name -> start time
+		self.samples = {} # name -> list of seconds
+
+	def start(self, name, now=None):
+		if name not in self.pending:
+			self.pending[name] = now or time.time()
+
+	def stop(self, name, now=None):
+		started = self.pending.pop(name, None)
+		if started is not None:
+			self.samples.setdefault(name, []).append(
+				(now or time.time()) - started)
+
+	def report(self):
+		lines = []
+		for name in sorted(self.samples):
+			values = sorted(self.samples[name])
+			pick = lambda p: values[min(len(values) - 1,
+										int(round(p / 100.0 * (len(values) - 1))))]
+			lines.append("%s: %d samples, p50 %.2f ms, p90 %.2f ms, "
+						 "p99 %.2f ms, max %.2f ms" % (
+							 name, len(values), pick(50) * 1000,
+							 pick(90) * 1000, pick(99) * 1000,
+							 values[-1] * 1000))
+		return "\n".join(lines)
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+
+"""
+Client-side crash prediction (client-driven mode).
+"""
+
+class Prediction(object):
+	"""
+	Checks every step against the local map before the server does: a
+	predicted crash is shown at once (an X at the head) and the cycle stops
+	there. The server's verdict on that position settles it, either our
+	crash (cmd 3, confirmed) or the position broadcast back to us (cmd 2,
+	the local map was outdated): then the X is rolled back and the cycle
+	goes on from there.
+	"""
+
+	MARK = 'X'
+	TEXT = "Boom? Asking the server..."
+
+	def __init__(self, game, enabled=True):
+		self.game = game
+		self.enabled = enabled
+		self.pending = None # (x, y) of the crash waiting for the server
+		self.predicted = 0
+		self.confirmed = 0
+		self.rolled_back = 0
+		self.missed = 0 # crashes only the server saw
+
+	def collides(self, x, y):
+		grid = self.game.map
+		return x <= 0 or x >= grid.width - 1 or y <= 0 or \
+			y >= grid.height - 1 or bool(grid.get(x, y))
+
+	def check(self, x, y):
+		"""True if the step to x, y crashes (the crash is shown then)."""
+		if not self.enabled or not self.collides(x, y):
+			return False
+		self.pending = (x, y)
+		self.predicted += 1
+		self.game.gamepad.draw_player(x, y, self.MARK)
+		self.game.renderer.text(0, 10, self.TEXT)
+		self.game.draw_frame(force=True)
+		return True
+
+	def confirm(self):
+		"""The server says we crashed."""
+		if self.pending is None:
+			self.missed += 1
+		else:
+			self.confirmed += 1
+			self.pending = None
+
+	def accept(self, x, y):
+		"""The server moved us to x, y; rolls back a crash predicted there."""
+		if self.pending != (x, y):
+			return
+		self.pending = None
+		self.rolled_back += 1
+		self.game.renderer.text(0, 10, " " * len(self.TEXT))
+
+	def report(self):
+		return "prediction: %d crashes predicted, %d confirmed, " \
+			"%d rolled back, %d missed" % (self.predicted, self.confirmed,
+											self.rolled_back, self.missed)
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+
+"""
+Frame based drawing: changes are collected off-screen and written to the
+terminal at most FRAME_RATE times per second.
+"""
+
+import time
+import curses
+
+FRAME_RATE = 30 # frames per second at most
+
+class Renderer(object):
+	"""
+	Drawing calls only mark cells (and text) as dirty; flush() copies the
+	dirty ones to the curses screen and updates the terminal once with
+	noutrefresh + doupdate. Cells which already show the wanted character
+	are skipped.
+	"""
+
+	def __init__(self, screen, frame_rate=FRAME_RATE):
+		self.screen = screen
+		self.frame_time = 1.0 / frame_rate
+		self.next_frame = 0
+		self.shown = {} # (y, x) -> character on the terminal
+		self.dirty = {} # (y, x) -> character to draw with the next frame
+		self.texts = {} # (y, x) -> text to draw with the next frame
+		self.shown_texts = {}
+		self.frames = 0
+
+	def put(self, x, y, char):
+		if self.shown.get((y, x)) == char:
+			self.dirty.pop((y, x), None)
+		else:
+			self.dirty[(y, x)] = char
+
+	def text(self, y, x, text):
+		if self.shown_texts.get((y, x)) == text:
+			self.texts.pop((y, x), None)
+		else:
+			self.texts[(y, x)] = text
+
+	def pending(self):
+		return bool(self.dirty or self.texts)
+
+	def invalidate(self):
+		"""Forgets the terminal contents, e.g. after screen.clear()."""
+		self.shown = {}
+		self.shown_texts = {}
+
+	def flush(self, force=False):
+		"""Draws a frame unless the last one is too recent (or not needed)."""
+		now = time.time()
+		if not force and (now < self.next_frame or
+						  not (self.dirty or self.texts)):
+			return False
+		self.next_frame = now + self.frame_time
+
+		screen = self.screen
+		for (y, x), char in self.dirty.iteritems():
+			try:
+				screen.addch(y, x, ord(char))
+			except curses.error:
+				pass
+			self.shown[(y, x)] = char
+		for (y, x), text in self.texts.iteritems():
+			try:
+				screen.addstr(y, x, text)
+			except curses.error:
+				pass
+			self.shown_texts[(y, x)] = text
+		self.dirty = {}
+		self.texts = {}
+
+		screen.noutrefresh()
+		curses.doupdate()
+		self.frames += 1
+		return True
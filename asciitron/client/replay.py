@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+
+"""
+Replays a game recording (see common/recording.py) to a TronClient or
+HeadlessClient, which watches as a spectator (player id 0).
+"""
+
+import sys
+import time
+import select
+
+from ..common import *
+from ..common.recording import *
+
+class Replay(object):
+	"""
+	Feeds the recorded frames to client.network.handle_packet, like they
+	came from the server. speed 1 plays in real time, 0 as fast as possible
+	(countdowns skipped); start (seconds) seeks to the latest snapshot
+	before it and fast-forwards the frames up to it.
+	"""
+
+	def __init__(self, client, recording, speed=1.0, start=0):
+		self.client = client
+		self.recording = recording
+		self.speed = speed
+		self.start = int(start * 1000)
+		self.buf = InputBuffer()
+		self.decoder = Decoder()
+		self.decoder.version = 2
+		self.records = 0
+
+	def restore(self, payload):
+		"""Shows the board of a snapshot."""
+		width, height, authoritative, positions, trails = \
+			unpack_snapshot(payload)
+		handle = self.client.network.handle_packet
+		handle(self.fit((0, 1, width, height, KEEP_SPEED, KEEP_NITRO,
+						 int(authoritative)))) # no countdown
+		for player_id, fields in trails.iteritems():
+			for i in fields:
+				handle((player_id, 2, i % width, i // width, KEEP_SPEED,
+						KEEP_NITRO, 0))
+		self.play(positions)
+
+	def play(self, frame):
+		handle = self.client.network.handle_packet
+		self.buf.feed(frame)
+		for packet in self.decoder.decode(self.buf):
+			if packet[1] == 1:
+				packet = self.fit(packet)
+				if not self.speed:
+					# Skip the countdown
+					packet = (0,) + packet[1:]
+			handle(packet)
+
+	def fit(self, packet):
+		"""
+		Cuts the board of a start packet to the screen, bigger boards are
+		shown partly.
+		"""
+		client = self.client
+		width, height = min(packet[2], client.WIDTH), \
+			min(packet[3], client.HEIGHT)
+		return packet[:2] + (width, height) + packet[4:]
+
+	def wait(self, until):
+		"""Waits for time until, False if the user quits."""
+		client = self.client
+		while True:
+			now = time.time()
+			timeout = until - now
+			if timeout <= 0:
+				return True
+			if client.renderer.pending():
+				timeout = min(timeout, max(0, client.renderer.next_frame - now))
+			inputs = [i for i in client.inputs() if i is sys.stdin]
+			if inputs:
+				r, _, _ = select.select(inputs, [], [], timeout)
+				if r and not client.handle_keys():
+					return False
+			else:
+				time.sleep(timeout)
+			client.draw_frame()
+
+	def run(self):
+		"""Returns False if the user quit before the end."""
+		client = self.client
+		client.renderer.screen.timeout(0) # keys are read when available
+		offset = self.recording.seek(self.start)
+		begin = None # (time, ms) of the first frame played at speed
+		for kind, ms, payload, at in self.recording.records(offset):
+			if kind == REC_SNAPSHOT:
+				if at == offset:
+					self.restore(payload)
+				continue
+			if kind != REC_FRAME:
+				continue
+			if ms >= self.start and self.speed:
+				# Frames before the start are fast-forwarded
+				if begin is None:
+					begin = (time.time(), ms)
+				due = begin[0] + (ms - begin[1]) / 1000.0 / self.speed
+				if not self.wait(due):
+					return False
+			self.play(payload)
+			self.records += 1
+			client.draw_frame()
+		client.draw_frame(force=True)
+		return True
+
+	def finish(self):
+		"""Tells the end of the replay and waits for a key."""
+		self.client.show_banner("Replay finished, press any key.")
+		screen = self.client.renderer.screen
+		screen.timeout(-1)
+		screen.getch()
@@ -32,15 +32,28 @@ import curses
 import socket
 import struct
 import random
-import threading
-import Queue
+import select
+from collections import deque
 
 from ..common import *
+from renderer import Renderer
+from latency import LatencyProbe
+from prediction import Prediction
 
 random.seed()
 
 stdscr = None
 
+# Drawn for the player ids, 0 = empty field
+PLAYER_CHARS = "0123456789abcdefghijklmnopqrstuvwxyz" \
+	"ABCDEFGHIJKLMNOPQRSTUVWXYZ#@"
+
+# A game whose connection broke is resumed if the server comes back within
+# RESUME_TIMEOUT seconds (serve --checkpoint), tried every RESUME_RETRY
+RESUME_TIMEOUT = 10
+RESUME_RETRY = .1
+
+
 class Network(object):
 	def __init__(self, game, hostname, player_id, port):
 		self.player_id = player_id
@@ -51,10 +64,12 @@ class Network(object):
 		self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
 		self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
 		
-		self.buf_in = ""
+		self.buf_in = InputBuffer()
+		self.decoder = Decoder()
 		self.connected = False
-
-		self.handler_thread = threading.Thread(target=self.handler_loop)
+		self.received_at = 0 # time of the last recv
+		self.ticket = None # (room, key) of our seat, see cmd 16
+		self.resuming = False # asks for the seat of ticket instead of a new one
 	
 	def connect(self):
 		try:
@@ -76,43 +91,38 @@ class Network(object):
 	def handle_packet(self, packet):
 		player_id, cmd, x, y, speed, nitro, misc = packet
 		
-		# Update speed
-		self.game.speed = speed
-		self.game.nitrotank = nitro
+		# Update speed (records broadcast to everybody don't carry ours)
+		if speed != KEEP_SPEED:
+			self.game.speed = speed
+		if nitro != KEEP_NITRO:
+			self.game.nitrotank = nitro
 		#stdscr.addstr("Network packet received (pno=%s, cmd=%s, x=%s, y=%s)!\n" % (player_id, cmd, x, y))
 		#stdscr.refresh()
 		
 		if cmd == 0: # Hello, answering with player id
+			if misc >= 2:
+				# Server speaks protocol v2, ask for it
+				self.send(1, PROTOCOL_VERSION, 0)
+			if self.game.spectator:
+				# Watch a room instead (the server needs v2 for that)
+				self.send(6, self.game.room, 0)
+				return
+			if self.resuming:
+				self.send(7, self.ticket[0], self.ticket[1], self.player_id)
+				return
 			self.send(0, self.game.WIDTH, self.game.HEIGHT, self.player_id)
 		elif cmd == 1: # Game start in X seconds!
+			# misc = 1: the server moves our cycle, we only steer
+			self.game.authoritative = misc == 1
+			self.game.started = True
 			self.game.x = random.randint(int(x*0.1), int(x*0.9))
 			self.game.y = random.randint(int(y*0.1), int(y*0.9))
 			
 			self.game.gamepad.height = y
 			self.game.gamepad.width = x
+			self.game.map = Segments(x, y)
 			
-			# Start game countdown
-			for sec in xrange(player_id, 0, -1):
-				BANNER = "Game starts in %s seconds..." % sec
-				stdscr.addstr(self.game.HEIGHT / 2,
-							  self.game.WIDTH / 2 - len(BANNER) / 2, 
-							  BANNER)
-				stdscr.refresh()
-				if self.game.beep:
-					curses.beep()
-				time.sleep(1)
-
-			# Draw borders
-			stdscr.clear()
-			stdscr.addch(0, 0, curses.ACS_ULCORNER) # upper left corner
-			stdscr.hline(0, 1, curses.ACS_HLINE, x-2) # upper horizontal line
-			stdscr.addch(0, x-1, curses.ACS_URCORNER) # upper right corner
-			stdscr.vline(1, x-1, curses.ACS_VLINE, y-2) # right vertical line
-			stdscr.insch(y-1, x-1, curses.ACS_LRCORNER) # lower right corner (insch has to be used for this, because addch would throw an exception)
-			stdscr.hline(y-1, 1, curses.ACS_HLINE, x-2) # lower horizontal line
-			stdscr.addch(y-1, 0, curses.ACS_LLCORNER) # lower left corner
-			stdscr.vline(1, 0, curses.ACS_VLINE, y-2) # left vertical line
-			stdscr.refresh()
+			self.game.countdown(player_id, x, y)
 
 		elif cmd == 2: # Set position from player
 			try:
@@ -120,13 +130,33 @@ class Network(object):
 			except ValueError:
 				# ignore erroneous player id (e. g. because of a transmission error)
 				return
-			self.game.gamepad.dispatcher_queue.put((x, y, player_id))
+			if not 0 < player_id < 256:
+				return
+			if player_id == self.player_id:
+				if self.game.authoritative:
+					self.game.x = x
+					self.game.y = y
+					self.game.gamepad.follow(x, y)
+				else:
+					self.game.prediction.accept(x, y)
+			elif self.game.spectator:
+				# The view of an arena follows one cycle until it's gone
+				if self.game.followed is None:
+					self.game.followed = player_id
+				if player_id == self.game.followed:
+					self.game.gamepad.follow(x, y)
+			self.game.probe.start("packet->draw", self.received_at)
+			self.game.gamepad.place(x, y, player_id)
 		elif cmd == 3: # Crash of Player X
 			self.game.check_crash(player_id)
 		elif cmd == 4: # Player X won
 			self.game.check_win(player_id)
 		elif cmd == 5: # Remove player X from map
 			self.game.remove_from_map(player_id)
+			if player_id == self.game.followed:
+				self.game.followed = None
+		elif cmd == 8: # Heartbeat, tell the server we're still there
+			self.send(8, 0, 0)
 		elif cmd == 9: # Graceful disconnect
 			# TODO: Message ausgeben?
 			self.disconnect()
@@ -147,10 +177,19 @@ class Network(object):
 			stdscr.getkey()
 			sys.exit(0)
 		elif cmd == 13: # Invalid Player ID
-			stdscr.addstr("Invalid Player ID (only one digit is allowed)! Press any key.\n")
+			stdscr.addstr("Invalid Player ID (only 1 to %d are allowed)! Press any key.\n" %
+						  MAX_PLAYER_ID)
 			stdscr.refresh()
 			stdscr.getkey()
 			sys.exit(0)
+		elif cmd == 16: # Our seat, to resume it after a server restart
+			self.ticket = (x, y)
+		elif cmd == 17: # Seat resumed
+			self.resuming = False
+			self.game.resumed(x, y, misc)
+		elif cmd == 18: # Nothing to resume
+			self.ticket = None
+			self.disconnect()
 		elif cmd == 20: # Set new speed
 			self.game.speed = x
 
@@ -158,26 +197,29 @@ class Network(object):
 		if not self.connected: return False
 
 		try:
-			buf = self.socket.recv(bulk and 8192 or FMT_SIZE_TOPLAYER)
+			count = self.buf_in.recv_from(self.socket,
+										  bulk and 8192 or FMT_SIZE_TOPLAYER)
 		except socket.error:
 			self.disconnect()
 			return False
 		else:
-			if len(buf) == 0:
+			if count == 0:
 				self.disconnect()
 				return False
-			else:
-				self.buf_in += buf
-
+			self.received_at = time.time()
 		
 		# only for debugging purposes: Simulate lag of 50ms
 		#if len(self.buf_in) >= FMT_SIZE_TOPLAYER:
 		#	time.sleep(0.05)		
 		
-		while len(self.buf_in) >= FMT_SIZE_TOPLAYER:
-			packet = struct.unpack(FMT_TOPLAYER, self.buf_in[:FMT_SIZE_TOPLAYER])
+		try:
+			packets = self.decoder.decode(self.buf_in)
+		except ValueError:
+			# Garbage received
+			self.disconnect()
+			return False
+		for packet in packets:
 			self.handle_packet(packet)
-			self.buf_in = self.buf_in[FMT_SIZE_TOPLAYER:]
 		
 		return True
 
@@ -198,45 +240,184 @@ class Network(object):
 	def tell(self, x, y):
 		self.send(2, x, y)
 	
-	def handler_loop(self):
+	def steer(self, direction):
+		self.send(22, direction, 0)
+	
+	def timeout(self, now):
+		"""Seconds until resend() is due, None if never (TCP)."""
+		return None
+	
+	def resend(self, now):
+		pass
+
+class DatagramNetwork(Network):
+	"""
+	Network over UDP (connect --udp), see common/datagram.py: positions
+	never wait for a lost datagram, only the events are repeated.
+	"""
+	
+	CONNECT_TIMEOUT = 1 # seconds to wait for the server's hello
+	
+	def __init__(self, game, hostname, player_id, port):
+		self.player_id = player_id
+		self.game = game
+		self.hostname = hostname
+		self.port = port
+		self.channel = None
+		self.socket = None
+		self.connected = False
+		self.received_at = 0
+		self.ticket = None # games over UDP aren't resumed
+		self.resuming = False
+	
+	def connect(self):
+		try:
+			self.channel = DatagramChannel(self.hostname, self.port)
+		except socket.error:
+			return False
+		self.socket = self.channel.socket
+		self.connected = True
+		# Nothing is connected before the server answers
+		if self.channel.open() and self.wait(self.CONNECT_TIMEOUT):
+			try:
+				# Fails if nobody listens (ICMP port unreachable)
+				self.socket.recv(1, socket.MSG_PEEK)
+			except socket.error:
+				pass
+			else:
+				return True
+		self.disconnect()
+		return False
+	
+	def disconnect(self):
+		if self.channel is not None:
+			self.channel.close()
+		self.connected = False
+	
+	def wait(self, timeout=None):
+		"""Waits for a datagram (resending ours), False if none came."""
+		end = timeout is not None and time.time() + timeout or None
 		while self.connected:
-			self.handle(bulk=True)
+			now = time.time()
+			wait = self.channel.timeout(now)
+			if end is not None:
+				if now >= end:
+					return False
+				wait = min(end - now, wait)
+			try:
+				r, _, _ = select.select([self.socket], [], [], wait)
+			except select.error:
+				continue
+			if r:
+				return True
+			self.resend(time.time())
+		return False
+	
+	def handle(self, bulk=False):
+		if not self.connected: return False
+		
+		if not bulk and not self.wait():
+			return False
+		packets = self.channel.receive()
+		if packets is None:
+			self.disconnect()
+			return False
+		self.received_at = time.time()
+		for packet in packets:
+			self.handle_packet(packet)
+		return True
 	
-	def start(self):
-		self.handler_thread.daemon = True
-		self.handler_thread.start()
+	def send(self, cmd, x, y, misc=0):
+		if not self.connected: return False
+		if not self.channel.send(cmd, x, y, misc):
+			self.disconnect()
+			return False
+		return True
+	
+	def timeout(self, now):
+		if not self.connected:
+			return None
+		return self.channel.timeout(now)
+	
+	def resend(self, now):
+		if self.connected and not self.channel.resend(now):
+			self.disconnect()
 
 class Gamepad(object):
+	"""
+	The board on the screen. A board bigger than the screen (an arena, see
+	serve --arena) is shown through a view which follows the own cycle: it
+	is centered on the cycle again when the cycle comes closer than a
+	quarter of the screen to its edge.
+	"""
+	
 	def __init__(self, tron, height, width):
 		self.tron = tron
-		self.height = height
+		self.height = height # of the board
 		self.width = width
+		self.left = 0 # board field shown in the upper left corner
+		self.top = 0
 		
-		self.dispatcher_queue = Queue.Queue()
-		self.dispatcher_thread = threading.Thread(target=self.position_dispatcher)
-		self.dispatcher_thread.daemon = True
-		self.dispatcher_thread.start()
-		
-		self.draw_lock = threading.Lock()
-
-	def position_dispatcher(self):
-		while True:
-			try:
-				x, y, player_id = self.dispatcher_queue.get(True, 1)
-			except Queue.Empty:
-				continue 
-			
-			self.draw_player(x, y, player_id)
-			
-			# Add position to map for further checks 
-			# e. g. local crash/boundary checks (instead of server ones) or 
-			# removing a player from the map
-			if player_id == 0:
-				del self.tron.map[(x, y)]
+		self.renderer = tron.renderer
+	
+	def scrolls(self):
+		return self.width > self.tron.WIDTH or self.height > self.tron.HEIGHT
+	
+	def follow(self, x, y, force=False):
+		"""Scrolls the view if x, y gets close to its edge."""
+		if not self.scrolls():
+			return
+		width, height = self.tron.WIDTH, self.tron.HEIGHT
+		left, top = self.left, self.top
+		if not width // 4 <= x - left < width - width // 4:
+			left = x - width // 2
+		if not height // 4 <= y - top < height - height // 4:
+			top = y - height // 2
+		left = max(0, min(left, self.width - width))
+		top = max(0, min(top, self.height - height))
+		if force or (left, top) != (self.left, self.top):
+			self.left, self.top = left, top
+			self.redraw()
+	
+	def redraw(self):
+		"""Draws the whole view from the map, with the board's border."""
+		tron = self.tron
+		width, height = tron.WIDTH, tron.HEIGHT
+		cells = tron.map.window(self.left, self.top, width, height)
+		put = self.renderer.put
+		right, bottom = self.width - 1, self.height - 1
+		for i, player_id in enumerate(cells):
+			x, y = self.left + i % width, self.top + i // width
+			if x > right or y > bottom:
+				char = ' '
+			elif x in (0, right):
+				char = y in (0, bottom) and '+' or '|'
+			elif y in (0, bottom):
+				char = '-'
+			elif not player_id:
+				char = ' '
+			elif player_id == tron.player_id:
+				char = '*'
 			else:
-				self.tron.map[(x, y)] = player_id
+				char = PLAYER_CHARS[player_id:player_id + 1] or '?'
+			put(i % width, i // width, char)
+
+	def place(self, x, y, player_id):
+		self.draw_player(x, y, player_id)
+		
+		# Add position to map for further checks 
+		# e. g. local crash/boundary checks (instead of server ones) or 
+		# removing a player from the map
+		if player_id == '0':
+			self.tron.map.set(x, y, 0)
+		elif player_id == '*':
+			self.tron.map.set(x, y, self.tron.player_id)
+		else:
+			self.tron.map.set(x, y, player_id)
 	
 	def draw_player(self, x, y, char='*'):
+		if isinstance(char, int):
+			char = PLAYER_CHARS[char:char + 1] or '?'
 		char = str(char)
 		
 		if len(char) != 1:
@@ -260,50 +441,150 @@ class Gamepad(object):
 					del self.tron.available_colors[self.tron.available_colors.index(color)]
 					self.tron.player_colors[char] = color
 		
-		with self.draw_lock:
-			try:
-				stdscr.addch(y, x, ord(char))
-			except:
-				pass
-			stdscr.refresh()
+		# Only marked, the renderer draws it with the next frame
+		x, y = x - self.left, y - self.top
+		if 0 <= x < self.tron.WIDTH and 0 <= y < self.tron.HEIGHT:
+			self.renderer.put(x, y, char)
 
 class TronClient(object):
 	class Direction:
-		LEFT, RIGHT, UP, DOWN = range(4)
+		# same values as DIR_* of the protocol
+		LEFT, RIGHT, UP, DOWN = DIR_LEFT, DIR_RIGHT, DIR_UP, DIR_DOWN
 
 	#HEIGHT, WIDTH = 0, 0
 
-	def __init__(self, hostname, player_id, port, beep):
+	renderer_class = Renderer
+
+	def __init__(self, hostname, player_id, port, beep, latency=False,
+				 predict=True, watch=None, udp=False):
 		global stdscr
 
-		os.environ['ESCDELAY'] = '0'
-		stdscr = curses.initscr()
-		curses.start_color()
-		curses.noecho()
-		curses.curs_set(0)
-		stdscr.keypad(1)
+		stdscr = self.init_screen()
 		
 		self.beep = beep
 		self.HEIGHT, self.WIDTH = stdscr.getmaxyx()
+		self.renderer = self.renderer_class(stdscr)
 		self.gamepad = Gamepad(self, self.HEIGHT, self.WIDTH)
 		self.direction = self.Direction.RIGHT
 		self.x = 0
 		self.y = 0
 		self.time_normalizer = float(self.HEIGHT) / self.WIDTH
-		self.draw_thread = None
+		self.keys = deque() # direction keys not applied yet
 		self.collided = False
 		self.player_id = player_id
-		self.network = Network(self, hostname, player_id, port)
+		if udp:
+			self.network = DatagramNetwork(self, hostname, player_id, port)
+		else:
+			self.network = Network(self, hostname, player_id, port)
 		
 		self.available_colors = [curses.COLOR_BLUE, curses.COLOR_CYAN, 
 								 curses.COLOR_YELLOW, curses.COLOR_GREEN]
 		self.player_colors = {}
-		self.map = {} # Contains a map: (x, y) -> player-id
+		self.map = Segments(0, 0) # Contains a map: (x, y) -> player-id
 		self.speed = 120 # Current speed of the player in ms (1000ms = 1s)
 		self.nitrotank = 100 # Current status of nitro tank in percent
+		self.authoritative = False # Server moves the player, we only steer
+		self.started = False # Start-Package received
+		self.start_time = 0 # end of the countdown
+		self.latency = latency # report the probe's numbers at the end
+		self.probe = LatencyProbe()
+		self.prediction = Prediction(self, predict) # client-driven mode only
+		self.spectator = watch is not None # only watching room number watch
+		self.followed = None # player id the spectator's view follows
+		self.room = watch
 	
+	def init_screen(self):
+		os.environ['ESCDELAY'] = '0'
+		screen = curses.initscr()
+		curses.start_color()
+		curses.noecho()
+		curses.curs_set(0)
+		screen.keypad(1)
+		return screen
+
 	def stop(self):
 		curses.endwin()
+		if self.latency:
+			print self.probe.report()
+			print self.prediction.report()
+
+	def countdown(self, seconds, x, y):
+		"""Shows the countdown of the Start-Package and draws the borders."""
+		for sec in xrange(seconds, 0, -1):
+			BANNER = "Game starts in %s seconds..." % sec
+			stdscr.addstr(self.HEIGHT / 2,
+						  self.WIDTH / 2 - len(BANNER) / 2, 
+						  BANNER)
+			stdscr.refresh()
+			if self.beep:
+				curses.beep()
+			time.sleep(1)
+
+		stdscr.clear()
+		self.renderer.invalidate()
+		if self.gamepad.scrolls():
+			# The view around the cycle, with the part of the border in it
+			self.gamepad.follow(self.x, self.y, force=True)
+			return
+
+		# Draw borders
+		stdscr.addch(0, 0, curses.ACS_ULCORNER) # upper left corner
+		stdscr.hline(0, 1, curses.ACS_HLINE, x-2) # upper horizontal line
+		stdscr.addch(0, x-1, curses.ACS_URCORNER) # upper right corner
+		stdscr.vline(1, x-1, curses.ACS_VLINE, y-2) # right vertical line
+		stdscr.insch(y-1, x-1, curses.ACS_LRCORNER) # lower right corner (insch has to be used for this, because addch would throw an exception)
+		stdscr.hline(y-1, 1, curses.ACS_HLINE, x-2) # lower horizontal line
+		stdscr.addch(y-1, 0, curses.ACS_LLCORNER) # lower left corner
+		stdscr.vline(1, 0, curses.ACS_VLINE, y-2) # left vertical line
+		stdscr.refresh()
+		self.renderer.invalidate()
+
+	def resumed(self, x, y, direction):
+		"""Our seat is back (cmd 17), the game goes on from x, y."""
+		self.x, self.y = x, y
+		self.direction = direction
+		self.keys.clear()
+		self.prediction.pending = None
+		self.start_time = time.time()
+		self.gamepad.follow(x, y, force=True)
+	
+	def reconnect(self):
+		"""
+		Tries to resume the game after the connection broke, in case the
+		server is restarted from its checkpoint. True if it was resumed.
+		"""
+		lost = self.network
+		if lost.ticket is None or self.collided or self.spectator:
+			return False
+		self.renderer.text(0, 10, "Connection lost, resuming...")
+		self.draw_frame(force=True)
+		deadline = time.time() + RESUME_TIMEOUT
+		try:
+			while time.time() < deadline:
+				network = lost.__class__(self, lost.hostname, lost.player_id,
+										 lost.port)
+				network.ticket = lost.ticket
+				network.resuming = True
+				self.network = network
+				if network.connect():
+					# Hello, our resume request, then the board
+					while network.connected and network.resuming:
+						network.handle()
+					if network.connected:
+						return True
+					if network.ticket is None:
+						return False # the game is gone
+				time.sleep(RESUME_RETRY)
+		except KeyboardInterrupt:
+			pass
+		return False
+	
+	def show_banner(self, text):
+		win = curses.newwin(3, 4+len(text), 5, 5)
+		win.box()
+		win.addstr(1, 2, text)
+		self.draw_frame(force=True)
+		win.refresh()
 
 	def change_direction(self, key):
 		if key in [curses.KEY_DOWN, ord('s'), ord('j')]:
@@ -328,18 +609,14 @@ class TronClient(object):
 			self.y -= 1
 		if self.direction == self.Direction.DOWN:
 			self.y += 1
-		
-		# Check for collision!
-		#if self.map.has_key((self.x, self.y)) or \
-		#	self.x <= 0 or self.x >= self.gamepad.width - 1 or \
-		#	self.y <= 0 or self.y >= self.gamepad.height - 1:
-		#	self.collided = True
 
 	def remove_from_map(self, player_id):
-		coords = filter(lambda f: f[1] == player_id, self.map.items())
-		for coord, _ in coords:
-			self.gamepad.dispatcher_queue.put((coord[0], coord[1], '0'))
-			del self.map[coord]
+		if not 0 < player_id < 256:
+			return
+		for x, y in self.map.fields(player_id):
+			self.gamepad.draw_player(x, y, '0')
+		self.map.clear_player(player_id)
+		self.draw_frame()
 
 	def check_crash(self, player_id):
 		"""
@@ -352,17 +629,13 @@ class TronClient(object):
 
 		if self.player_id == player_id:
 			self.collided = True
+			self.prediction.confirm()
+			self.probe.stop("crash->shown")
 			
-			BANNER = "Uhh, you booomed! :-("
-			with self.gamepad.draw_lock:
-				win = curses.newwin(3, 4+len(BANNER), 5, 5)
-				win.box()
-				win.addstr(1, 2, BANNER)
-				win.refresh()
+			self.show_banner("Uhh, you booomed! :-(")
 		else:
-			with self.gamepad.draw_lock:
-				stdscr.addstr(0, 10, "Player %s boomed." % player_id)
-				stdscr.refresh()
+			self.renderer.text(0, 10, "Player %s boomed." % player_id)
+			self.draw_frame(force=True)
 	
 	def check_win(self, player_id):
 		"""
@@ -370,19 +643,16 @@ class TronClient(object):
 		this method will be called to take further action.
 		"""
 		self.collided = True
-		if self.player_id == player_id:
+		if self.spectator:
+			BANNER = "Player %s won!" % player_id
+		elif self.player_id == player_id:
 			# We won!
 			BANNER = "Congrats, you won! :-)"
 		else:
 			# Another player won
 			BANNER = "Player %s won, you lost!" % player_id
 		
-		with self.gamepad.draw_lock:
-			win = curses.newwin(3, 4+len(BANNER), 5, 5) 
-			win.box()
-			win.addstr(1, 2, BANNER)
-			win.refresh()
-			stdscr.refresh()
+		self.show_banner(BANNER)
 		time.sleep(3)
 		
 		self.network.disconnect()
@@ -391,6 +661,71 @@ class TronClient(object):
 		# Activate Nitro!
 		self.network.send(21, 0, 0)
 
+	def draw_frame(self, force=False):
+		if self.renderer.flush(force):
+			self.probe.stop("packet->draw")
+
+	def handle_keys(self):
+		"""Reads all pending keys, returns False if the player quits."""
+		while True:
+			c = stdscr.getch()
+			if c == -1:
+				return True
+			if not self.press(c):
+				return False
+
+	def press(self, c):
+		if c == 27: # Escape -> Quit game
+			return False
+		elif self.spectator:
+			pass
+		elif c == 110: # "n" = NitroSpeed
+			self.nitro()
+		elif not self.collided:
+			self.probe.start("key->packet")
+			if self.authoritative:
+				# Server-authoritative mode: only tell direction changes
+				direction = self.direction
+				self.change_direction(c)
+				if direction != self.direction:
+					self.network.steer(self.direction)
+					self.probe.stop("key->packet")
+			else:
+				# Applied one per step, like a key read every step
+				self.keys.append(c)
+		return True
+
+	def inputs(self):
+		return [self.network.socket, sys.stdin]
+
+	def timed(self):
+		"""True while the game loop has to call step() on time."""
+		return not self.authoritative and not self.collided and \
+			not self.spectator and self.prediction.pending is None
+
+	def step(self):
+		"""Moves one field (client-driven mode), returns the step time."""
+		speed = self.speed / 1000.0 # ms -> seconds
+		
+		if self.keys:
+			self.change_direction(self.keys.popleft()) # Change direction of player according to keypress
+		self.move_player()					# Move player
+		self.gamepad.follow(self.x, self.y)
+		if self.prediction.collides(self.x, self.y):
+			self.probe.start("crash->shown")
+		self.network.tell(self.x, self.y)	# Tell server new player position
+		self.probe.stop("key->packet")
+		if self.prediction.check(self.x, self.y):
+			# Shown right away, the server has the final say
+			self.probe.stop("crash->shown")
+		else:
+			self.gamepad.place(self.x, self.y, '*')
+		
+		# Normalize speed depending on the direction
+		if self.direction in [curses.KEY_LEFT, curses.KEY_RIGHT]:
+			speed *= self.time_normalizer
+		return speed
+
 	def run(self):
 		retries = 0	
 		while True:
@@ -408,58 +743,63 @@ class TronClient(object):
 					# Wait for the welcome package
 					self.network.handle()
 					
-					stdscr.addstr("Connected, waiting for all players...\n")
+					if self.spectator:
+						stdscr.addstr("Connected, waiting for a game to watch...\n")
+					else:
+						stdscr.addstr("Connected, waiting for all players...\n")
 					stdscr.refresh()
 					
 					# Wait for the server to start the game ("Start-Package", 
 					# which includes several parameters such as the countdown seconds) 
-					self.network.handle()
-					
-					# Go start the network dispatch loop (in it's own thread)
-					self.network.start()
+					while self.network.connected and not self.started:
+						self.network.handle()
 					
 					# And now leave this setup loop
 					break
 			except KeyboardInterrupt:
 				return False
 
-		# Enter game loop
+		# Enter game loop: one thread waits for the server, the keyboard 
+		# (fd 0) and the next step at once
 		stdscr.timeout(0)
-		while self.network.connected:
-			
-			speed = self.speed / 1000.0 # ms -> seconds
+		next_step = max(time.time(), self.start_time)
+		while self.network.connected or self.reconnect():
+			now = time.time()
+			# A resumed game goes on from now
+			next_step = max(next_step, self.start_time)
+			timeout = None
+			if self.timed():
+				timeout = max(0, next_step - now)
+			if self.renderer.pending():
+				frame = max(0, self.renderer.next_frame - now)
+				if timeout is None or frame < timeout:
+					timeout = frame
+			wait = self.network.timeout(now)
+			if wait is not None and (timeout is None or wait < timeout):
+				timeout = wait
 			
 			try:
-				c = stdscr.getch()
+				r, _, _ = select.select(self.inputs(), [], [], timeout)
+			except select.error:
+				# Interrupted, e. g. by a terminal resize
+				continue
 			except KeyboardInterrupt:
 				return False
-
-			if c == 27: # Escape -> Quit game
+			
+			if sys.stdin in r and not self.handle_keys():
 				return True
-			elif c == 110: # "n" = NitroSpeed
-				self.nitro()
-
-			if not self.collided:
-				self.change_direction(c)			# Change direction of player according to keypress
-				self.move_player()					# Move player
-				self.network.tell(self.x, self.y)	# Tell server new player position
+			if self.network.socket in r:
+				self.network.handle(bulk=True)
 			
-				# Add the new position to the gamepad dispatcher queue to 
-				# get the * drawn
-				self.gamepad.dispatcher_queue.put((self.x, self.y, '*'))
-
-				# Normalize speed depending on the direction
-				if self.direction in [curses.KEY_LEFT, curses.KEY_RIGHT]:
-					speed *= self.time_normalizer
+			now = time.time()
+			self.network.resend(now)
+			if self.timed() and now >= next_step:
+				next_step = max(next_step + self.step(), now - 1)
 			
-			with self.gamepad.draw_lock:
-				try:
-					stdscr.addstr(self.gamepad.height - 1, 5, 
-							 "Speed: %4d  Nitro tank: %3d%%" % 
-							 (100.0/speed, self.nitrotank))
-					stdscr.refresh()
-				except:
-					pass
-			time.sleep(speed)
+			if not self.spectator:
+				self.renderer.text(min(self.gamepad.height, self.HEIGHT) - 1, 5,
+								   "Speed: %4d  Nitro tank: %3d%%" % 
+								   (100000.0/self.speed, self.nitrotank))
+			self.draw_frame()
 
-		return True
\ No newline at end of file
+		return True
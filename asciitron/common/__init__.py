@@ -1,3 +1,8 @@
 # -*- coding: utf-8 -*-
 
-from protocol import *
\ No newline at end of file
+from protocol import *
+from buffers import OutputQueue, InputBuffer
+from grid import Grid
+from segments import Segments
+from codec import Encoder, Decoder, encode_v1, encode_event
+from datagram import DatagramDecoder, DatagramChannel
@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+
+"""
+Move choice of the AI players (serve --bots). Every direction a cycle can
+take is rated by a Voronoi split of the board around its head: the fields
+it reaches before any other cycle does (a flood fill from all heads at
+once, fields reached at the same time belong to nobody). Only a window of
+RADIUS fields around the head is looked at, so a decision costs the same on
+any board.
+
+With NumPy installed the flood fills of all directions run at once on
+boolean arrays, else in pure Python.
+"""
+
+from protocol import DIR_DELTA, DIR_OPPOSITE
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+RADIUS = 16 # fields around the head taken into account
+
+def window(board, x, y, radius):
+    """
+    The fields around x, y as a bytearray of size * size (size = 2 * radius
+    + 3), 0 = free. The border of the board (crashing like a trail) and the
+    outer ring of the window are blocked.
+    """
+    size = 2 * radius + 3
+    x0, y0 = x - radius - 1, y - radius - 1
+    cells = board.window(x0, y0, size, size)
+    blocked = bytearray([1]) * size
+    for column in (-x0, board.width - 1 - x0):
+        if 0 <= column < size:
+            cells[column::size] = blocked
+    for row in (-y0, board.height - 1 - y0):
+        if 0 <= row < size:
+            cells[row * size:(row + 1) * size] = blocked
+    cells[:size] = cells[-size:] = blocked
+    cells[::size] = cells[size - 1::size] = blocked
+    return cells
+
+def territories_python(cells, size, starts, heads, depth):
+    """
+    Fields won from every start (an index into cells) against the heads,
+    within depth steps.
+    """
+    offsets = (1, -1, size, -size)
+    result = []
+    for start in starts:
+        seen = bytearray(cells)
+        seen[start] = 1
+        # The others move at the same time as this step
+        theirs = set([j for i in heads for d in offsets for j in (i + d,)
+                      if not seen[j]])
+        theirs.discard(start)
+        for j in theirs:
+            seen[j] = 1
+        mine = [start]
+        won = 0
+        for _ in xrange(depth):
+            if not mine:
+                break
+            reached = set([j for i in mine for d in offsets for j in (i + d,)
+                           if not seen[j]])
+            taken = set([j for i in theirs for d in offsets for j in (i + d,)
+                         if not seen[j]])
+            for j in reached:
+                seen[j] = 1
+            for j in taken:
+                seen[j] = 1
+            contested = reached & taken
+            mine = reached - contested
+            theirs = taken - contested
+            won += len(mine)
+        result.append(won)
+    return result
+
+def dilate(fields):
+    """Fields next to the true ones of every layer (no wrap around)."""
+    result = numpy.zeros_like(fields)
+    result[:, 1:] |= fields[:, :-1]
+    result[:, :-1] |= fields[:, 1:]
+    result[:, :, 1:] |= fields[:, :, :-1]
+    result[:, :, :-1] |= fields[:, :, 1:]
+    return result
+
+def territories_numpy(cells, size, starts, heads, depth):
+    """Same as territories_python, one layer per start."""
+    count = len(starts)
+    free = numpy.frombuffer(bytes(cells), numpy.uint8).reshape(size, size) == 0
+    mine = numpy.zeros((count, size, size), bool)
+    for layer, start in enumerate(starts):
+        mine[layer, start // size, start % size] = True
+    theirs = numpy.zeros((count, size, size), bool)
+    for i in heads:
+        theirs[:, i // size, i % size] = True
+    seen = ~free | mine
+    theirs = dilate(theirs) & ~seen
+    seen |= theirs
+    won = numpy.zeros(count, int)
+    for _ in xrange(depth):
+        reached = dilate(mine) & ~seen
+        if not reached.any():
+            break
+        taken = dilate(theirs) & ~seen
+        seen |= reached | taken
+        mine = reached & ~taken
+        theirs = taken & ~reached
+        won += mine.sum(axis=(1, 2))
+    return won.tolist()
+
+def choose(board, x, y, direction, heads, radius=RADIUS, vectorized=None):
+    """
+    Returns the direction for the cycle at x, y which moved in direction
+    last: the one winning it the most fields, heads are the (x, y) of the
+    other cycles. Fields next to another head (which might take them, too)
+    are only chosen if nothing else is left. vectorized picks the
+    implementation, default: NumPy if installed.
+    """
+    if vectorized is None:
+        vectorized = numpy is not None
+    size = 2 * radius + 3
+    cells = window(board, x, y, radius)
+    center = (radius + 1) * size + radius + 1
+    others = []
+    for hx, hy in heads:
+        dx, dy = hx - x, hy - y
+        if -radius <= dx <= radius and -radius <= dy <= radius:
+            others.append(center + dy * size + dx)
+    near = set([i + d for i in others for d in (1, -1, size, -size)])
+
+    directions, starts = [], []
+    for d in (direction, (direction + 1) % 4, (direction + 2) % 4,
+              (direction + 3) % 4):
+        if d == DIR_OPPOSITE[direction]:
+            continue
+        dx, dy = DIR_DELTA[d]
+        start = center + dy * size + dx
+        if not cells[start]:
+            directions.append(d)
+            starts.append(start)
+    if not directions:
+        return direction # boxed in
+    if len(directions) == 1:
+        return directions[0]
+
+    territories = vectorized and territories_numpy or territories_python
+    won = territories(cells, size, starts, others, 2 * radius)
+    best = max(xrange(len(directions)),
+               key=lambda k: (starts[k] not in near, won[k], -k))
+    return directions[best]
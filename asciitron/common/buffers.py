@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+
+"""
+Connection buffers.
+"""
+
+import collections
+import struct
+
+class OutputQueue(object):
+    """
+    Outgoing data of one connection as a queue of chunks. Chunks are queued
+    by reference, so a broadcast frame shared by all players is never copied
+    per recipient; only the part of the head chunk already sent is skipped.
+    """
+
+    def __init__(self):
+        self.chunks = collections.deque()
+        self.offset = 0 # bytes of the head chunk already sent
+        self.size = 0 # bytes pending
+    
+    def __len__(self):
+        return self.size
+    
+    def append(self, chunk):
+        if not chunk:
+            return
+        self.chunks.append(chunk)
+        self.size += len(chunk)
+    
+    def peek(self, size=65536):
+        """
+        Returns pending data to send, at most size bytes unless the head chunk
+        is bigger. Small chunks at the head are joined (once) to save send
+        calls; a partially sent chunk is returned as a view, not a copy.
+        """
+        head = self.chunks[0]
+        if len(self.chunks) > 1 and len(head) - self.offset < size // 2:
+            parts = [self.offset and head[self.offset:] or head]
+            total = len(parts[0])
+            self.chunks.popleft()
+            while self.chunks and total + len(self.chunks[0]) <= size:
+                chunk = self.chunks.popleft()
+                parts.append(chunk)
+                total += len(chunk)
+            head = "".join(parts)
+            self.chunks.appendleft(head)
+            self.offset = 0
+        if self.offset:
+            return memoryview(head)[self.offset:]
+        return head
+    
+    def consume(self, count):
+        """Marks count bytes as sent."""
+        self.size -= count
+        while count:
+            left = len(self.chunks[0]) - self.offset
+            if count < left:
+                self.offset += count
+                break
+            count -= left
+            self.chunks.popleft()
+            self.offset = 0
+
+class InputBuffer(object):
+    """
+    Incoming data of one connection. Data is received straight into a
+    bytearray (recv_into) and packets are unpacked at a read offset
+    (struct.unpack_from), so parsing doesn't copy anything. Unparsed data is
+    moved to the front only when the free space at the end runs low.
+    """
+
+    def __init__(self, size=16384, recv_size=8192):
+        self.data = bytearray(size)
+        self.view = memoryview(self.data)
+        self.recv_size = recv_size
+        self.start = 0 # read offset
+        self.end = 0 # write offset
+    
+    def __len__(self):
+        return self.end - self.start
+    
+    def recv_from(self, sock, size=None):
+        """Receives up to size bytes from sock, returns the number of bytes."""
+        size = size or self.recv_size
+        if len(self.data) - self.end < size:
+            self.compact(size)
+        count = sock.recv_into(self.view[self.end:self.end + size], size)
+        self.end += count
+        return count
+    
+    def feed(self, data):
+        """Appends data which wasn't received from a socket (replays)."""
+        if len(self.data) - self.end < len(data):
+            self.compact(len(data))
+        self.data[self.end:self.end + len(data)] = data
+        self.end += len(data)
+    
+    def clear(self):
+        """Drops all data received so far."""
+        self.start = self.end = 0
+    
+    def peek_byte(self):
+        return self.data[self.start]
+    
+    def unpack(self, packet):
+        """Unpacks one packet of the struct.Struct packet."""
+        fields = packet.unpack_from(self.data, self.start)
+        self.start += packet.size
+        if self.start == self.end:
+            self.start = self.end = 0
+        return fields
+    
+    def unpack_all(self, packet):
+        """Unpacks all complete packets of the struct.Struct packet."""
+        size = packet.size
+        count = (self.end - self.start) // size
+        unpack, data, start = packet.unpack_from, self.data, self.start
+        packets = [unpack(data, start + i * size) for i in xrange(count)]
+        self.start += count * size
+        if self.start == self.end:
+            self.start = self.end = 0
+        return packets
+    
+    def compact(self, free):
+        pending = self.end - self.start
+        if pending + free > len(self.data):
+            # Too small, grow
+            data = bytearray(max(2 * len(self.data), pending + free))
+            data[:pending] = self.view[self.start:self.end]
+            self.data = data
+            self.view = memoryview(data)
+        elif self.start:
+            self.data[:pending] = self.data[self.start:self.end]
+        self.start = 0
+        self.end = pending
@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+
+"""
+Encoding and decoding of server -> client records (v1 and v2, see
+protocol.py). Decoded records always look like v1 records:
+
+    (player-no, cmd-no, x, y, speed, nitrotank, misc)
+"""
+
+from protocol import *
+
+DELTA_DIR = dict((delta, direction) for direction, delta in DIR_DELTA.items())
+
+def encode_v1(events, speed=KEEP_SPEED, nitrotank=KEEP_NITRO):
+    """
+    The v1 records of events. A client before v2 takes the speed and nitro
+    tank of every record as its own: pass the recipient's for those.
+    """
+    pack = PACKET_TOPLAYER.pack
+    return "".join([pack(player_id, cmd, x, y, speed, nitrotank, misc)
+                    for player_id, cmd, x, y, misc in events])
+
+class Encoder(object):
+    """
+    Encodes broadcast events (player-no, cmd-no, x, y, misc) for v2
+    recipients. Positions are sent as MSG_STEP if the player moved by one
+    field, which requires every v2 recipient to get the same stream of
+    frames; the known positions are dropped at every game start (cmd 1).
+    """
+
+    def __init__(self):
+        self.positions = {} # player-no -> (x, y)
+
+    def encode(self, events, track_only=False):
+        """
+        Returns the v2 frame of events. With track_only the positions are
+        updated but nothing is encoded (nobody speaks v2 right now).
+        """
+        out = []
+        positions = self.positions
+        for player_id, cmd, x, y, misc in events:
+            if cmd == 2 and 0 < player_id < 64:
+                last = positions.get(player_id)
+                positions[player_id] = (x, y)
+                if track_only:
+                    continue
+                if last is not None:
+                    direction = DELTA_DIR.get((x - last[0], y - last[1]))
+                    if direction is not None:
+                        out.append(PACKET_STEP.pack(MSG_STEP,
+                                                    player_id << 2 | direction))
+                        continue
+                out.append(PACKET_POS.pack(MSG_POS, player_id, x, y))
+            else:
+                if cmd == 1:
+                    positions.clear()
+                if not track_only:
+                    out.append(PACKET_EVENT.pack(MSG_EVENT, cmd, player_id,
+                                                 x, y, misc))
+        return "".join(out)
+
+    def snapshot(self):
+        """Absolute positions of all players (for new v2 recipients)."""
+        return "".join([PACKET_POS.pack(MSG_POS, player_id, x, y)
+                        for player_id, (x, y) in self.positions.items()])
+
+def encode_event(player_id, cmd, x, y, misc=0):
+    """A single v2 record which doesn't touch the position tracking."""
+    return PACKET_EVENT.pack(MSG_EVENT, cmd, player_id, x, y, misc)
+
+MESSAGES = {
+    MSG_EVENT: PACKET_EVENT,
+    MSG_POS: PACKET_POS,
+    MSG_STEP: PACKET_STEP,
+    MSG_SPEED: PACKET_SPEED,
+    MSG_NITRO: PACKET_NITRO,
+}
+
+class Decoder(object):
+    """
+    Decodes the records of an InputBuffer, switching from v1 to v2 when the
+    server confirms it (cmd 15).
+    """
+
+    def __init__(self):
+        self.version = 1
+        self.positions = {} # player-no -> (x, y), v2 only
+
+    def decode(self, buf):
+        packets = []
+        while len(buf):
+            if self.version == 1:
+                if len(buf) < PACKET_TOPLAYER.size:
+                    break
+                packet = buf.unpack(PACKET_TOPLAYER)
+                if packet[1] == 15:
+                    self.version = packet[2]
+                packets.append(packet)
+                continue
+
+            kind = buf.peek_byte()
+            message = MESSAGES.get(kind)
+            if message is None:
+                raise ValueError("Unknown message type %d" % kind)
+            if len(buf) < message.size:
+                break
+            fields = buf.unpack(message)
+
+            if kind == MSG_STEP:
+                player_id, direction = fields[1] >> 2, fields[1] & 3
+                x, y = self.positions.get(player_id, (0, 0))
+                dx, dy = DIR_DELTA[direction]
+                x, y = x + dx, y + dy
+                self.positions[player_id] = (x, y)
+                packets.append((player_id, 2, x, y, KEEP_SPEED, KEEP_NITRO, 0))
+            elif kind == MSG_POS:
+                _, player_id, x, y = fields
+                self.positions[player_id] = (x, y)
+                packets.append((player_id, 2, x, y, KEEP_SPEED, KEEP_NITRO, 0))
+            elif kind == MSG_EVENT:
+                _, cmd, player_id, x, y, misc = fields
+                if cmd == 1:
+                    self.positions.clear()
+                packets.append((player_id, cmd, x, y, KEEP_SPEED, KEEP_NITRO,
+                                misc))
+            elif kind == MSG_SPEED:
+                packets.append((0, 20, fields[1], 0, fields[1], KEEP_NITRO, 0))
+            elif kind == MSG_NITRO:
+                packets.append((0, 21, fields[1], 0, KEEP_SPEED, fields[1], 0))
+        return packets
@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+
+"""
+Client end of the UDP transport (see protocol.py and server/datagram.py).
+
+Positions and the own speed/nitro tank are sent unreliably, newest wins:
+a lost datagram is made up by the next ones, which repeat the last
+positions of every player. Events (game start, crash, win, disconnect, ...)
+carry a sequence number, are acknowledged and handled in order.
+"""
+
+import errno
+import socket
+import struct
+import time
+
+from protocol import *
+
+RESEND = .1 # seconds until unacknowledged records are sent again
+SILENCE = 15 # seconds without a datagram until the server counts as gone
+RECORDS = 64 # client records per datagram at most
+
+class DatagramDecoder(object):
+    """
+    Decodes server datagrams into records like Decoder. Events are handed
+    out once and in order (later ones wait for a lost one), positions only
+    if they are newer than the last one of their player and no event which
+    happened after them (game start, removal of the player) was handled.
+    """
+
+    def __init__(self):
+        self.delivered = 0 # events handled, in order
+        self.pending = {} # event seq -> record, waiting for a lost one
+        self.latest = 0 # highest datagram sequence number seen
+        self.ack = 0 # our records the server has
+        self.steps = {} # player-no -> number of its last position shown
+        self.started_at = 0 # event seq of the last game start
+        self.removed_at = {} # player-no -> event seq of its removal
+        self.reliable = False # the last datagram had events, ack them
+
+    def decode(self, data):
+        seq, ack = DGRAM_TOPLAYER.unpack_from(data)
+        newest = seq > self.latest
+        if newest:
+            self.latest = seq
+        self.ack = max(self.ack, ack)
+        self.reliable = False
+        packets = []
+        offset = DGRAM_TOPLAYER.size
+        size = len(data)
+        while offset < size:
+            kind = ord(data[offset])
+            if kind == MSG_RELIABLE:
+                event_seq = PACKET_RELIABLE.unpack_from(data, offset)[1]
+                offset += PACKET_RELIABLE.size
+                fields = PACKET_EVENT.unpack_from(data, offset)
+                offset += PACKET_EVENT.size
+                self.reliable = True
+                if event_seq > self.delivered:
+                    self.pending[event_seq] = fields
+                while self.delivered + 1 in self.pending:
+                    self.delivered += 1
+                    packets.append(self.event(self.pending.pop(self.delivered)))
+            elif kind == MSG_TRAIL:
+                _, player_id, after, first, count = \
+                    PACKET_TRAIL.unpack_from(data, offset)
+                offset += PACKET_TRAIL.size
+                coords = struct.unpack_from("!%dh" % (count * 2), data, offset)
+                offset += count * 4
+                if after > self.delivered or after < self.started_at or \
+                    after < self.removed_at.get(player_id, 0):
+                    continue
+                last = self.steps.get(player_id, 0)
+                for i in xrange(max(0, last - first + 1), count):
+                    packets.append((player_id, 2, coords[i * 2],
+                                    coords[i * 2 + 1], KEEP_SPEED, KEEP_NITRO,
+                                    0))
+                self.steps[player_id] = max(last, first + count - 1)
+            elif kind == MSG_SPEED:
+                speed = PACKET_SPEED.unpack_from(data, offset)[1]
+                offset += PACKET_SPEED.size
+                if newest:
+                    packets.append((0, 20, speed, 0, speed, KEEP_NITRO, 0))
+            elif kind == MSG_NITRO:
+                nitrotank = PACKET_NITRO.unpack_from(data, offset)[1]
+                offset += PACKET_NITRO.size
+                if newest:
+                    packets.append((0, 21, nitrotank, 0, KEEP_SPEED,
+                                    nitrotank, 0))
+            else:
+                raise ValueError("Unknown message type %d" % kind)
+        return packets
+
+    def event(self, fields):
+        _, cmd, player_id, x, y, misc = fields
+        if cmd == 1:
+            self.started_at = self.delivered
+            self.steps.clear()
+            self.removed_at.clear()
+        elif cmd == 5:
+            self.removed_at[player_id] = self.delivered
+        return (player_id, cmd, x, y, KEEP_SPEED, KEEP_NITRO, misc)
+
+class DatagramChannel(object):
+    """
+    UDP socket to the server: every datagram repeats all records the server
+    hasn't acknowledged yet (RESEND seconds after the last one at the
+    latest) and acknowledges the events received.
+    """
+
+    def __init__(self, host, port):
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.connect((host, port))
+        self.socket.setblocking(0)
+        self.decoder = DatagramDecoder()
+        self.records = [] # (seq, record) not acknowledged yet
+        self.seq = 0 # of the last record
+        self.sent_at = 0
+        self.heard_at = time.time()
+        self.answered = False # the server has sent a datagram
+        self.bytes_in = 0
+        self.closed = False
+
+    def fileno(self):
+        return self.socket.fileno()
+
+    def open(self):
+        """
+        Says hello (again every RESEND seconds until the server answers
+        with its own, cmd 0).
+        """
+        return self.transmit()
+
+    def send(self, cmd, x, y, misc=0):
+        self.seq += 1
+        self.records.append((self.seq, PACKET_TOSERVER.pack(cmd, x, y, misc)))
+        return self.transmit()
+
+    def transmit(self):
+        records = self.records[:RECORDS]
+        first = records and records[0][0] or self.seq + 1
+        data = DGRAM_TOSERVER.pack(DGRAM_DATA, self.decoder.delivered, first)
+        try:
+            self.socket.send(data + "".join([r for s, r in records]))
+        except socket.error, e:
+            if e.args[0] not in (errno.EAGAIN, errno.EWOULDBLOCK,
+                                 errno.ENOBUFS):
+                return False
+        self.sent_at = time.time()
+        return True
+
+    def receive(self):
+        """
+        Returns the records of the datagrams waiting, None if the server is
+        gone (or sent garbage).
+        """
+        packets = []
+        heard = reliable = False
+        while True:
+            try:
+                data = self.socket.recv(65536)
+            except socket.error, e:
+                if e.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    break
+                return None
+            if len(data) < DGRAM_TOPLAYER.size:
+                continue
+            heard = True
+            self.bytes_in += len(data)
+            try:
+                packets.extend(self.decoder.decode(data))
+            except (ValueError, struct.error):
+                return None
+            reliable = reliable or self.decoder.reliable
+        ack = self.decoder.ack
+        while self.records and self.records[0][0] <= ack:
+            self.records.pop(0)
+        if heard:
+            self.heard_at = time.time()
+            self.answered = True
+        if reliable and not self.transmit():
+            # Events are acknowledged right away
+            return None
+        return packets
+
+    def timeout(self, now):
+        """Seconds until resend() has something to do."""
+        wait = self.heard_at + SILENCE - now
+        if self.records or not self.answered:
+            wait = min(wait, self.sent_at + RESEND - now)
+        return max(0, wait)
+
+    def resend(self, now):
+        """Resends the records if due, False if the server is gone."""
+        if (self.records or not self.answered) and \
+            now >= self.sent_at + RESEND:
+            if not self.transmit():
+                return False
+        return now - self.heard_at < SILENCE
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            self.socket.send(DGRAM_TOSERVER.pack(DGRAM_BYE,
+                                                 self.decoder.delivered, 0))
+        except socket.error:
+            pass
+        self.socket.close()
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+
+"""
+Occupancy map of the board.
+"""
+
+import array
+
+OUTSIDE = 255 # in window(), fields off the board
+
+class Grid(object):
+    """
+    One byte per field of a width x height board, indexed by y * width + x,
+    holding the id of the player whose trail covers it (0 = free).
+    """
+
+    def __init__(self, width, height):
+        self.width = max(width, 0)
+        self.height = max(height, 0)
+        self.cells = bytearray(self.width * self.height)
+        self.count = 0 # occupied fields
+
+    def __len__(self):
+        return self.count
+
+    def inside(self, x, y):
+        return 0 <= x < self.width and 0 <= y < self.height
+
+    def get(self, x, y):
+        """Returns the player id at x, y (0 = free or outside the board)."""
+        if 0 <= x < self.width and 0 <= y < self.height:
+            return self.cells[y * self.width + x]
+        return 0
+
+    def set(self, x, y, player_id):
+        """
+        Occupies x, y for player_id (0 frees it again); fields outside the
+        board are ignored.
+        """
+        if 0 <= x < self.width and 0 <= y < self.height:
+            i = y * self.width + x
+            if not self.cells[i]:
+                self.count += 1
+            if not player_id:
+                self.count -= 1
+            self.cells[i] = player_id
+
+    def occupy(self, x, y, player_id):
+        """Occupies the free field x, y (no checks, hot path)."""
+        self.cells[y * self.width + x] = player_id
+        self.count += 1
+
+    def window(self, x0, y0, width, height):
+        """
+        Returns the width x height fields from x0, y0 on, row by row, as a
+        bytearray of player ids (0 = free, OUTSIDE = off the board).
+        """
+        result = bytearray([OUTSIDE]) * (width * height)
+        left, right = max(x0, 0), min(x0 + width, self.width)
+        if left >= right:
+            return result
+        cells = self.cells
+        for y in xrange(max(y0, 0), min(y0 + height, self.height)):
+            i = (y - y0) * width + left - x0
+            j = y * self.width
+            result[i:i + right - left] = cells[j + left:j + right]
+        return result
+
+    def trails(self, x0, y0, width, height):
+        """
+        Returns the occupied fields from x0, y0 on within width x height as
+        (player id, x, y), row by row.
+        """
+        result = []
+        cells = self.cells
+        left, right = max(x0, 0), min(x0 + width, self.width)
+        for y in xrange(max(y0, 0), min(y0 + height, self.height)):
+            offset = y * self.width
+            for x in xrange(left, right):
+                player_id = cells[offset + x]
+                if player_id:
+                    result.append((player_id, x, y))
+        return result
+
+    def fields(self, player_id):
+        """Returns all (x, y) occupied by player_id."""
+        width = self.width
+        return [(i % width, i // width) for i in self.indexes(player_id)]
+
+    def indexes(self, player_id):
+        """Returns the fields of player_id as y * width + x, in an array."""
+        result = array.array('i')
+        cells, value = self.cells, chr(player_id)
+        i = cells.find(value)
+        while i != -1:
+            result.append(i)
+            i = cells.find(value, i + 1)
+        return result
+
+    def clear_player(self, player_id):
+        """Frees every field of player_id at once."""
+        table = bytearray(xrange(256))
+        table[player_id] = 0
+        before = self.cells.count(chr(player_id))
+        self.cells[:] = self.cells.translate(table)
+        self.count -= before
+
+    def clear(self):
+        self.cells[:] = bytearray(len(self.cells))
+        self.count = 0
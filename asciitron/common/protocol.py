@@ -29,5 +29,69 @@ import struct
 FMT_TOPLAYER = "hhiihBh" # player-no, cmd-no, x, y, speed, nitrotank, misc
 FMT_SIZE_TOPLAYER = struct.calcsize(FMT_TOPLAYER)
 
+# Speed/nitrotank values of records broadcast to all players; the receiver's
+# own values are unchanged (they are sent in a cmd 20 record of its own)
+KEEP_SPEED = -1
+KEEP_NITRO = 255
+
 FMT_TOSERVER = "hiih" # cmd-no, x, y, misc
 FMT_SIZE_TOSERVER = struct.calcsize(FMT_TOSERVER)
+
+PACKET_TOPLAYER = struct.Struct(FMT_TOPLAYER)
+PACKET_TOSERVER = struct.Struct(FMT_TOSERVER)
+
+MAX_PLAYER_ID = 63 # player-no 1..63 (MSG_STEP has 6 bits for it)
+
+# Directions (cmd 22, server-authoritative mode)
+DIR_LEFT, DIR_RIGHT, DIR_UP, DIR_DOWN = range(4)
+DIR_DELTA = {
+    DIR_LEFT: (-1, 0),
+    DIR_RIGHT: (1, 0),
+    DIR_UP: (0, -1),
+    DIR_DOWN: (0, 1),
+}
+DIR_OPPOSITE = {
+    DIR_LEFT: DIR_RIGHT,
+    DIR_RIGHT: DIR_LEFT,
+    DIR_UP: DIR_DOWN,
+    DIR_DOWN: DIR_UP,
+}
+
+# Protocol versions: the server announces its version in the misc field of
+# the hello (cmd 0), a v2 client answers with cmd 1 (x = version) before its
+# own hello and the server confirms with cmd 15 (x = version) in v1 format.
+# Everything after the confirmation uses the v2 messages below, network
+# byte order, each starting with its type byte. Client -> server packets
+# stay FMT_TOSERVER.
+PROTOCOL_VERSION = 2
+
+MSG_EVENT = 0 # type, cmd-no, player-no, x, y, misc (any command)
+MSG_POS = 1 # type, player-no, x, y (cmd 2, absolute position)
+MSG_STEP = 2 # type, player-no << 2 | direction (cmd 2, one field further)
+MSG_SPEED = 3 # type, speed (own speed changed)
+MSG_NITRO = 4 # type, nitrotank (own nitro tank changed)
+
+PACKET_EVENT = struct.Struct("!BBhhhh")
+PACKET_POS = struct.Struct("!BBhh")
+PACKET_STEP = struct.Struct("!BB")
+PACKET_SPEED = struct.Struct("!Bh")
+PACKET_NITRO = struct.Struct("!BB")
+
+# UDP transport (serve/connect --udp): every datagram starts with a header,
+# then carries records. Client -> server: (kind, events received in order,
+# sequence number of its first record), then FMT_TOSERVER records with
+# consecutive sequence numbers; all of them are resent until acknowledged.
+# Server -> client: (datagram sequence number, client records received in
+# order), then the v2 records below plus MSG_SPEED and MSG_NITRO.
+DGRAM_DATA = 0
+DGRAM_BYE = 1 # client is gone
+
+DGRAM_TOSERVER = struct.Struct("!BII")
+DGRAM_TOPLAYER = struct.Struct("!II")
+
+MSG_RELIABLE = 5 # type, event sequence number; a MSG_EVENT record follows
+MSG_TRAIL = 6 # type, player-no, last event seq before the positions, number
+              # of the first position in the game, count; count (x, y) follow
+
+PACKET_RELIABLE = struct.Struct("!BI")
+PACKET_TRAIL = struct.Struct("!BBIIH")
@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+
+"""
+Game recordings (serve --record, replay): an append-only file per room.
+
+    header    "ATRC", version (B), start time (d, seconds since the epoch)
+    records   type (B), ms since the start (I), payload length (I), payload
+    trailer   offset of the index record (I), "ATRI"
+
+REC_FRAME records hold the protocol v2 frames the room broadcast (their
+MSG_STEP positions continue from the previous frame). Every few seconds a
+REC_SNAPSHOT holds the board (width, height, authoritative flag, the known
+positions as MSG_POS records, then the zlib compressed trails: player id,
+field count, map indexes), from where a replay can start without the frames
+before. The REC_INDEX record lists (ms, offset) of all snapshots; it and the
+trailer are written when the recording is closed, recordings cut short are
+indexed by a scan.
+"""
+
+import array
+import struct
+import sys
+import zlib
+
+MAGIC = "ATRC"
+INDEX_MAGIC = "ATRI"
+RECORDING_VERSION = 1
+
+REC_FRAME = 0
+REC_SNAPSHOT = 1
+REC_INDEX = 2
+
+HEADER = struct.Struct("!4sBd")
+RECORD = struct.Struct("!BII")
+SNAPSHOT = struct.Struct("!hhBI") # width, height, authoritative, positions size
+TRAIL = struct.Struct("!BI") # player id, fields
+INDEX_ENTRY = struct.Struct("!II")
+TRAILER = struct.Struct("!I4s")
+
+def pack_record(kind, ms, payload):
+    return RECORD.pack(kind, ms, len(payload)) + payload
+
+def pack_snapshot(width, height, authoritative, positions, trails):
+    """
+    positions: MSG_POS records, trails: (player id, map indexes as an
+    array('i') string) pairs.
+    """
+    parts = []
+    for player_id, indexes in trails:
+        fields = array.array('i', indexes)
+        if sys.byteorder == 'little':
+            fields.byteswap()
+        parts.append(TRAIL.pack(player_id, len(fields)))
+        parts.append(fields.tostring())
+    return SNAPSHOT.pack(width, height, int(authoritative), len(positions)) + \
+        positions + zlib.compress("".join(parts), 1)
+
+def unpack_snapshot(payload):
+    """
+    Returns (width, height, authoritative, positions, trails), trails maps
+    the player ids to lists of map indexes.
+    """
+    width, height, authoritative, size = SNAPSHOT.unpack_from(payload)
+    start = SNAPSHOT.size
+    positions = payload[start:start + size]
+    data = zlib.decompress(payload[start + size:])
+    trails = {}
+    offset = 0
+    while offset < len(data):
+        player_id, count = TRAIL.unpack_from(data, offset)
+        offset += TRAIL.size
+        fields = array.array('i', data[offset:offset + count * 4])
+        if sys.byteorder == 'little':
+            fields.byteswap()
+        trails[player_id] = fields.tolist()
+        offset += count * 4
+    return width, height, bool(authoritative), positions, trails
+
+class Recording(object):
+    """A recording file read into memory."""
+
+    def __init__(self, filename):
+        f = open(filename, "rb")
+        try:
+            self.data = f.read()
+        finally:
+            f.close()
+        if len(self.data) < HEADER.size:
+            raise ValueError("%s is no recording" % filename)
+        magic, version, self.started = HEADER.unpack_from(self.data)
+        if magic != MAGIC or version != RECORDING_VERSION:
+            raise ValueError("%s is no version %d recording" %
+                             (filename, RECORDING_VERSION))
+        self.end = len(self.data)
+        self.snapshots = self.read_index()
+        if self.snapshots is None:
+            self.snapshots = [(ms, offset) for kind, ms, payload, offset in
+                              self.records() if kind == REC_SNAPSHOT]
+
+    def read_index(self):
+        """(ms, offset) of the snapshots from the index, None if missing."""
+        if len(self.data) < HEADER.size + TRAILER.size:
+            return None
+        offset, magic = TRAILER.unpack_from(self.data,
+                                            len(self.data) - TRAILER.size)
+        if magic != INDEX_MAGIC or offset >= len(self.data):
+            return None
+        kind, ms, size = RECORD.unpack_from(self.data, offset)
+        if kind != REC_INDEX:
+            return None
+        self.end = offset
+        start = offset + RECORD.size
+        return [INDEX_ENTRY.unpack_from(self.data, start + i)
+                for i in xrange(0, size, INDEX_ENTRY.size)]
+
+    def duration(self):
+        """ms of the last record."""
+        last = 0
+        for kind, ms, payload, offset in self.records(self.seek(None)):
+            last = ms
+        return last
+
+    def seek(self, ms):
+        """Offset to start at to replay from ms on (the latest snapshot)."""
+        offset = HEADER.size
+        for snapshot_ms, snapshot_offset in self.snapshots:
+            if ms is None or snapshot_ms <= ms:
+                offset = snapshot_offset
+            else:
+                break
+        return offset
+
+    def records(self, offset=HEADER.size):
+        """Yields (type, ms, payload, offset) from offset on."""
+        data, end = self.data, self.end
+        while offset + RECORD.size <= end:
+            kind, ms, size = RECORD.unpack_from(data, offset)
+            start = offset + RECORD.size
+            if start + size > end:
+                break # cut short
+            yield kind, ms, data[start:start + size], offset
+            offset = start + size
@@ -0,0 +1,277 @@
+# -*- coding: utf-8 -*-
+
+"""
+Occupancy map storing the trails as runs.
+"""
+
+import array
+from bisect import bisect_right
+
+from grid import OUTSIDE
+
+class Line(object):
+    """
+    Runs of one row or column: their first and last field and owner, sorted
+    by the first field (the interval index, runs never overlap).
+    """
+
+    __slots__ = ('starts', 'ends', 'owners')
+
+    def __init__(self):
+        self.starts = array.array('H')
+        self.ends = array.array('H')
+        self.owners = array.array('B')
+
+    def find(self, pos):
+        """Returns the index of the run covering pos, -1 if none."""
+        k = bisect_right(self.starts, pos) - 1
+        if k >= 0 and self.ends[k] >= pos:
+            return k
+        return -1
+
+    def insert(self, start, end, owner):
+        k = bisect_right(self.starts, start)
+        self.starts.insert(k, start)
+        self.ends.insert(k, end)
+        self.owners.insert(k, owner)
+
+    def delete(self, k):
+        del self.starts[k]
+        del self.ends[k]
+        del self.owners[k]
+
+    def __len__(self):
+        return len(self.starts)
+
+class Segments(object):
+    """
+    Same interface as Grid, but a trail is kept as its straight runs (the
+    polyline between its turns): every row and column has a Line of the
+    horizontal resp. vertical runs in it. A step next to the head of the
+    trail in the direction of its run extends that run, any other step
+    starts a new one, so the memory grows with the turns, not with the
+    board or the fields travelled. A field is looked up by bisecting its
+    row and its column.
+    """
+
+    def __init__(self, width, height):
+        self.width = max(width, 0)
+        self.height = max(height, 0)
+        self.rows = {} # y -> Line of horizontal runs
+        self.columns = {} # x -> Line of vertical runs
+        self.heads = {} # player id -> (x, y, run is vertical)
+        self.count = 0 # occupied fields
+
+    def __len__(self):
+        return self.count
+
+    def runs(self):
+        return sum(len(line) for lines in (self.rows, self.columns)
+                   for line in lines.itervalues())
+
+    def inside(self, x, y):
+        return 0 <= x < self.width and 0 <= y < self.height
+
+    def get(self, x, y):
+        """Returns the player id at x, y (0 = free or outside the board)."""
+        line = self.rows.get(y)
+        if line is not None:
+            k = line.find(x)
+            if k != -1:
+                return line.owners[k]
+        line = self.columns.get(x)
+        if line is not None:
+            k = line.find(y)
+            if k != -1:
+                return line.owners[k]
+        return 0
+
+    def set(self, x, y, player_id):
+        """
+        Occupies x, y for player_id (0 frees it again); fields outside the
+        board and fields player_id holds already are ignored.
+        """
+        if not (0 <= x < self.width and 0 <= y < self.height):
+            return
+        owner = self.get(x, y)
+        if owner == player_id:
+            return # e.g. the server's echo of our own step, keeps the run
+        if owner:
+            self.free(x, y)
+        if player_id:
+            self.occupy(x, y, player_id)
+
+    def occupy(self, x, y, player_id):
+        """Occupies the free field x, y (no checks, hot path)."""
+        self.count += 1
+        head = self.heads.get(player_id)
+        if head is not None:
+            hx, hy, vertical = head
+            if y == hy and not vertical and (x == hx + 1 or x == hx - 1):
+                if self.extend(self.rows.get(y), hx, x, player_id):
+                    self.heads[player_id] = (x, y, False)
+                    return
+            elif x == hx and (y == hy + 1 or y == hy - 1):
+                line = self.columns.get(x)
+                if vertical and self.extend(line, hy, y, player_id):
+                    self.heads[player_id] = (x, y, True)
+                    return
+                # A turn: the new run is vertical from the start
+                if line is None:
+                    line = self.columns[x] = Line()
+                line.insert(y, y, player_id)
+                self.heads[player_id] = (x, y, True)
+                return
+        line = self.rows.get(y)
+        if line is None:
+            line = self.rows[y] = Line()
+        line.insert(x, x, player_id)
+        self.heads[player_id] = (x, y, False)
+
+    def extend(self, line, head, pos, player_id):
+        """Grows the run ending at head to pos, False if it is gone."""
+        if line is None:
+            return False
+        k = line.find(head)
+        if k == -1 or line.owners[k] != player_id:
+            return False
+        if pos > head and line.ends[k] == head:
+            line.ends[k] = pos
+        elif pos < head and line.starts[k] == head:
+            line.starts[k] = pos
+        else:
+            return False
+        return True
+
+    def free(self, x, y):
+        """Frees x, y, splitting the run covering it."""
+        for lines, key, pos in ((self.rows, y, x), (self.columns, x, y)):
+            line = lines.get(key)
+            if line is None:
+                continue
+            k = line.find(pos)
+            if k == -1:
+                continue
+            start, end, owner = line.starts[k], line.ends[k], line.owners[k]
+            line.delete(k)
+            if start < pos:
+                line.insert(start, pos - 1, owner)
+            if pos < end:
+                line.insert(pos + 1, end, owner)
+            if not line:
+                del lines[key]
+            self.count -= 1
+            return
+
+    def window(self, x0, y0, width, height):
+        """
+        Returns the width x height fields from x0, y0 on, row by row, as a
+        bytearray of player ids (0 = free, OUTSIDE = off the board).
+        """
+        result = bytearray([OUTSIDE]) * (width * height)
+        left, right = max(x0, 0), min(x0 + width, self.width)
+        top, bottom = max(y0, 0), min(y0 + height, self.height)
+        if left >= right or top >= bottom:
+            return result
+        for y in xrange(top, bottom):
+            i = (y - y0) * width - x0
+            result[i + left:i + right] = bytearray(right - left)
+        # Horizontal runs: a slice of the row
+        for y in xrange(top, bottom):
+            line = self.rows.get(y)
+            if line is None:
+                continue
+            i = (y - y0) * width - x0
+            k = max(bisect_right(line.starts, left) - 1, 0)
+            while k < len(line) and line.starts[k] < right:
+                start, end = max(line.starts[k], left), min(line.ends[k] + 1,
+                                                            right)
+                if start < end:
+                    result[i + start:i + end] = \
+                        bytearray([line.owners[k]]) * (end - start)
+                k += 1
+        # Vertical runs: every width-th field
+        for x in xrange(left, right):
+            line = self.columns.get(x)
+            if line is None:
+                continue
+            k = max(bisect_right(line.starts, top) - 1, 0)
+            while k < len(line) and line.starts[k] < bottom:
+                start, end = max(line.starts[k], top), min(line.ends[k] + 1,
+                                                           bottom)
+                if start < end:
+                    i = (start - y0) * width + x - x0
+                    result[i:i + (end - start - 1) * width + 1:width] = \
+                        bytearray([line.owners[k]]) * (end - start)
+                k += 1
+        return result
+
+    def trails(self, x0, y0, width, height):
+        """
+        Returns the occupied fields from x0, y0 on within width x height as
+        (player id, x, y), run by run (neighbours follow each other).
+        """
+        result = []
+        left, right = max(x0, 0), min(x0 + width, self.width)
+        top, bottom = max(y0, 0), min(y0 + height, self.height)
+        for lines, first, last, low, high, vertical in (
+                (self.rows, top, bottom, left, right, False),
+                (self.columns, left, right, top, bottom, True)):
+            for key in xrange(first, last):
+                line = lines.get(key)
+                if line is None:
+                    continue
+                k = max(bisect_right(line.starts, low) - 1, 0)
+                while k < len(line) and line.starts[k] < high:
+                    owner = line.owners[k]
+                    for pos in xrange(max(line.starts[k], low),
+                                      min(line.ends[k] + 1, high)):
+                        if vertical:
+                            result.append((owner, key, pos))
+                        else:
+                            result.append((owner, pos, key))
+                    k += 1
+        return result
+
+    def fields(self, player_id):
+        """Returns all (x, y) occupied by player_id."""
+        return [(i % self.width, i // self.width)
+                for i in self.indexes(player_id)]
+
+    def indexes(self, player_id):
+        """Returns the fields of player_id as y * width + x, in an array."""
+        result = array.array('i')
+        width = self.width
+        for y, line in self.rows.iteritems():
+            for k, owner in enumerate(line.owners):
+                if owner == player_id:
+                    offset = y * width
+                    result.extend(xrange(offset + line.starts[k],
+                                         offset + line.ends[k] + 1))
+        for x, line in self.columns.iteritems():
+            for k, owner in enumerate(line.owners):
+                if owner == player_id:
+                    result.extend(xrange(line.starts[k] * width + x,
+                                         line.ends[k] * width + x + 1,
+                                         width))
+        return result
+
+    def clear_player(self, player_id):
+        """Frees every field of player_id at once."""
+        for lines in (self.rows, self.columns):
+            for key, line in lines.items():
+                if player_id not in line.owners:
+                    continue
+                for k in xrange(len(line) - 1, -1, -1):
+                    if line.owners[k] == player_id:
+                        self.count -= line.ends[k] - line.starts[k] + 1
+                        line.delete(k)
+                if not line:
+                    del lines[key]
+        self.heads.pop(player_id, None)
+
+    def clear(self):
+        self.rows = {}
+        self.columns = {}
+        self.heads = {}
+        self.count = 0
@@ -1,3 +1,6 @@
 # -*- coding: utf-8 -*-
 
-from tronserver import TronServer
\ No newline at end of file
+from tronserver import TronServer
+from aioserver import AsyncioServer
+from supervisor import Supervisor
+from log import logger
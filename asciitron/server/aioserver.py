@@ -0,0 +1,231 @@
+# -*- coding: utf-8 -*-
+
+"""
+The game served from an asyncio event loop (serve --engine asyncio) instead
+of the TronServer's own loop: every connection is a Protocol, the timers
+run on the loop. Other asyncio services can share the loop, see
+AsyncioServer(loop=...).
+
+On Python 2 trollius, the backport of asyncio, is used; with uvloop
+installed its loop is taken.
+"""
+
+import time
+
+try:
+    import asyncio
+except ImportError:
+    try:
+        import trollius as asyncio
+    except ImportError:
+        asyncio = None
+
+from game import GameServer
+from metrics import http_response
+from timers import Timer
+from tronserver import listen
+from log import logger
+
+Protocol = asyncio is not None and asyncio.Protocol or object
+
+def new_loop():
+    """uvloop's event loop if it is installed, else asyncio's."""
+    try:
+        import uvloop
+    except ImportError:
+        return asyncio.new_event_loop()
+    return uvloop.new_event_loop()
+
+class LoopTimers(object):
+    """Timers (see timers.py) scheduled on the event loop."""
+
+    def __init__(self, server):
+        self.server = server
+
+    def call_at(self, when, callback, *args):
+        """Calls callback(*args) once at time when, returns the Timer."""
+        timer = Timer(when, callback, args)
+        self.server.loop.call_later(max(0, when - time.time()), self.fire,
+                                    timer)
+        return timer
+
+    def fire(self, timer):
+        if timer.cancelled:
+            return
+        timer.cancelled = True # done, cancel() doesn't matter anymore
+        timer.callback(*timer.args)
+        self.server.end_turn_soon()
+
+class ProtocolConnection(Protocol):
+    """
+    Connection of an AsyncioServer (see game.py). The output queue is
+    handed over to the transport at the end of the turn; while the transport
+    has more than its high-water mark buffered (pause_writing) the data
+    stays in the queue, where the backpressure of the Player sees it.
+    """
+
+    def __init__(self, server):
+        self.server = server
+        self.transport = None
+        self.address = None
+        self.handler = None # Player or Spectator
+        self.paused = False
+        self.closed = False
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.address = transport.get_extra_info('peername')
+        self.server.connected(self)
+        self.server.end_turn_soon()
+
+    def data_received(self, data):
+        self.handler.buf_in.feed(data)
+        self.handler.received(len(data))
+        room = self.handler.room
+        if room is not None:
+            self.server.dirty.add(room)
+        self.server.end_turn_soon()
+
+    def connection_lost(self, exc):
+        if not self.closed:
+            self.closed = True
+            self.handler.remove()
+            self.server.end_turn_soon()
+
+    def pause_writing(self):
+        self.paused = True
+
+    def resume_writing(self):
+        self.paused = False
+        self.want_write()
+
+    def want_write(self):
+        self.server.writing.add(self)
+        self.server.end_turn_soon()
+
+    def drain(self, force=False):
+        """Hands the output queue over to the transport."""
+        if self.closed:
+            return
+        handler = self.handler
+        buf_out = handler.buf_out
+        metrics = self.server.metrics
+        while buf_out and (force or not self.paused):
+            data = buf_out.peek()
+            self.transport.write(data)
+            buf_out.consume(len(data))
+            if metrics is not None:
+                metrics.bytes_out += len(data)
+        handler.written()
+
+    def close(self):
+        self.drain(force=True)
+        if not self.closed:
+            self.closed = True
+            self.transport.close() # after the buffered data
+
+    def abort(self, data):
+        if self.closed:
+            return
+        self.closed = True
+        if self.transport.get_write_buffer_size():
+            self.transport.abort()
+        else:
+            self.transport.write(data)
+            self.transport.close()
+
+    def detach(self):
+        if not self.closed:
+            self.closed = True
+            self.transport.abort()
+
+class MetricsProtocol(Protocol):
+    """Answers a request on the metrics port (see metrics.py)."""
+
+    def __init__(self, server):
+        self.server = server
+        self.transport = None
+        self.request = ""
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def data_received(self, data):
+        self.request += data
+        if "\r\n\r\n" not in self.request and len(self.request) < 65536:
+            # Wait for the rest of the request
+            return
+        self.transport.write(http_response(self.server.metrics.render()))
+        self.transport.close()
+
+class AsyncioServer(GameServer):
+    """
+    Serves the game from an asyncio event loop. Whatever a callback (data
+    received, a timer) did to the rooms is settled in one end_turn() call
+    soon after: the rooms are updated, their events flushed and the output
+    handed over to the transports.
+    """
+
+    def __init__(self, player_count, port, loop=None, authoritative=None,
+                 max_rooms=None, sock=None, metrics_port=None,
+                 metrics_file=None, record=None, bots=None, arena=None,
+                 checkpoint=None):
+        if asyncio is None:
+            raise RuntimeError("asyncio is not available (on Python 2 it "
+                               "needs trollius)")
+        self.own_loop = loop is None
+        if loop is None:
+            loop = new_loop()
+            asyncio.set_event_loop(loop)
+        self.loop = loop
+        self.writing = set() # connections with output to hand over
+        self.turn = None # pending end_turn() call
+
+        if sock is None:
+            sock = listen(port)
+        sock.setblocking(0)
+        self.socket = sock
+        self.listener = loop.run_until_complete(loop.create_server(
+            lambda: ProtocolConnection(self), sock=sock))
+
+        GameServer.__init__(self, player_count, port,
+                            type(loop).__module__.split(".")[0],
+                            LoopTimers(self), authoritative=authoritative,
+                            max_rooms=max_rooms, metrics_port=metrics_port,
+                            metrics_file=metrics_file, record=record,
+                            bots=bots, arena=arena, checkpoint=checkpoint)
+        self.metrics_listener = None
+        if self.metrics_port:
+            self.metrics_listener = loop.run_until_complete(
+                loop.create_server(lambda: MetricsProtocol(self),
+                                   '127.0.0.1', self.metrics_port))
+
+    def end_turn_soon(self):
+        if self.turn is None:
+            self.turn = self.loop.call_soon(self.end_turn)
+
+    def end_turn(self):
+        self.turn = None
+        if self.metrics is not None:
+            start = time.time()
+        self.update_rooms(time.time())
+        self.flush_rooms()
+        while self.writing:
+            self.writing.pop().drain()
+        if self.metrics is not None:
+            self.metrics.loop.observe(time.time() - start)
+
+    def serve(self):
+        self.loop.run_forever()
+
+    def stop(self):
+        self.disconnect_all()
+
+        for listener in (self.listener, self.metrics_listener):
+            if listener is not None:
+                listener.close()
+                self.loop.run_until_complete(listener.wait_closed())
+        if self.own_loop:
+            self.loop.close()
+        logger.info("Server halted.")
+        logger.close()
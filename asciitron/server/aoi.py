@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+
+"""
+Area of interest filtering for arenas (serve --arena): a player only gets
+the positions near its cycle instead of every position of the room.
+"""
+
+from ..common import Encoder
+import settings
+
+class AreaIndex(object):
+    """
+    Spatial index of a room's v2 players: the board is split into cells of
+    AOI_CELL x AOI_CELL fields, every player watches the cells within its
+    terminal size around its cycle (its client scrolls the view, keeping
+    the cycle inside). A position goes to the watchers of its cell only,
+    other events to everybody; a player entering cells gets the trails
+    already in them first. Every indexed player has its own Encoder, their
+    streams differ.
+
+    The work per position grows with the players watching its cell, not
+    with the players in the room.
+    """
+
+    def __init__(self, room):
+        self.room = room
+        self.cell = settings.AOI_CELL
+        self.watchers = {} # (cell x, cell y) -> set of players
+        self.areas = {} # player -> (left, top, right, bottom) cells watched
+        self.pending = {} # player -> events for its next frame
+
+    def __contains__(self, player):
+        return player in self.areas
+
+    def area(self, player):
+        """The cells player watches at its current position."""
+        cell = self.cell
+        return ((player.x - player.width) // cell,
+                (player.y - player.height) // cell,
+                (player.x + player.width) // cell,
+                (player.y + player.height) // cell)
+
+    def moved(self, player):
+        """Updates the cells of player, it gets the trails of new ones."""
+        if player.version < 2:
+            return # gets the full stream
+        old = self.areas.get(player)
+        area = self.area(player)
+        if area == old:
+            return
+        if old is None:
+            # Takes over from the room's stream, where the client is now
+            player.encoder = Encoder()
+            player.encoder.positions.update(self.room.encoder.positions)
+        self.areas[player] = area
+        left, top, right, bottom = area
+        entered = []
+        for cy in xrange(top, bottom + 1):
+            for cx in xrange(left, right + 1):
+                if old is not None and old[0] <= cx <= old[2] and \
+                    old[1] <= cy <= old[3]:
+                    continue
+                self.watchers.setdefault((cx, cy), set()).add(player)
+                entered.append((cx, cy))
+        if old is not None:
+            for cy in xrange(old[1], old[3] + 1):
+                for cx in xrange(old[0], old[2] + 1):
+                    if not (left <= cx <= right and top <= cy <= bottom):
+                        self.unwatch(player, (cx, cy))
+        self.catch_up(player, entered)
+
+    def catch_up(self, player, cells):
+        """Queues the trails in cells to player (not its own one)."""
+        board = self.room.map
+        cell = self.cell
+        events = self.pending.setdefault(player, [])
+        own = player.player_id
+        for cx, cy in cells:
+            x0, y0 = cx * cell, cy * cell
+            if x0 >= board.width or y0 >= board.height or \
+                x0 + cell <= 0 or y0 + cell <= 0:
+                continue
+            for player_id, x, y in board.trails(x0, y0, cell, cell):
+                if player_id != own:
+                    events.append((player_id, 2, x, y, 0))
+
+    def unwatch(self, player, key):
+        watchers = self.watchers.get(key)
+        if watchers is not None:
+            watchers.discard(player)
+            if not watchers:
+                del self.watchers[key]
+
+    def remove(self, player):
+        area = self.areas.pop(player, None)
+        self.pending.pop(player, None)
+        player.encoder = None
+        if area is None:
+            return
+        for cy in xrange(area[1], area[3] + 1):
+            for cx in xrange(area[0], area[2] + 1):
+                self.unwatch(player, (cx, cy))
+
+    def distribute(self, events):
+        """
+        Sorts the events of a frame to the players, returns player ->
+        events (only the players with anything to send).
+        """
+        pending = self.pending
+        self.pending = {}
+        cell = self.cell
+        watchers = self.watchers
+        everybody = self.areas.keys()
+        for event in events:
+            if event[1] == 2:
+                players = watchers.get((event[2] // cell, event[3] // cell),
+                                       ())
+            else:
+                players = everybody
+            for player in players:
+                queued = pending.get(player)
+                if queued is None:
+                    queued = pending[player] = []
+                queued.append(event)
+        return pending
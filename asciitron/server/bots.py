@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+
+"""
+AI players hosted by the server (serve --bots): they take seats in every
+room, so a human has opponents even when nobody else is around.
+"""
+
+import random
+import time
+
+from ..common import ai
+from ..common import *
+import settings
+from game import Player
+
+class BotConnection(object):
+    """Stands in for the transport of a BotPlayer, nothing is sent."""
+
+    def __init__(self, player_id):
+        self.address = ("bot", player_id)
+        self.handler = None
+
+    def want_write(self):
+        pass
+
+    def close(self):
+        pass
+
+    def abort(self, data):
+        pass
+
+    def detach(self):
+        pass
+
+class BotPlayer(Player):
+    """
+    A Player steered by common/ai.py. It reads the room's map directly
+    instead of the broadcasts; in client-driven mode it moves itself from a
+    timer, in server-authoritative mode the room's ticks move it.
+    """
+
+    def __init__(self, server, player_id):
+        self.step_timer = None # next move, client-driven mode only
+        Player.__init__(self, server, BotConnection(player_id))
+        self.cancel_timers() # no hello or heartbeats to wait for
+        self.player_id = player_id
+        self.width = settings.BOT_WIDTH
+        self.height = settings.BOT_HEIGHT
+
+    def queue(self, data):
+        pass
+
+    def start(self):
+        """Called when the game starts, places the bot (client-driven)."""
+        room = self.room
+        if room.authoritative:
+            return # placed and moved by the room
+        self.x = random.randint(int(room.width * 0.1), int(room.width * 0.9))
+        self.y = random.randint(int(room.height * 0.1),
+                                int(room.height * 0.9))
+        self.direction = self.moved_direction = random.choice(DIR_DELTA.keys())
+        self.step_timer = self.server.timers.call_at(
+            time.time() + settings.SECONDS, self.act)
+
+    def resume(self):
+        """Called when a restored game goes on (see Room.go_on)."""
+        if not self.room.authoritative and not self.crashed:
+            self.step_timer = self.server.timers.call_at(
+                time.time() + self.speed / 1000.0, self.act)
+
+    def act(self):
+        self.step_timer = None
+        room = self.room
+        if self.crashed or room is None or room.game_state != "running":
+            return
+        self.step()
+        self.server.dirty.add(room)
+        if not self.crashed:
+            self.step_timer = self.server.timers.call_at(
+                time.time() + self.speed / 1000.0, self.act)
+
+    def step(self):
+        room = self.room
+        heads = [(player.x, player.y) for player in room.alive
+                 if player is not self]
+        self.direction = ai.choose(room.map, self.x, self.y,
+                                   self.moved_direction, heads)
+        # Stays for the usual 3 seconds after the game is over
+        self.last_activity = time.time()
+        Player.step(self)
+
+    def cancel_timers(self):
+        Player.cancel_timers(self)
+        if self.step_timer is not None:
+            self.step_timer.cancel()
+            self.step_timer = None
+
+    def __repr__(self):
+        return '<BotPlayer %s>' % self.player_id
@@ -0,0 +1,337 @@
+# -*- coding: utf-8 -*-
+
+"""
+Checkpoints of the running games (serve --checkpoint FILE): a server which
+died in the middle of games is started again with the same file, its
+players reconnect and resume their seats (cmd 7) where the last checkpoint
+left them.
+
+The file is memory-mapped: a header page, then two halves of which one is
+active. A checkpoint appends its records to the active half, then stores
+the half's new length (one 4 byte write), so a server dying at any point
+leaves the last complete checkpoint behind. When the active half is full,
+the whole state is written to the other one, which becomes active by
+another single write. The kernel writes the pages back on its own: the file
+survives the process, not a crash of the machine (the loop never syncs).
+
+    header    "ATCK", version (B), active half (B), 2 pad bytes, length of
+              half 0 (I), length of half 1 (I)
+    records   CK_ROOM     room number (I), width, height (h), authoritative,
+                          player count (B)
+              CK_PLAYER   room number (I), a player's seat and state (see
+                          player_values)
+              CK_LEAVE    room number (I), player id (B)
+              CK_EVENTS   room number (I), count (H), then count times
+                          player id, cmd (B), x, y (h): the positions (cmd
+                          2) and removals from the map (cmd 5)
+              CK_CLOSE    room number (I)
+
+A checkpoint writes the events its rooms flushed since the last one and the
+players named in them only, it costs about as much as copying the frames
+they sent in the meantime. It takes the rooms in CHECKPOINT_SLICES turns
+(by room number), so it never holds up the loop for long.
+"""
+
+import mmap
+import os
+import struct
+import time
+
+from log import logger
+import settings
+
+MAGIC = "ATCK"
+CHECKPOINT_VERSION = 1
+PAGE = 4096 # the header's, the halves follow
+
+CK_ROOM = 0
+CK_PLAYER = 1
+CK_LEAVE = 2
+CK_EVENTS = 3
+CK_CLOSE = 4
+
+HEADER = struct.Struct("!4sBBxxII")
+ACTIVE = struct.Struct("!B") # at ACTIVE_OFFSET
+ACTIVE_OFFSET = 5
+LENGTH = struct.Struct("!I") # at LENGTH_OFFSET + 4 * half
+LENGTH_OFFSET = 8
+ROOM = struct.Struct("!BIhhBB")
+PLAYER = struct.Struct("!BIBBHhhhhBBffBffIB")
+LEAVE = struct.Struct("!BIB")
+EVENTS = struct.Struct("!BIH")
+EVENT = struct.Struct("!BBhh")
+CLOSE = struct.Struct("!BI")
+RECORDS = {CK_ROOM: ROOM, CK_PLAYER: PLAYER, CK_LEAVE: LEAVE,
+           CK_EVENTS: EVENTS, CK_CLOSE: CLOSE}
+
+LIVE = ("running", "resuming") # states of the rooms checkpointed
+
+def player_values(player, bot, now):
+    """The fields of a CK_PLAYER record after the room number."""
+    return (player.player_id, int(bot), player.key or 0, player.width,
+            player.height, player.x, player.y, player.direction,
+            player.moved_direction, player.speed, player.nitrotank,
+            int(player.nitro), player.nitro and now - player.nitro_start or 0,
+            player.step_time, player.length, int(player.crashed))
+
+class Seat(object):
+    """A player of a restored game, until somebody resumes it."""
+
+    def __init__(self, values):
+        self.values = values
+        (self.player_id, self.bot, self.key, self.width, self.height, self.x,
+         self.y, self.direction, self.moved_direction, self.speed,
+         self.nitrotank, self.nitro, self.nitro_time, self.step_time,
+         self.length, self.crashed) = values
+
+    def apply(self, player):
+        """Gives player the seat's state."""
+        player.player_id = self.player_id
+        player.key = self.key
+        player.width, player.height = self.width, self.height
+        player.x, player.y = self.x, self.y
+        player.direction = self.direction
+        player.moved_direction = self.moved_direction
+        player.speed = self.speed
+        player.nitrotank = self.nitrotank
+        player.nitro = bool(self.nitro)
+        player.nitro_start = time.time() - self.nitro_time
+        player.step_time = self.step_time
+        player.length = self.length
+        player.crashed = bool(self.crashed)
+
+def pack_events(number, events):
+    """CK_EVENTS records of the positions and removals among events."""
+    events = [event for event in events if event[1] in (2, 5)]
+    parts = []
+    for i in xrange(0, len(events), 0xffff):
+        chunk = events[i:i + 0xffff]
+        parts.append(EVENTS.pack(CK_EVENTS, number, len(chunk)))
+        parts.extend([EVENT.pack(*event[:4]) for event in chunk])
+    return parts
+
+def read_games(data):
+    """
+    Returns the games of a half's records, (room number, width, height,
+    authoritative, player count, player id -> Seat, events) each.
+    """
+    games = {}
+    order = []
+    offset = 0
+    while offset < len(data):
+        kind = ord(data[offset])
+        record = RECORDS[kind]
+        values = record.unpack_from(data, offset)
+        offset += record.size
+        number = values[1]
+        if kind == CK_ROOM:
+            games[number] = list(values[1:]) + [{}, []]
+            order.append(number)
+        elif number not in games:
+            raise ValueError("record of unknown room %d" % number)
+        elif kind == CK_PLAYER:
+            games[number][5][values[2]] = Seat(values[2:])
+        elif kind == CK_LEAVE:
+            games[number][5].pop(values[2], None)
+        elif kind == CK_EVENTS:
+            events = games[number][6]
+            for _ in xrange(values[2]):
+                events.append(EVENT.unpack_from(data, offset))
+                offset += EVENT.size
+        else:
+            del games[number]
+    return [tuple(games[number]) for number in order if number in games]
+
+class Checkpoint(object):
+    """
+    Writes the checkpoints of a GameServer, every CHECKPOINT_INTERVAL
+    seconds per room, from a timer of its loop which only runs while games
+    do (a starting room wakes it). The rooms hand it the events they flush
+    (record).
+    """
+
+    def __init__(self, server, filename):
+        self.server = server
+        self.filename = filename
+        self.tracked = {} # room -> player ids in the file
+        self.pending = {} # tracked room -> events since the last checkpoint
+        self.timer = None
+        self.turn = 0 # of the room numbers % CHECKPOINT_SLICES written next
+        self.count = 0 # checkpoints written
+        self.compactions = 0
+        self.cost = 0.0 # seconds spent writing them
+        self.written = 0 # bytes
+        fd = os.open(filename, os.O_RDWR | os.O_CREAT, 0644)
+        try:
+            size = max(os.fstat(fd).st_size, settings.CHECKPOINT_SIZE)
+            os.ftruncate(fd, size)
+            self.mmap = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+        self.half = (size - PAGE) // 2
+        self.length = 0
+        magic, version, self.active, length0, length1 = \
+            HEADER.unpack_from(self.mmap)
+        self.valid = magic == MAGIC and version == CHECKPOINT_VERSION and \
+            self.active in (0, 1)
+        if not self.valid:
+            self.active = 0
+            HEADER.pack_into(self.mmap, 0, MAGIC, CHECKPOINT_VERSION, 0, 0, 0)
+
+    def restore(self):
+        """Returns the games of the file (see read_games)."""
+        if not self.valid:
+            return []
+        length = LENGTH.unpack_from(self.mmap,
+                                    LENGTH_OFFSET + 4 * self.active)[0]
+        offset = PAGE + self.active * self.half
+        try:
+            return read_games(self.mmap[offset:offset + length])
+        except (KeyError, ValueError, struct.error), e:
+            logger.error("Checkpoint %s unreadable (%s), not restored.",
+                         self.filename, e)
+            return []
+
+    def start(self):
+        """Writes the current state, checkpoints follow while games run."""
+        self.compact(time.time())
+        if [room for room in self.server.rooms if room.game_state in LIVE]:
+            self.wake()
+
+    def wake(self):
+        """Arms the timer of the checkpoints, a game started."""
+        if self.timer is None and self.mmap is not None:
+            self.timer = self.server.timers.call_at(
+                time.time() + settings.CHECKPOINT_INTERVAL /
+                settings.CHECKPOINT_SLICES, self.write)
+
+    def record(self, room, events):
+        """Keeps the events room just flushed for the next checkpoint."""
+        if room in self.tracked:
+            pending = self.pending.get(room)
+            if pending is None:
+                self.pending[room] = list(events)
+            else:
+                pending.extend(events)
+
+    def write(self):
+        """
+        Appends the changes of the rooms whose turn it is since their last
+        checkpoint, new rooms as a whole. The next one follows as long as
+        there are games.
+        """
+        start = time.time()
+        slices = settings.CHECKPOINT_SLICES
+        if self.timer is not None:
+            self.timer.cancel() # called directly (the bench)
+            self.timer = None
+        turn = self.turn
+        self.turn = (turn + 1) % slices
+        # The players' state has to match the events
+        self.server.flush_rooms()
+        rooms = self.server.rooms
+        live = set(rooms)
+        parts = []
+        for room in self.tracked.keys():
+            if room.game_state not in LIVE or room not in live:
+                parts.append(CLOSE.pack(CK_CLOSE, room.number))
+                del self.tracked[room]
+                self.pending.pop(room, None)
+        for room in rooms:
+            if room.game_state not in LIVE:
+                continue
+            if room not in self.tracked:
+                parts.extend(self.pack_room(room, start))
+            elif room.number % slices == turn:
+                events = self.pending.pop(room, None)
+                if events:
+                    parts.extend(pack_events(room.number, events))
+                    parts.extend(self.pack_players(room, start, events))
+        data = "".join(parts)
+        if data:
+            if self.length + len(data) > self.half:
+                self.compact(start)
+            else:
+                offset = PAGE + self.active * self.half + self.length
+                self.mmap[offset:offset + len(data)] = data
+                self.length += len(data)
+                LENGTH.pack_into(self.mmap, LENGTH_OFFSET + 4 * self.active,
+                                 self.length)
+                self.written += len(data)
+        self.count += 1
+        self.cost += time.time() - start
+        if self.tracked and self.mmap is not None:
+            self.timer = self.server.timers.call_at(
+                start + settings.CHECKPOINT_INTERVAL / slices, self.write)
+
+    def pack_players(self, room, now, events=None):
+        """
+        CK_PLAYER records of room's players (only the ones named in events,
+        if given), CK_LEAVE of the gone ones.
+        """
+        number = room.number
+        bots = room.bots
+        players = room.players
+        if events is not None:
+            named = set([event[0] for event in events])
+            players = [player for player in players
+                       if player.player_id in named]
+        parts = [PLAYER.pack(CK_PLAYER, number,
+                             *player_values(player, player in bots, now))
+                 for player in players]
+        player_ids = set([player.player_id for player in room.players])
+        player_ids.update(room.seats)
+        for player_id in self.tracked[room] - player_ids:
+            parts.append(LEAVE.pack(CK_LEAVE, number, player_id))
+        self.tracked[room] = player_ids
+        return parts
+
+    def pack_room(self, room, now):
+        """All records of room, it is tracked from now on."""
+        number = room.number
+        parts = [ROOM.pack(CK_ROOM, number, room.width, room.height,
+                           int(room.authoritative), room.player_count)]
+        parts.extend([PLAYER.pack(CK_PLAYER, number, *seat.values)
+                      for seat in room.seats.itervalues()])
+        self.tracked[room] = set()
+        parts.extend(self.pack_players(room, now))
+        parts.extend(pack_events(number, [
+            (player_id, 2, x, y) for player_id, x, y in
+            room.map.trails(0, 0, room.width, room.height)]))
+        return parts
+
+    def compact(self, now):
+        """Writes the whole state to the other half, which becomes active."""
+        self.tracked = {}
+        self.pending = {}
+        parts = []
+        for room in self.server.rooms:
+            if room.game_state in LIVE:
+                parts.extend(self.pack_room(room, now))
+        data = "".join(parts)
+        if len(data) > self.half:
+            logger.error("The games don't fit into half of %s, "
+                         "checkpoints stopped.", self.filename)
+            self.close()
+            return
+        half = 1 - self.active
+        offset = PAGE + half * self.half
+        self.mmap[offset:offset + len(data)] = data
+        LENGTH.pack_into(self.mmap, LENGTH_OFFSET + 4 * half, len(data))
+        ACTIVE.pack_into(self.mmap, ACTIVE_OFFSET, half)
+        self.active, self.length = half, len(data)
+        self.written += len(data)
+        self.compactions += 1
+
+    def close(self, clear=False):
+        """Stops checkpointing; clear: the games are over (a clean stop)."""
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        if self.mmap is None:
+            return
+        if clear:
+            LENGTH.pack_into(self.mmap, LENGTH_OFFSET + 4 * self.active, 0)
+        self.mmap.close()
+        self.mmap = None
+        self.server.checkpoint = None
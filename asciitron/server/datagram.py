@@ -0,0 +1,297 @@
+# -*- coding: utf-8 -*-
+
+"""
+UDP transport of the TronServer (serve --udp), next to TCP on the same port
+number. One socket serves all clients, each address is a DatagramConnection
+(see game.py for the interface).
+
+A lost TCP segment holds back everything behind it; here the records the
+game queued are split: positions and speed/nitro tank go out unreliably,
+newest wins, the last ones of every player riding along in the next
+UDP_COPIES datagrams. All other events get a sequence number and are
+repeated until the client acknowledges them (see common/datagram.py for the
+client end).
+
+Anybody can send a hello from somebody else's address, so a connection only
+answers the datagrams it gets until the client acknowledged an event (the
+server's hello): nothing is resent on its own before, one datagram in
+brings at most the records due out.
+"""
+
+import errno
+import socket
+import struct
+import time
+
+from ..common import *
+from log import logger
+import settings
+
+class DatagramConnection(object):
+    """
+    A client of the DatagramListener. The game queues its usual stream
+    (v1 until the version is confirmed, then v2), which is decoded again and
+    turned into datagrams at the end of the turn.
+    """
+
+    def __init__(self, listener, address):
+        self.listener = listener
+        self.server = listener.server
+        self.address = address
+        self.handler = None # Player or Spectator
+        self.buf = InputBuffer()
+        self.decoder = Decoder()
+        self.seq = 0 # datagrams sent
+        self.received = 0 # client records handled, in order
+        self.event_seq = 0 # events sent
+        self.unacked = [] # [event seq, record, copies sent, sent at]
+        self.steps = {} # player-no -> positions sent this game
+        self.tails = {} # player-no -> [event seq before, last position
+                        # number, [(x, y), ...], copies sent]
+        self.state = {} # MSG_SPEED/MSG_NITRO -> [record, copies sent]
+        self.ack_owed = False
+        self.confirmed = False # the client acknowledged an event
+        self.answer_owed = False # unconfirmed: a datagram came in
+        self.timer = None # resends unacknowledged events
+        self.closed = False
+
+    @property
+    def room(self):
+        return self.handler.room
+
+    def datagram_received(self, kind, ack, first, data):
+        if kind == DGRAM_BYE:
+            self.handler.remove()
+            return
+        while self.unacked and self.unacked[0][0] <= ack:
+            self.unacked.pop(0)
+        if ack:
+            self.confirmed = True
+        elif not self.confirmed:
+            # Answered, whatever the datagram holds
+            self.answer_owed = True
+            self.want_write()
+        handler = self.handler
+        size = PACKET_TOSERVER.size
+        offset = DGRAM_TOSERVER.size
+        seq = first
+        count = 0
+        while offset + size <= len(data) and seq <= self.received + 1:
+            if seq == self.received + 1:
+                # Repeated records were handled already
+                handler.buf_in.feed(data[offset:offset + size])
+                self.received = seq
+                count += size
+            offset += size
+            seq += 1
+        if offset > DGRAM_TOSERVER.size:
+            self.ack_owed = True
+            self.want_write()
+        if count:
+            handler.received(count)
+
+    def want_write(self):
+        if not self.closed:
+            self.listener.writing.add(self)
+            self.server.engine.want_write(self.listener, True)
+
+    def collect(self):
+        """Takes the records the game queued."""
+        buf_out = self.handler.buf_out
+        if not buf_out:
+            return
+        while buf_out:
+            data = buf_out.peek()
+            self.buf.feed(data)
+            buf_out.consume(len(data))
+        self.record(self.decoder.decode(self.buf))
+        self.handler.written()
+
+    def record(self, packets):
+        for player_id, cmd, x, y, speed, nitrotank, misc in packets:
+            if speed != KEEP_SPEED:
+                self.state[MSG_SPEED] = [PACKET_SPEED.pack(MSG_SPEED, speed),
+                                         0]
+            if nitrotank != KEEP_NITRO:
+                self.state[MSG_NITRO] = [PACKET_NITRO.pack(MSG_NITRO,
+                                                           nitrotank), 0]
+            if cmd == 2:
+                step = self.steps.get(player_id, 0) + 1
+                self.steps[player_id] = step
+                tail = self.tails.get(player_id)
+                if tail is None:
+                    tail = self.tails[player_id] = [0, 0, [], 0]
+                tail[0] = self.event_seq
+                tail[1] = step
+                tail[2].append((x, y))
+                tail[3] = 0
+            elif cmd not in (20, 21):
+                if cmd == 1:
+                    # Positions of the last game are over
+                    self.steps.clear()
+                    self.tails.clear()
+                self.event_seq += 1
+                self.unacked.append([self.event_seq,
+                                     PACKET_RELIABLE.pack(MSG_RELIABLE,
+                                                          self.event_seq) +
+                                     PACKET_EVENT.pack(MSG_EVENT, cmd,
+                                                       player_id, x, y, misc),
+                                     0, 0])
+
+    def records(self, now):
+        """The records due: events first, then positions and state."""
+        records = []
+        for event in self.unacked:
+            if event[2] < settings.UDP_COPIES or \
+                now - event[3] >= settings.UDP_RESEND:
+                records.append(event[1])
+                event[2] += 1
+                event[3] = now
+        fit = (settings.UDP_DATAGRAM - DGRAM_TOPLAYER.size -
+                PACKET_TRAIL.size) // 4
+        for player_id, tail in self.tails.items():
+            after, last, coords, copies = tail
+            first = last - len(coords) + 1
+            for i in xrange(0, len(coords), fit):
+                part = coords[i:i + fit]
+                records.append(PACKET_TRAIL.pack(MSG_TRAIL, player_id, after,
+                                                 first + i, len(part)) +
+                               struct.pack("!%dh" % (len(part) * 2),
+                                           *[c for xy in part for c in xy]))
+            # The newest positions ride along in the next datagrams
+            del coords[:-settings.UDP_COPIES]
+            tail[3] += 1
+            if tail[3] >= settings.UDP_COPIES:
+                del self.tails[player_id]
+        for kind, state in self.state.items():
+            records.append(state[0])
+            state[1] += 1
+            if state[1] >= settings.UDP_COPIES:
+                del self.state[kind]
+        return records
+
+    def flush(self, now):
+        """Sends the datagrams due."""
+        if self.closed:
+            return
+        self.collect()
+        if not self.confirmed:
+            if not self.answer_owed:
+                return # until the client's next datagram
+            self.answer_owed = False
+        records = self.records(now)
+        if records or self.ack_owed:
+            self.ack_owed = False
+            self.send(records)
+        if self.confirmed and (self.unacked or self.tails or self.state) and \
+            self.timer is None:
+            self.timer = self.server.timers.call_at(now + settings.UDP_RESEND,
+                                                    self.resend)
+
+    def send(self, records):
+        """Packs records into datagrams of UDP_DATAGRAM bytes at most."""
+        datagrams = []
+        parts, size = [], DGRAM_TOPLAYER.size
+        for record in records:
+            if parts and size + len(record) > settings.UDP_DATAGRAM:
+                datagrams.append(parts)
+                parts, size = [], DGRAM_TOPLAYER.size
+            parts.append(record)
+            size += len(record)
+        datagrams.append(parts)
+        for parts in datagrams:
+            self.seq += 1
+            self.listener.send(DGRAM_TOPLAYER.pack(self.seq, self.received) +
+                               "".join(parts), self.address)
+
+    def resend(self):
+        self.timer = None
+        self.flush(time.time())
+
+    def close(self):
+        # The last events can't be resent, send them a few times
+        now = time.time()
+        for i in xrange(settings.UDP_COPIES):
+            self.flush(now)
+        self.detach()
+
+    def abort(self, data):
+        self.buf.feed(data)
+        self.record(self.decoder.decode(self.buf))
+        self.close()
+
+    def detach(self):
+        if self.closed:
+            return
+        self.closed = True
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        self.listener.writing.discard(self)
+        if self.listener.connections.get(self.address) is self:
+            del self.listener.connections[self.address]
+
+class DatagramListener(object):
+    """The UDP socket of a TronServer, registered with its engine."""
+
+    room = None
+
+    def __init__(self, server, port):
+        self.server = server
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.socket.bind(('', port))
+        self.socket.setblocking(0)
+        self.connections = {} # address -> DatagramConnection
+        self.writing = set() # connections with records to send
+        logger.info("Serving Tron at port %d (UDP).", port)
+
+    def handle_read(self):
+        server = self.server
+        while True:
+            try:
+                data, address = self.socket.recvfrom(65536)
+            except socket.error, e:
+                if e.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    break
+                continue
+            if len(data) < DGRAM_TOSERVER.size:
+                continue
+            kind, ack, first = DGRAM_TOSERVER.unpack_from(data)
+            connection = self.connections.get(address)
+            if connection is None:
+                if kind != DGRAM_DATA or ack or first != 1 or \
+                    len(data) > DGRAM_TOSERVER.size:
+                    # Only a client saying hello starts a connection, not
+                    # the late datagrams of a closed one
+                    continue
+                connection = DatagramConnection(self, address)
+                self.connections[address] = connection
+                server.connected(connection)
+            connection.datagram_received(kind, ack, first, data)
+            if not connection.closed and connection.room is not None:
+                server.dirty.add(connection.room)
+
+    def handle_write(self):
+        now = time.time()
+        while self.writing:
+            self.writing.pop().flush(now)
+        self.server.engine.want_write(self, False)
+
+    def send(self, data, address):
+        try:
+            self.socket.sendto(data, address)
+        except socket.error:
+            # Dropped, like on the way
+            return
+        if self.server.metrics is not None:
+            self.server.metrics.bytes_out += len(data)
+
+    def fileno(self):
+        return self.socket.fileno()
+
+    def close(self):
+        for connection in self.connections.values():
+            connection.detach()
+        self.server.engine.unregister(self)
+        self.socket.close()
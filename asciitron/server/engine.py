@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+
+"""
+Event engines for the TronServer loop.
+
+An engine keeps track of the registered connections (everything having a
+fileno(), usually the listening socket and the players) and tells the server
+which of them are ready. Connections are registered once; write interest is
+only toggled when a player's output buffer changes between empty and
+non-empty. Exceptional conditions (TCP urgent data) aren't watched: no
+client of the game sends any, recv skips a stray urgent byte.
+
+    EpollEngine  - select.epoll (Linux), O(ready sockets) per pass
+    SelectEngine - plain select.select, works everywhere (fallback)
+"""
+
+import select
+import errno
+
+class SelectEngine(object):
+    name = "select"
+
+    def __init__(self):
+        self.fds = {} # obj -> fd
+        self.readers = []
+        self.writers = []
+
+    def register(self, obj):
+        if obj in self.fds:
+            return
+        self.fds[obj] = obj.fileno()
+        self.readers.append(obj)
+
+    def unregister(self, obj):
+        if self.fds.pop(obj, None) is None:
+            return
+        self.readers.remove(obj)
+        if obj in self.writers:
+            self.writers.remove(obj)
+
+    def is_registered(self, obj):
+        return obj in self.fds
+
+    def want_write(self, obj, flag):
+        if obj not in self.fds:
+            return
+        if flag:
+            if obj not in self.writers:
+                self.writers.append(obj)
+        elif obj in self.writers:
+            self.writers.remove(obj)
+
+    def poll(self, timeout):
+        try:
+            return select.select(self.readers, self.writers, [], timeout)
+        except select.error, e:
+            if e.args[0] == errno.EINTR:
+                return [], [], []
+            raise
+
+    def close(self):
+        self.fds = {}
+        self.readers = []
+        self.writers = []
+
+class EpollEngine(object):
+    name = "epoll"
+
+    READ = select.EPOLLIN if hasattr(select, 'epoll') else 0
+
+    def __init__(self):
+        self.epoll = select.epoll()
+        self.fds = {} # obj -> fd
+        self.objs = {} # fd -> obj
+        self.writing = set()
+
+    def register(self, obj):
+        if obj in self.fds:
+            return
+        fd = obj.fileno()
+        self.epoll.register(fd, self.READ)
+        self.fds[obj] = fd
+        self.objs[fd] = obj
+
+    def unregister(self, obj):
+        fd = self.fds.pop(obj, None)
+        if fd is None:
+            return
+        del self.objs[fd]
+        self.writing.discard(obj)
+        try:
+            self.epoll.unregister(fd)
+        except (IOError, OSError, ValueError):
+            # Socket already closed, the kernel dropped it for us
+            pass
+
+    def is_registered(self, obj):
+        return obj in self.fds
+
+    def want_write(self, obj, flag):
+        fd = self.fds.get(obj)
+        if fd is None or flag == (obj in self.writing):
+            return
+        if flag:
+            self.writing.add(obj)
+            self.epoll.modify(fd, self.READ | select.EPOLLOUT)
+        else:
+            self.writing.discard(obj)
+            self.epoll.modify(fd, self.READ)
+
+    def poll(self, timeout):
+        if timeout is None:
+            timeout = -1 # no timer pending, wait for events only
+        try:
+            events = self.epoll.poll(timeout)
+        except IOError, e:
+            if e.errno == errno.EINTR:
+                return [], [], []
+            raise
+
+        rlist, wlist = [], []
+        for fd, mask in events:
+            obj = self.objs.get(fd)
+            if obj is None:
+                continue
+            if mask & (select.EPOLLIN | select.EPOLLERR | select.EPOLLHUP):
+                # Errors and hangups show up as a failing/empty read
+                rlist.append(obj)
+            if mask & select.EPOLLOUT:
+                wlist.append(obj)
+        return rlist, wlist, []
+
+    def close(self):
+        self.epoll.close()
+        self.fds = {}
+        self.objs = {}
+        self.writing = set()
+
+ENGINES = {
+    "select": SelectEngine,
+    "epoll": EpollEngine,
+}
+
+def available_engines():
+    names = ["select"]
+    if hasattr(select, 'epoll'):
+        names.insert(0, "epoll")
+    return names
+
+def create_engine(name=None):
+    """
+    Returns an engine instance. Without a name the best available engine is
+    used (epoll on Linux, select everywhere else).
+    """
+    if name is None:
+        name = available_engines()[0]
+    if name not in available_engines():
+        raise ValueError("Event engine %s not available here (choose from: %s)" %
+                         (name, ", ".join(available_engines())))
+    return ENGINES[name]()
@@ -0,0 +1,1138 @@
+# -*- coding: utf-8 -*-
+
+"""
+The game, independent of the transport: Players (the protocol and rules of
+one connection), Rooms (matches) and the GameServer hosting them.
+
+A transport serves the connections and gives every one a connection object
+with
+
+    address         (host, port) of the client
+    handler         the Player (or Spectator) it is served to
+    want_write()    data was queued to handler.buf_out
+    close()         writes what it can, then closes
+    abort(data)     closes, trying to send data first (goodbye of a client
+                    which doesn't read)
+    detach()        stops serving it
+
+and calls handler.received(count) with data in handler.buf_in and
+handler.written() after it took data off handler.buf_out. TronServer
+serves them from its own select/epoll loop, AsyncioServer (aioserver.py)
+from an asyncio event loop.
+"""
+
+import time
+import random
+import math
+
+from ..common import *
+from metrics import Metrics
+from log import logger, INFO, WARNING
+from recorder import Recorder, writer
+from aoi import AreaIndex
+from checkpoint import Checkpoint
+from spectator import Spectator
+import settings
+
+MAPS = {"segments": Segments, "grid": Grid} # settings.TRAILS
+
+def create_map(width, height):
+    """The map of a board of width x height fields, see settings.TRAILS."""
+    trails = settings.TRAILS
+    if trails is None:
+        if width * height >= settings.SEGMENTS_FIELDS:
+            trails = "segments"
+        else:
+            trails = "grid"
+    return MAPS[trails](width, height)
+
+class Player(object):
+    """
+    0 = O hai! (Ping-Package, misc = protocol version of the server)
+    1 = Start game in X seconds (misc = 1: server-authoritative mode)
+    2 = Set Position for Player N
+    3 = Player X lost game
+    4 = Player X won game
+    5 = Remove Player X from map
+    6 = c -> s: watch room X as a spectator (0 = the first running one)
+    7 = c -> s: resume the seat of room X with key Y as player misc (a game
+        restored from a checkpoint)
+    8 = Heartbeat (c -> s: answer to it)
+    9 = Server disconnected gracefully
+    
+    # pre-game commands 
+    10 = Server full
+    11 = Game is running
+    12 = Player ID already taken
+    13 = Player ID invalid
+    14 = Players available (X of Y)
+    15 = Protocol version X confirmed (c -> s: 1 = use protocol version X)
+    16 = Your seat is in room X, key Y (to resume it with cmd 7)
+    17 = Seat resumed, the cycle is at X, Y moving into direction misc
+    18 = Nothing to resume
+    
+    # in game controls
+    20 s -> c = set speed in ms of X (1000ms = 1s)
+    21 = Activate Nitro
+    22 c -> s = change direction to X (server-authoritative mode only)
+    """
+
+    def __init__(self, server, connection):
+        self.server = server
+        self.room = None # set when joining a room
+        self.connection = connection # of the transport, see GameServer
+        connection.handler = self
+        self.address = connection.address
+        self.buf_in = InputBuffer()
+        self.buf_out = OutputQueue()
+        self.deferred = None # events held back while coalescing, see queue_frame
+        self.deferred_positions = {} # player id -> index in deferred
+        self.deferred_bytes = 0 # size of the frames held back
+        self.player_id = None
+        self.key = None # of its seat, see Room.start
+        self.width = -1
+        self.height = -1
+        self.crashed = False
+        self.speed = settings.SPEED_NORMAL # Current player speed
+        self.nitro_start = 0
+        self.nitro = False
+        self.nitrotank = 100 # in percent
+        self.sent_speed = None # speed/nitrotank last told to the client
+        self.sent_nitrotank = None
+        self.version = 1 # protocol version
+        self.encoder = None # own v2 stream, see AreaIndex
+        self.length = 0 # fields of its trail on the map
+        self.x = 0 # Current position X
+        self.y = 0 # Current position Y
+        self.direction = DIR_RIGHT # authoritative mode only
+        self.moved_direction = DIR_RIGHT
+        self.step_time = 0 # ms accumulated towards the next step
+        now = time.time()
+        self.last_activity = now # last packet other than a heartbeat
+        self.heard_at = now # last packet
+        self.idle_timer = None # only for clients answering heartbeats
+        self.watching = False # became a Spectator, see TronServer.watch
+        self.hello_timer = server.timers.call_at(now + settings.HELLO_TIMEOUT,
+                                                 self.hello_timeout)
+        self.heartbeat_timer = server.timers.call_at(now + settings.HEARTBEAT,
+                                                     self.heartbeat)
+        self.log("Connected")
+    
+    def remove_from_map(self):
+        if self.length:
+            self.room.map.clear_player(self.player_id)
+            self.length = 0
+            self.room.broadcast(self.player_id, 5, 0, 0)
+            self.log("I was removed from map")
+    
+    def send(self, player_id, cmd, x, y, misc=0):
+        # Pending broadcasts go first to keep the order of events
+        if self.room:
+            self.room.flush()
+        self.send_record(player_id, cmd, x, y, misc)
+    
+    def send_record(self, player_id, cmd, x, y, misc=0):
+        if self.version >= 2:
+            self.queue(encode_event(player_id, cmd, x, y, misc))
+            return
+        speed, nitrotank = self.v1_state()
+        self.queue(PACKET_TOPLAYER.pack(player_id, cmd, x, y, speed, nitrotank,
+                                        misc))
+    
+    def v1_state(self):
+        """
+        The speed and nitro tank of the v1 records queued now (the client
+        takes them from every record).
+        """
+        self.sent_speed = int(self.speed)
+        self.sent_nitrotank = int(self.nitrotank)
+        return self.sent_speed, self.sent_nitrotank
+    
+    def send_state(self):
+        """Tells the client its speed and nitro tank, if they changed."""
+        speed, nitrotank = int(self.speed), int(self.nitrotank)
+        if self.version >= 2:
+            # Only the changed values
+            if speed != self.sent_speed:
+                self.queue(PACKET_SPEED.pack(MSG_SPEED, speed))
+            if nitrotank != self.sent_nitrotank:
+                self.queue(PACKET_NITRO.pack(MSG_NITRO, nitrotank))
+            self.sent_speed, self.sent_nitrotank = speed, nitrotank
+        elif speed != self.sent_speed or nitrotank != self.sent_nitrotank:
+            self.send_record(0, 20, speed, 0)
+    
+    def queue(self, data):
+        if not data:
+            return
+        if not self.buf_out:
+            self.connection.want_write()
+        self.buf_out.append(data)
+    
+    def queue_frame(self, frame, events):
+        """
+        Queues a broadcast frame. Past OUTPUT_HIGH_WATER bytes pending, the
+        events are held back instead and positions are coalesced down to the
+        latest one per player, until the client has read half of its backlog.
+        """
+        size = self.buf_out.size
+        if self.deferred is None:
+            if size < settings.OUTPUT_HIGH_WATER:
+                self.queue(frame)
+                return
+            self.deferred = []
+            self.log("%d bytes pending, coalescing positions", size,
+                     level=WARNING)
+        elif size < settings.OUTPUT_HIGH_WATER // 2:
+            self.catch_up()
+            self.queue(frame)
+            return
+        
+        deferred, positions = self.deferred, self.deferred_positions
+        for event in events:
+            if event[1] == 2:
+                i = positions.get(event[0])
+                if i is not None:
+                    deferred[i] = None # superseded
+                positions[event[0]] = len(deferred)
+            deferred.append(event)
+        self.deferred_bytes += len(frame)
+        if size + self.deferred_bytes > settings.OUTPUT_LIMIT:
+            self.evict()
+    
+    def catch_up(self):
+        """Queues the events held back by queue_frame."""
+        events = [event for event in self.deferred if event is not None]
+        if self.version >= 2:
+            # Absolute positions, the client missed the steps in between
+            data = Encoder().encode(events)
+        else:
+            data = encode_v1(events, *self.v1_state())
+        self.server.coalesced_bytes += self.deferred_bytes - len(data)
+        self.deferred = None
+        self.deferred_positions = {}
+        self.deferred_bytes = 0
+        self.queue(data)
+    
+    def evict(self):
+        """Disconnects a client which doesn't read its data."""
+        self.server.dropped_bytes += self.buf_out.size + self.deferred_bytes
+        self.server.evicted += 1
+        self.log("More than %d bytes pending, disconnecting",
+                 settings.OUTPUT_LIMIT, level=WARNING)
+        self.deferred = None
+        self.buf_out = OutputQueue()
+        # Try to say goodbye, it doesn't matter if it doesn't fit
+        if self.version >= 2:
+            self.connection.abort(encode_event(0, 9, 0, 0))
+        else:
+            self.connection.abort(encode_v1([(0, 9, 0, 0, 0)],
+                                            *self.v1_state()))
+        self.remove()
+    
+    def is_last_active(self):
+        return not self.crashed and len(self.room.alive) == 1
+    
+    def is_last(self):
+        return not self.room.alive
+    
+    def handle_packet(self, packet):
+        cmd, x, y, misc = packet
+        if self.watching:
+            # Read along with the packet which made it a spectator
+            return
+        self.heard_at = time.time()
+        if cmd != 8:
+            self.last_activity = self.heard_at
+        
+        #print "Handle packet:", packet
+        if cmd == 0:
+            # O hai-packet 
+            # misc contains player id
+
+            self.width = x
+            self.height = y
+            
+            if self.room is None:
+                self.refuse()
+                return
+            
+            if not 0 < misc <= MAX_PLAYER_ID:
+                self.log("Player id %s invalid, refused.", misc, level=WARNING)
+                self.send(0, 13, 0, 0)
+                self.disconnect()
+                self.remove()
+                return
+            
+            for player in self.room.players:
+                if misc == player.player_id:
+                    self.log("Player id %s already taken, refused.", misc,
+                             level=WARNING)
+                    self.send(0, 12, 0, 0)
+                    self.disconnect()
+                    self.remove()
+                    return
+
+            self.log("Setting player id: %s (%sx%s)", misc, x, y)
+            self.player_id = misc
+            self.hello_timer.cancel()
+        elif cmd == 1:
+            # Protocol version request, sent before the hello
+            version = min(x, PROTOCOL_VERSION)
+            if version >= 2 and self.version == 1:
+                self.send(0, 15, version, 0)
+                self.version = version
+                if self.room is not None:
+                    # Positions the client needs for MSG_STEP
+                    self.queue(self.room.encoder.snapshot())
+                self.log("Using protocol version %s", version)
+        elif cmd == 6:
+            self.server.watch(self, x)
+        elif cmd == 7:
+            self.server.resume(self, x, y, misc)
+        elif cmd == 8:
+            # Heartbeat answered, from now on it may time out
+            if self.idle_timer is None:
+                self.idle_timer = self.server.timers.call_at(
+                    self.heard_at + settings.IDLE_TIMEOUT, self.idle_timeout)
+        elif cmd == 2:
+            if self.room.authoritative:
+                # Positions are calculated by the server itself
+                return
+            self.move_to(x, y)
+        elif cmd == 21:
+            # Activate nitro!
+            if self.nitrotank <= 25:
+                return
+            
+            self.nitro_start = time.time()
+            
+            r = settings.SPEED_NITRO * (1.0 - (100 - self.nitrotank) / 100.0)
+            self.speed = max(settings.SPEED_NORMAL - settings.SPEED_NITRO,
+                             self.speed - r)
+            
+            self.nitrotank = 0
+            self.nitro = True
+            self.room.mark_changed(self)
+        elif cmd == 22:
+            # Change direction (server-authoritative mode), U-turns are ignored
+            if x in DIR_DELTA and x != DIR_OPPOSITE[self.moved_direction]:
+                self.direction = x
+        else:
+            self.log("Unknown command received: %s", cmd, level=WARNING)
+    
+    def refuse(self):
+        """Says hello without a room to join (max_rooms reached)."""
+        if [room for room in self.server.rooms if room.game_state == "init"]:
+            self.log("Server is full, disconnecting...", level=WARNING)
+            self.send(0, 10, 0, 0) # Server full
+        else:
+            self.log("Game is running, disconnecting...")
+            self.send(0, 11, 0, 0) # Game is running
+        self.disconnect()
+        self.remove()
+    
+    def move_to(self, x, y):
+        if self.crashed:
+            # Ignore the new position, since the player already crashed!
+            return
+        
+        room = self.room
+        grid = room.map
+        if x <= 0 or x >= room.width - 1 or y <= 0 or \
+            y >= room.height - 1 or grid.get(x, y):
+
+            self.crashed = True
+            room.alive.discard(self)
+
+            if self.is_last() and len(room.players) > 1:
+                # I won! (only in multiplayer modus)
+                room.broadcast(self.player_id, 4, 0, 0)
+                self.log("I won!")
+            else:
+                # I lost 
+                room.broadcast(self.player_id, 3, 0, 0)
+                self.log("I'm crashed.")
+                self.remove_from_map()
+        else:
+            self.x = x
+            self.y = y
+            self.length += 1
+            grid.occupy(x, y, self.player_id)
+            if room.areas is not None:
+                room.areas.moved(self)
+            
+            if self.nitrotank < 100:
+                self.nitrotank = min(self.nitrotank + 1, 100)
+            
+            if self.nitro:
+                # In nitro
+                if (time.time() - self.nitro_start) >= settings.NITRO_TIME:
+                    # Nitro time over? Go back to normal.
+                    self.speed = settings.SPEED_NORMAL
+                    self.nitro = False
+                else:
+                    self.speed = min(settings.SPEED_NORMAL, self.speed * 1.01)
+            else:
+                # Check if the player runs along the border (10%) ->
+                # change the speed if neccessary!
+                if 0 < x < room.width * 0.1 or \
+                    room.width * 0.9 < x < room.width or \
+                    0 < y < room.height * 0.1 or \
+                    room.height * 0.9 < y < room.height:
+                    # Within the 10% border!
+                    self.speed = max(self.speed * 0.9,
+                                     settings.SPEED_NORMAL - settings.SPEED_BORDER)
+                else:
+                    self.speed = min(self.speed * 1.1,
+                                     settings.SPEED_NORMAL)
+            
+            # Notify all users about new coordinations
+            room.broadcast(self.player_id, 2, x, y)
+            room.mark_changed(self)
+    
+    def step(self):
+        """Moves one field into the current direction (authoritative mode)."""
+        dx, dy = DIR_DELTA[self.direction]
+        self.moved_direction = self.direction
+        self.move_to(self.x + dx, self.y + dy)
+    
+    def received(self, count):
+        """Handles the packets in buf_in, count bytes were just received."""
+        metrics = self.server.metrics
+        if metrics is None:
+            for packet in self.buf_in.unpack_all(PACKET_TOSERVER):
+                self.handle_packet(packet)
+            return
+        metrics.bytes_in += count
+        for packet in self.buf_in.unpack_all(PACKET_TOSERVER):
+            start = time.time()
+            self.handle_packet(packet)
+            metrics.observe_packet(packet[0], time.time() - start)
+    
+    def written(self):
+        """Called after the transport took data off buf_out."""
+        if self.deferred is not None and \
+            self.buf_out.size < settings.OUTPUT_HIGH_WATER // 2:
+            self.catch_up()
+    
+    def hello_timeout(self):
+        self.log("No hello after %d seconds, disconnecting",
+                 settings.HELLO_TIMEOUT, level=WARNING)
+        self.disconnect()
+        self.remove()
+    
+    def heartbeat(self):
+        """
+        Sent every HEARTBEAT seconds, dead connections fail to write. v1
+        clients get none in the lobby: they take the first record after the
+        hello for the game start.
+        """
+        if self.version >= 2 or \
+            (self.room is not None and self.room.game_state != "init"):
+            self.send(0, 8, 0, 0)
+        self.heartbeat_timer = self.server.timers.call_at(
+            time.time() + settings.HEARTBEAT, self.heartbeat)
+    
+    def idle_timeout(self):
+        deadline = self.heard_at + settings.IDLE_TIMEOUT
+        if deadline > time.time():
+            # Heard of it in the meantime
+            self.idle_timer = self.server.timers.call_at(deadline,
+                                                         self.idle_timeout)
+            return
+        self.log("Idle for %d seconds, disconnecting",
+                 settings.IDLE_TIMEOUT, level=WARNING)
+        self.disconnect()
+        self.remove()
+    
+    def cancel_timers(self):
+        self.hello_timer.cancel()
+        self.heartbeat_timer.cancel()
+        if self.idle_timer is not None:
+            self.idle_timer.cancel()
+    
+    def disconnect(self):
+        self.cancel_timers()
+        self.send(0, 9, 0, 0)
+        self.connection.close()
+        self.log("Gracefully disconnected by server")
+    
+    def remove(self):
+        # Remove connection due to socket errors
+        self.cancel_timers()
+        self.connection.detach()
+        if self.room:
+            self.remove_from_map()
+            self.room.leave(self)
+        self.log("Disconnected")
+    
+    def log(self, msg, *args, **kwargs):
+        if self.room:
+            context = "Room %s] [Player %s" % (self.room.number,
+                                              self.player_id or self.address[0])
+        else:
+            context = "Player %s" % (self.player_id or self.address[0])
+        logger.log(kwargs.get('level', INFO), context, msg, *args)
+    
+    def __repr__(self):
+        return '<Player %s>' % self.player_id
+
+class Room(object):
+    """
+    One match with its own players, map and state machine:
+    
+        init     - waiting for player_count players (with player ids)
+        resuming - restored from a checkpoint, waiting for the players to
+                   resume their seats (cmd 7), at most RESUME_TIMEOUT
+        running  - the game is on
+        over     - everybody crashed or somebody won; idle players are
+                   disconnected after 3 seconds, then the room is closed
+    
+    Rooms are updated by the TronServer whenever something happened to one
+    of their players or a wakeup time they asked for (TronServer.wake) is
+    reached.
+    """
+
+    count = 0
+
+    def __init__(self, server, player_count, authoritative):
+        Room.count += 1
+        self.number = Room.count
+        self.server = server
+        self.players = []
+        self.bots = [] # the BotPlayers among them
+        self.alive = set() # players which haven't crashed
+        self.player_count = player_count
+        self.game_state = "init"
+        self.map = Grid(0, 0)
+        self.width = 0
+        self.height = 0
+        self.authoritative = authoritative
+        self.next_tick = None # time of the next simulation step
+        self.wakeup = None # pending TronServer.wake() Timer
+        
+        self.frame = [] # events broadcast during this loop iteration
+        self.encoder = Encoder() # protocol v2 frames
+        self.changed = set() # players with changed speed/nitro tank
+        self.recorder = None # set from the game start on with --record
+        self.areas = None # AreaIndex of an arena (serve --arena)
+        self.seats = {} # player id -> Seat not resumed yet (resuming state)
+        self.resume_until = None
+        self.spectators = []
+        self.spectator_frames = [] # v2 frames not sent to the spectators yet
+        self.spectator_timer = None # pending flush_spectators() Timer
+        self.board = None # cached snapshot(), until the next frame
+    
+    def is_open(self):
+        return self.game_state == "init" and \
+            len(self.players) < self.player_count
+    
+    def join(self, player):
+        self.flush() # earlier events are none of its business
+        self.players.append(player)
+        if not player.crashed:
+            self.alive.add(player)
+        player.room = self
+    
+    def leave(self, player):
+        if player in self.players:
+            self.players.remove(player)
+        if player in self.bots:
+            self.bots.remove(player)
+        self.alive.discard(player)
+        self.changed.discard(player)
+        if self.areas is not None:
+            self.areas.remove(player)
+        self.server.wake(self)
+    
+    def watch(self, spectator):
+        """Adds a spectator, which gets the board as it is first."""
+        # Everything sent so far is part of the snapshot
+        self.flush()
+        self.flush_spectators()
+        self.spectators.append(spectator)
+        spectator.watching = self
+        spectator.queue(self.snapshot())
+    
+    def unwatch(self, spectator):
+        if spectator in self.spectators:
+            self.spectators.remove(spectator)
+    
+    def snapshot(self):
+        """
+        v2 records drawing the board for a spectator: a game start without
+        countdown, the trails, then the positions its MSG_STEPs continue
+        from. Empty until the game starts.
+        """
+        if self.game_state == "init":
+            return ""
+        if self.board is None:
+            width = self.width
+            pack = PACKET_POS.pack
+            parts = [encode_event(0, 1, width, self.height,
+                                  int(self.authoritative))]
+            for player in self.players:
+                if not player.length:
+                    continue
+                player_id = player.player_id
+                parts.extend([pack(MSG_POS, player_id, i % width, i // width)
+                              for i in self.map.indexes(player_id)])
+            parts.append(self.encoder.snapshot())
+            self.board = "".join(parts)
+        return self.board
+    
+    def flush_spectators(self):
+        """
+        Queues the frames collected since the last call, joined into one
+        chunk, to all spectators (see Spectator).
+        """
+        if self.spectator_timer is not None:
+            self.spectator_timer.cancel()
+            self.spectator_timer = None
+        if not self.spectator_frames:
+            return
+        chunk = "".join(self.spectator_frames)
+        self.spectator_frames = []
+        for spectator in self.spectators[:]:
+            spectator.queue_chunk(chunk, self)
+    
+    def broadcast(self, player_id, cmd, x, y, misc=0):
+        if not self.frame:
+            self.server.flushing.add(self)
+        self.frame.append((player_id, cmd, x, y, misc))
+    
+    def mark_changed(self, player):
+        self.changed.add(player)
+        self.server.flushing.add(self)
+    
+    def flush(self):
+        """
+        Sends the events of this loop iteration: they are packed into one 
+        frame per protocol version which is queued by reference to every 
+        player but the bots (v1 frames per speed and nitro tank too, their
+        records carry the recipient's). Speed and nitro tank are sent afterwards in a
+        small record for every player whose values changed. Spectators get
+        the v2 frames later, collected by flush_spectators.
+        """
+        metrics = self.server.metrics
+        if metrics is not None:
+            start = time.time()
+        if self.frame:
+            events = self.frame
+            self.frame = []
+            frames = {}
+            if self.areas is not None:
+                # Every indexed player gets the events of its area only
+                for player, area_events in \
+                    self.areas.distribute(events).iteritems():
+                    player.queue_frame(player.encoder.encode(area_events),
+                                       area_events)
+            for player in self.players[:]:
+                if self.areas is not None and player in self.areas:
+                    continue
+                if player in self.bots:
+                    continue # reads the room, no frames
+                if player.version >= 2:
+                    key = player.version
+                else:
+                    # v1 records carry the recipient's speed and nitro tank
+                    key = player.v1_state()
+                frame = frames.get(key)
+                if frame is None:
+                    if player.version >= 2:
+                        frame = self.encoder.encode(events)
+                    else:
+                        frame = encode_v1(events, *key)
+                    frames[key] = frame
+                player.queue_frame(frame, events)
+            self.board = None
+            if self.server.checkpoint is not None:
+                self.server.checkpoint.record(self, events)
+            if 2 not in frames:
+                if self.recorder is not None or self.spectators:
+                    frames[2] = self.encoder.encode(events)
+                else:
+                    # Nobody speaks v2 right now, but keep the positions up
+                    # to date
+                    self.encoder.encode(events, track_only=True)
+            if self.recorder is not None:
+                self.recorder.frame(time.time(), frames[2])
+            if self.spectators:
+                self.spectator_frames.append(frames[2])
+                if self.spectator_timer is None:
+                    self.spectator_timer = self.server.timers.call_at(
+                        time.time() + settings.SPECTATOR_INTERVAL,
+                        self.flush_spectators)
+        
+        while self.changed:
+            self.changed.pop().send_state()
+        
+        if metrics is not None:
+            metrics.flush.observe(time.time() - start)
+    
+    def update(self, now):
+        """Advances the state machine, called by the TronServer."""
+        if self.game_state == "init":
+            if self.players and len(self.players) == self.player_count and \
+                None not in [player.player_id for player in self.players]:
+                self.start()
+        
+        if self.game_state == "resuming":
+            if now >= self.resume_until or \
+                not [seat for seat in self.seats.itervalues()
+                     if not seat.crashed]:
+                self.go_on(now)
+            else:
+                self.server.wake(self, self.resume_until)
+        
+        if self.game_state == "running":
+            if self.authoritative:
+                self.tick(now)
+            
+            # Is only one playing player left? Let him win the round.
+            if len(self.alive) == 1 and len(self.players) > 1:
+                for winner in self.alive:
+                    self.broadcast(winner.player_id, 4, 0, 0)
+                self.game_state = "over"
+            elif not self.alive:
+                self.game_state = "over"
+            elif self.authoritative:
+                self.server.wake(self, self.next_step_at())
+        
+        if self.game_state == "over":
+            # Disconnect the players after 3 seconds idle time
+            wakeup = None
+            for player in self.players[:]:
+                idle_until = player.last_activity + 3
+                if now >= idle_until:
+                    player.disconnect()
+                    player.remove()
+                elif wakeup is None or idle_until < wakeup:
+                    wakeup = idle_until
+            if wakeup is not None:
+                self.server.wake(self, wakeup)
+        
+        if self.bots and len(self.bots) == len(self.players) and \
+            not self.seats:
+            # Nobody left to play against the bots
+            for bot in self.bots[:]:
+                bot.disconnect()
+                bot.remove()
+        
+        if not self.players and not self.seats:
+            # No players online? Close the room.
+            self.server.close_room(self)
+    
+    def start(self):
+        if self.server.arena:
+            # Bigger than the terminals, the clients scroll
+            self.width, self.height = self.server.arena
+            if settings.AOI_CELL:
+                self.areas = AreaIndex(self)
+        else:
+            # Determine minimal tty (bots take the humans' board)
+            humans = [player for player in self.players
+                      if player not in self.bots] or self.players
+            self.width = min([player.width for player in humans])
+            self.height = min([player.height for player in humans])
+        self.map = create_map(self.width, self.height)
+        
+        if self.server.record and not writer.failed:
+            self.recorder = Recorder(self, self.server.record)
+        
+        # Go and start the game!
+        self.log("Game starts in %s seconds.", settings.SECONDS)
+        self.broadcast(settings.SECONDS, 1, self.width, self.height,
+                       int(self.authoritative)) # Start game in 5 secs
+        self.game_state = "running"
+        
+        if self.authoritative:
+            self.place_players()
+        
+        # Tell the current speed
+        self.broadcast(0, 20, settings.SPEED_NORMAL, 0)
+        
+        # Nitro tank 100%
+        self.broadcast(0, 21, 100, 0)
+        
+        for player in self.players:
+            if player in self.bots:
+                continue
+            # To resume the seat with after a restart (serve --checkpoint)
+            player.key = random.randint(1, 0x7fff)
+            if self.server.checkpoint is not None:
+                player.send(0, 16, self.number & 0x7fff, player.key)
+        if self.server.checkpoint is not None:
+            self.server.checkpoint.wake()
+        
+        for bot in self.bots:
+            bot.start()
+    
+    def restore(self, number, width, height, seats, events):
+        """
+        Sets up a game restored from a checkpoint (see Checkpoint): map and
+        bots as they were, the other players get RESUME_TIMEOUT seconds to
+        resume their seats.
+        """
+        self.number = number
+        Room.count = max(Room.count, number)
+        self.width, self.height = width, height
+        self.map = create_map(width, height)
+        for player_id, cmd, x, y in events:
+            if cmd == 2:
+                self.map.occupy(x, y, player_id)
+            else:
+                self.map.clear_player(player_id)
+        if self.server.arena and settings.AOI_CELL:
+            self.areas = AreaIndex(self)
+        from bots import BotPlayer
+        for seat in seats.itervalues():
+            if seat.bot:
+                bot = BotPlayer(self.server, seat.player_id)
+                seat.apply(bot)
+                self.join(bot)
+                self.bots.append(bot)
+            else:
+                self.seats[seat.player_id] = seat
+        self.game_state = "resuming"
+        self.resume_until = time.time() + settings.RESUME_TIMEOUT
+        self.server.wake(self, self.resume_until)
+        self.log("Restored, waiting for %d player(s) to resume.",
+                 len(self.seats))
+    
+    def resume(self, player, seat):
+        """Seats player (a new connection) on seat, sends it the board."""
+        del self.seats[seat.player_id]
+        seat.apply(player)
+        player.hello_timer.cancel()
+        self.join(player)
+        
+        # A start without countdown, the trails, the known positions
+        events = [(0, 1, self.width, self.height, int(self.authoritative))]
+        events.extend([(player_id, 2, x, y, 0) for player_id, x, y in
+                       self.map.trails(0, 0, self.width, self.height)])
+        resumed = (player.player_id, 17, player.x, player.y,
+                   player.moved_direction)
+        if player.version >= 2:
+            player.queue(Encoder().encode(events) + self.encoder.snapshot() +
+                         encode_event(*resumed))
+        else:
+            player.queue(encode_v1(events + [resumed], *player.v1_state()))
+        player.sent_speed = player.sent_nitrotank = None
+        self.mark_changed(player)
+        if self.areas is not None:
+            self.areas.moved(player)
+        player.log("Resumed")
+        self.server.wake(self)
+    
+    def go_on(self, now):
+        """Continues a restored game, the seats not resumed are given up."""
+        for seat in self.seats.itervalues():
+            if seat.length:
+                self.map.clear_player(seat.player_id)
+                self.broadcast(seat.player_id, 5, 0, 0)
+            if not seat.crashed:
+                self.log("Player %s didn't come back.", seat.player_id)
+        self.seats = {}
+        self.game_state = "running"
+        if self.authoritative:
+            self.next_tick = now
+        for bot in self.bots:
+            bot.resume()
+        self.log("Game goes on.")
+    
+    def next_step_at(self):
+        """
+        Time of the first tick moving somebody; ticks without any movement
+        are caught up then.
+        """
+        wakeup = None
+        for player in self.alive:
+            ticks = max(0, int(math.ceil((player.speed - player.step_time) /
+                                         settings.TICK)) - 1)
+            t = self.next_tick + ticks * settings.TICK / 1000.0
+            if wakeup is None or t < wakeup:
+                wakeup = t
+        return wakeup
+    
+    def tick(self, now):
+        """
+        Fixed timestep simulation of the server-authoritative mode. Every
+        cycle collects the tick time and moves one field whenever it has
+        collected its current speed; all moves of a tick leave the server
+        as one batch.
+        """
+        if self.next_tick is None or now < self.next_tick:
+            return False
+        
+        if now - self.next_tick > 1:
+            # Way behind schedule (suspended?), don't try to catch up
+            self.next_tick = now
+        
+        while self.next_tick <= now:
+            self.next_tick += settings.TICK / 1000.0
+            for player in self.players:
+                if player.crashed:
+                    continue
+                player.step_time += settings.TICK
+                if player.step_time >= player.speed:
+                    player.step_time -= player.speed
+                    player.step()
+        return True
+    
+    def place_players(self):
+        """Sets the start positions (authoritative mode only)."""
+        for player in self.players:
+            player.x = random.randint(int(self.width * 0.1), int(self.width * 0.9))
+            player.y = random.randint(int(self.height * 0.1), int(self.height * 0.9))
+            player.direction = player.moved_direction = DIR_RIGHT
+            player.step_time = 0
+        self.next_tick = time.time() + settings.SECONDS
+    
+    def log(self, msg, *args, **kwargs):
+        logger.log(kwargs.get('level', INFO), "Room %s" % self.number, msg,
+                   *args)
+
+    def __repr__(self):
+        return '<Room %s>' % self.number
+
+class GameServer(object):
+    """
+    Rooms, timers and the Players of all connections, whatever transport
+    serves them (see the top of this module). Subclasses hand new
+    connections to connected(), send the rooms' events with flush_rooms()
+    before they wait for the next events and update the rooms they touched
+    with update_rooms().
+    """
+
+    room_class = Room
+
+    def __init__(self, player_count, port, transport, timers,
+                 authoritative=None, max_rooms=None, metrics_port=None,
+                 metrics_file=None, record=None, bots=None, arena=None,
+                 checkpoint=None):
+        self.player_count = player_count
+        if authoritative is None:
+            authoritative = settings.AUTHORITATIVE
+        self.authoritative = authoritative
+        if max_rooms is None:
+            max_rooms = settings.MAX_ROOMS
+        self.max_rooms = max_rooms
+        if record is None:
+            record = settings.RECORD_DIR
+        self.record = record # directory for the recordings
+        if bots is None:
+            bots = settings.BOTS
+        self.bots = min(bots, player_count - 1) # per room, see add_bots
+        if arena is None:
+            arena = settings.ARENA
+        self.arena = arena # (width, height) of every board, None = terminals
+        
+        self.rooms = []
+        self.flushing = set() # rooms with events to send
+        self.dirty = set() # rooms to update after this loop iteration
+        self.timers = timers # Timers or anything with their call_at()
+        self.coalesced_bytes = 0 # saved by coalescing slow clients' positions
+        self.dropped_bytes = 0 # pending for evicted clients
+        self.evicted = 0
+        self.skipped_bytes = 0 # of frames lagging spectators didn't get
+        
+        if metrics_port is None:
+            metrics_port = settings.METRICS_PORT
+        if metrics_file is None:
+            metrics_file = settings.METRICS_FILE
+        self.metrics_port = metrics_port # served by the subclass
+        self.metrics = None # instrumentation, off unless exported
+        if metrics_port or metrics_file:
+            self.metrics = Metrics(self, metrics_file)
+            if metrics_file:
+                self.timers.call_at(self.metrics.next_dump, self.dump_metrics)
+
+        logger.info("Serving Tron at port %d (TCP, %s).", port, transport)
+        if self.authoritative:
+            logger.info("Server-authoritative mode, simulating at %d ms ticks.",
+                        settings.TICK)
+        logger.info("At your service. Waiting for %s player(s) per game now.",
+                    player_count)
+        if self.max_rooms:
+            logger.info("Hosting up to %s games at once.", self.max_rooms)
+        if metrics_port:
+            logger.info("Metrics at http://127.0.0.1:%d/.", metrics_port)
+        if metrics_file:
+            logger.info("Writing metrics to %s.", metrics_file)
+        if record:
+            logger.info("Recording games to %s.", record)
+        if self.bots:
+            logger.info("%s bot(s) playing in every game.", self.bots)
+        if arena:
+            logger.info("Arenas of %dx%d fields.", arena[0], arena[1])
+        
+        if checkpoint is None:
+            checkpoint = settings.CHECKPOINT
+        self.checkpoint = None # Checkpoint of the running games
+        if checkpoint:
+            self.checkpoint = Checkpoint(self, checkpoint)
+            games = self.checkpoint.restore()
+            for number, width, height, authoritative, player_count, seats, \
+                events in games:
+                room = self.room_class(self, player_count,
+                                       bool(authoritative))
+                self.rooms.append(room)
+                room.restore(number, width, height, seats, events)
+            self.checkpoint.start()
+            logger.info("Checkpointing to %s, %d game(s) restored.",
+                        checkpoint, len(games))
+    
+    def connected(self, connection):
+        """Serves a new connection, returns its Player."""
+        player = Player(self, connection)
+        room = self.find_room()
+        if room is not None:
+            room.join(player)
+        # Without a room it may still watch (cmd 6), a hello is refused
+        # Please gief player ID! (and here's our protocol version)
+        player.send(0, 0, 0, 0, PROTOCOL_VERSION)
+        return player
+    
+    def flush_rooms(self):
+        while self.flushing:
+            self.flushing.pop().flush()
+    
+    def update_rooms(self, now):
+        while self.dirty:
+            self.dirty.pop().update(now)
+    
+    def find_room(self):
+        """Returns a room waiting for players (a new one if needed) or None."""
+        for room in self.rooms:
+            if room.is_open():
+                return room
+        if self.max_rooms and len(self.rooms) >= self.max_rooms:
+            return None
+        room = self.room_class(self, self.player_count, self.authoritative)
+        self.rooms.append(room)
+        room.log("Opened, waiting for %s player(s).", self.player_count)
+        self.add_bots(room)
+        return room
+    
+    def add_bots(self, room):
+        """
+        Seats the bots of a new room, they take the highest free player ids
+        (from MAX_PLAYER_ID down), the low ones are left to the humans.
+        """
+        from bots import BotPlayer
+        taken = set([player.player_id for player in room.players])
+        player_id = MAX_PLAYER_ID
+        for _ in xrange(self.bots):
+            while player_id in taken:
+                player_id -= 1
+            bot = BotPlayer(self, player_id)
+            room.join(bot)
+            room.bots.append(bot)
+            player_id -= 1
+    
+    def close_room(self, room):
+        if room in self.rooms:
+            self.rooms.remove(room)
+            room.log("No players online, room closed.")
+        if room.spectators:
+            # The last frames, then goodbye
+            room.flush()
+            room.flush_spectators()
+            for spectator in room.spectators[:]:
+                spectator.disconnect()
+        self.flushing.discard(room)
+        if room.recorder is not None:
+            room.recorder.close()
+            room.recorder = None
+        if room.wakeup is not None:
+            room.wakeup.cancel()
+            room.wakeup = None
+    
+    def watch(self, player, number):
+        """
+        Turns the connection of player into a Spectator of room number (0 =
+        the first running room, else the first one).
+        """
+        if player.version < 2:
+            player.log("Spectators need protocol version 2, disconnecting...",
+                       level=WARNING)
+            player.disconnect()
+            player.remove()
+            return
+        if player.room is not None:
+            # Gives up its place in the room it was waiting in
+            player.remove_from_map()
+            player.room.leave(player)
+            player.room = None
+        rooms = [room for room in self.rooms if room.players]
+        rooms = [room for room in rooms if room.number == number] or \
+            [room for room in rooms if room.game_state == "running"] or rooms
+        if not rooms:
+            player.refuse()
+            return
+        player.watching = True
+        player.cancel_timers()
+        spectator = Spectator(self, player)
+        rooms[0].watch(spectator)
+        spectator.log("Watching")
+    
+    def resume(self, player, number, key, player_id):
+        """
+        Gives player the seat player_id of the restored room number if the
+        key matches (cmd 7).
+        """
+        for room in self.rooms:
+            seat = room.seats.get(player_id)
+            if seat is not None and seat.key == key and \
+                room.number & 0x7fff == number:
+                break
+        else:
+            player.log("Nothing to resume as player %s, disconnecting...",
+                       player_id, level=WARNING)
+            player.send(0, 18, 0, 0)
+            player.disconnect()
+            player.remove()
+            return
+        if player.room is not None:
+            # Gives up its place in the room it was waiting in
+            player.room.leave(player)
+            player.room = None
+        room.resume(player, seat)
+    
+    def wake(self, room, when=None):
+        """Has room updated after this loop iteration or at time when."""
+        if when is None:
+            self.dirty.add(room)
+            return
+        if room.wakeup is not None:
+            if room.wakeup.when <= when:
+                return
+            room.wakeup.cancel()
+        room.wakeup = self.timers.call_at(when, self.wake_up, room)
+    
+    def wake_up(self, room):
+        room.wakeup = None
+        self.dirty.add(room)
+    
+    def dump_metrics(self):
+        now = time.time()
+        self.metrics.dump(now)
+        self.timers.call_at(self.metrics.next_dump, self.dump_metrics)
+    
+    def disconnect_all(self):
+        logger.info("Disconnecting all players...")
+        # Closing all client connections
+        for room in self.rooms:
+            for player in room.players:
+                player.disconnect()
+            for spectator in room.spectators[:]:
+                spectator.disconnect()
+            if room.recorder is not None:
+                room.flush()
+                room.recorder.close()
+        if self.checkpoint is not None:
+            # Nothing left to resume
+            self.checkpoint.close(clear=True)
+        writer.close()
+        logger.info("Disconnected.")
@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+
+"""
+Server log. Records are handed to a background writer thread through a
+bounded queue, so the server loop never waits for the terminal or the disk;
+when the queue is full, records are dropped (and counted) instead.
+
+Every connection (or room) logs under its own context, e.g. "Room 1" or
+"Room 1] [Player 2"; repeated messages of a context are rate limited to
+LOG_RATE per LOG_RATE_WINDOW seconds, the number of suppressed ones is
+logged once the window is over.
+
+With LOG_QUEUE = 0 the records are written synchronously (no thread).
+"""
+
+import os
+import sys
+import time
+import threading
+import Queue
+
+import settings
+
+DEBUG, INFO, WARNING, ERROR = 10, 20, 30, 40
+LEVELS = {"debug": DEBUG, "info": INFO, "warning": WARNING, "error": ERROR}
+LEVEL_NAMES = dict((level, name.upper()) for name, level in LEVELS.items())
+
+class Logger(object):
+    def __init__(self, level=None, filename=None, queue_size=None):
+        self.level = LEVELS[level or settings.LOG_LEVEL]
+        self.filename = filename or settings.LOG_FILE
+        if queue_size is None:
+            queue_size = settings.LOG_QUEUE
+        self.queue_size = queue_size # 0 = write synchronously
+        self.queue = None
+        self.thread = None
+        self.pid = None # process of the writer thread (not inherited by fork)
+        self.stream = None
+        self.limits = {} # (context, message) -> [window start, count]
+        self.next_prune = 0
+        self.dropped = 0 # records lost to a full queue
+        self.suppressed = 0 # records swallowed by the rate limit
+
+    def configure(self, level=None, filename=None, queue_size=None):
+        self.close()
+        self.__init__(level, filename, queue_size)
+
+    def start(self):
+        if self.filename:
+            self.stream = open(self.filename, "a")
+        else:
+            self.stream = sys.stdout
+        self.pid = os.getpid()
+        if self.queue_size:
+            self.queue = Queue.Queue(self.queue_size)
+            self.thread = threading.Thread(target=self.writer)
+            self.thread.daemon = True
+            self.thread.start()
+
+    def log(self, level, context, msg, *args):
+        if level < self.level:
+            return
+        now = time.time()
+        if context is not None and not self.allow(context, msg, now):
+            return
+        if self.pid != os.getpid():
+            self.start()
+        record = (now, level, context, msg, args)
+        if self.queue is None:
+            self.write(record)
+            self.stream.flush()
+            return
+        try:
+            self.queue.put_nowait(record)
+        except Queue.Full:
+            self.dropped += 1
+
+    def allow(self, context, msg, now):
+        if now >= self.next_prune:
+            self.prune(now)
+        key = (context, msg)
+        limit = self.limits.get(key)
+        if limit is None:
+            self.limits[key] = [now, 1]
+            return True
+        if now - limit[0] >= settings.LOG_RATE_WINDOW:
+            self.summarize(key, limit)
+            limit[0], limit[1] = now, 0
+        limit[1] += 1
+        if limit[1] > settings.LOG_RATE:
+            self.suppressed += 1
+            return False
+        return True
+
+    def summarize(self, key, limit):
+        if limit[1] > settings.LOG_RATE:
+            self.log(WARNING, None, "[%s] %d similar messages suppressed: %s",
+                     key[0], limit[1] - settings.LOG_RATE, key[1])
+
+    def prune(self, now):
+        """Drops the expired windows (of closed connections mostly)."""
+        self.next_prune = now + settings.LOG_RATE_WINDOW
+        for key, limit in self.limits.items():
+            if now - limit[0] >= settings.LOG_RATE_WINDOW:
+                self.summarize(key, limit)
+                del self.limits[key]
+
+    def debug(self, msg, *args):
+        self.log(DEBUG, None, msg, *args)
+
+    def info(self, msg, *args):
+        self.log(INFO, None, msg, *args)
+
+    def warning(self, msg, *args):
+        self.log(WARNING, None, msg, *args)
+
+    def error(self, msg, *args):
+        self.log(ERROR, None, msg, *args)
+
+    def write(self, record):
+        when, level, context, msg, args = record
+        if args:
+            msg = msg % args
+        if context is not None:
+            msg = "[%s] %s" % (context, msg)
+        self.stream.write("%s %-7s %s\n" % (
+            time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(when)),
+            LEVEL_NAMES[level], msg))
+
+    def writer(self):
+        queue = self.queue
+        while True:
+            record = queue.get()
+            if record is None:
+                break
+            self.write(record)
+            if queue.empty():
+                self.stream.flush()
+
+    def close(self):
+        """Writes the pending records (waits up to a second)."""
+        if self.thread is not None and self.pid == os.getpid():
+            try:
+                self.queue.put(None, timeout=1)
+            except Queue.Full:
+                pass
+            self.thread.join(1)
+        if self.stream is not None:
+            try:
+                self.stream.flush()
+            except IOError:
+                pass
+            if self.filename:
+                self.stream.close()
+        self.thread = self.queue = self.stream = self.pid = None
+
+logger = Logger()
@@ -0,0 +1,226 @@
+# -*- coding: utf-8 -*-
+
+"""
+Optional instrumentation of the TronServer (serve --metrics-port/-file).
+
+The server only collects anything if TronServer.metrics is set; the hot
+paths check for it once and otherwise run their plain code. Values which
+can be read from the server state (connections, output backlog, map size)
+are only computed when the metrics are exported.
+
+The export is the Prometheus text format, served over HTTP on a local port
+and/or written to a file every METRICS_INTERVAL seconds.
+"""
+
+import os
+import bisect
+import errno
+import socket
+import time
+
+from ..common import OutputQueue
+import settings
+from log import logger
+
+# Upper bounds (seconds) of the histogram buckets
+BUCKETS = (.00001, .00005, .0001, .0005, .001, .005, .01, .05, .1, .5, 1)
+
+class Histogram(object):
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def render(self, name, labels=""):
+        lines = []
+        total = 0
+        for bound, count in zip(BUCKETS + ("+Inf",), self.counts):
+            total += count
+            lines.append('%s_bucket{%sle="%s"} %d' % (name, labels, bound,
+                                                     total))
+        labels = labels.rstrip(",")
+        labels = labels and "{%s}" % labels
+        lines.append("%s_sum%s %f" % (name, labels, self.sum))
+        lines.append("%s_count%s %d" % (name, labels, self.count))
+        return lines
+
+class Metrics(object):
+    def __init__(self, server, dump_file=None):
+        self.server = server
+        self.started = time.time()
+        self.dump_file = dump_file
+        self.next_dump = self.started + settings.METRICS_INTERVAL
+
+        self.loop = Histogram() # work per loop iteration (poll excluded)
+        self.packets = {} # cmd -> Histogram of handle_packet
+        self.flush = Histogram() # Room.flush, the broadcast fan-out
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    def observe_packet(self, cmd, seconds):
+        histogram = self.packets.get(cmd)
+        if histogram is None:
+            histogram = self.packets[cmd] = Histogram()
+        histogram.observe(seconds)
+
+    def render(self):
+        server = self.server
+        players = [player for room in server.rooms for player in room.players]
+        backlog = [player.buf_out.size for player in players]
+
+        lines = [
+            "# TYPE asciitron_loop_seconds histogram",
+        ]
+        lines.extend(self.loop.render("asciitron_loop_seconds"))
+        lines.append("# TYPE asciitron_handle_packet_seconds histogram")
+        for cmd in sorted(self.packets):
+            lines.extend(self.packets[cmd].render(
+                "asciitron_handle_packet_seconds", 'cmd="%d",' % cmd))
+        lines.append("# TYPE asciitron_broadcast_seconds histogram")
+        lines.extend(self.flush.render("asciitron_broadcast_seconds"))
+        lines.extend([
+            "# TYPE asciitron_bytes_in_total counter",
+            "asciitron_bytes_in_total %d" % self.bytes_in,
+            "# TYPE asciitron_bytes_out_total counter",
+            "asciitron_bytes_out_total %d" % self.bytes_out,
+            "# TYPE asciitron_coalesced_bytes_total counter",
+            "asciitron_coalesced_bytes_total %d" % server.coalesced_bytes,
+            "# TYPE asciitron_dropped_bytes_total counter",
+            "asciitron_dropped_bytes_total %d" % server.dropped_bytes,
+            "# TYPE asciitron_evicted_total counter",
+            "asciitron_evicted_total %d" % server.evicted,
+            "# TYPE asciitron_spectator_skipped_bytes_total counter",
+            "asciitron_spectator_skipped_bytes_total %d" % server.skipped_bytes,
+            "# TYPE asciitron_log_dropped_total counter",
+            "asciitron_log_dropped_total %d" % logger.dropped,
+            "# TYPE asciitron_log_suppressed_total counter",
+            "asciitron_log_suppressed_total %d" % logger.suppressed,
+            "# TYPE asciitron_rooms gauge",
+            "asciitron_rooms %d" % len(server.rooms),
+            "# TYPE asciitron_players gauge",
+            "asciitron_players %d" % len(players),
+            "# TYPE asciitron_spectators gauge",
+            "asciitron_spectators %d" % sum(len(room.spectators)
+                                            for room in server.rooms),
+            "# TYPE asciitron_buf_out_bytes gauge",
+            "asciitron_buf_out_bytes %d" % sum(backlog),
+            "# TYPE asciitron_buf_out_max_bytes gauge",
+            "asciitron_buf_out_max_bytes %d" % max(backlog or [0]),
+            "# TYPE asciitron_map_fields gauge",
+            "asciitron_map_fields %d" % sum(room.map.width * room.map.height
+                                            for room in server.rooms),
+            "# TYPE asciitron_map_occupied_fields gauge",
+            "asciitron_map_occupied_fields %d" % sum(len(room.map)
+                                                     for room in server.rooms),
+            "# TYPE asciitron_uptime_seconds gauge",
+            "asciitron_uptime_seconds %f" % (time.time() - self.started),
+        ])
+        return "\n".join(lines) + "\n"
+
+    def dump(self, now):
+        """Writes the metrics file if it is due."""
+        if self.dump_file is None or now < self.next_dump:
+            return
+        self.next_dump = now + settings.METRICS_INTERVAL
+        temp = self.dump_file + ".tmp"
+        f = open(temp, "w")
+        try:
+            f.write(self.render())
+        finally:
+            f.close()
+        os.rename(temp, self.dump_file)
+
+def http_response(body):
+    return ("HTTP/1.0 200 OK\r\n"
+            "Content-Type: text/plain; version=0.0.4\r\n"
+            "Content-Length: %d\r\n\r\n%s" % (len(body), body))
+
+class MetricsListener(object):
+    """Local HTTP port answering every request with the metrics."""
+
+    room = None
+
+    def __init__(self, server, port):
+        self.server = server
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.socket.bind(('127.0.0.1', port))
+        self.socket.listen(5)
+
+    def handle_read(self):
+        try:
+            conn, address = self.socket.accept()
+        except socket.error:
+            return
+        self.server.engine.register(MetricsRequest(self.server, conn))
+
+    def fileno(self):
+        return self.socket.fileno()
+
+    def close(self):
+        self.server.engine.unregister(self)
+        self.socket.close()
+
+class MetricsRequest(object):
+    """
+    One HTTP request, served by the engine like a SocketConnection: the
+    response goes out as the client takes it, the game loop never blocks.
+    """
+
+    room = None
+
+    def __init__(self, server, connection):
+        self.server = server
+        self.socket = connection
+        self.socket.setblocking(0)
+        self.request = ""
+        self.buf_out = None # the response, once the request is complete
+
+    def handle_read(self):
+        try:
+            data = self.socket.recv(4096)
+        except socket.error, e:
+            if e.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK):
+                return
+            data = ""
+        if not data:
+            self.close()
+            return
+        if self.buf_out is not None:
+            return # answered already
+        self.request += data
+        if "\r\n\r\n" not in self.request and len(self.request) < 65536:
+            # Wait for the rest of the request
+            return
+        self.buf_out = OutputQueue()
+        self.buf_out.append(http_response(self.server.metrics.render()))
+        self.handle_write()
+
+    def handle_write(self):
+        buf_out = self.buf_out
+        while buf_out:
+            data = buf_out.peek()
+            try:
+                sent_bytes = self.socket.send(data)
+            except socket.error, e:
+                if e.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    self.server.engine.want_write(self, True)
+                    return
+                break
+            if sent_bytes == 0:
+                break
+            buf_out.consume(sent_bytes)
+        # Sent (or the client is gone)
+        self.close()
+
+    def close(self):
+        self.server.engine.unregister(self)
+        self.socket.close()
+
+    def fileno(self):
+        return self.socket.fileno()
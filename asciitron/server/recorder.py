@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+
+"""
+Recording of the rooms (serve --record DIR), see common/recording.py for
+the format.
+
+The serve loop only appends the frames it encoded anyway to an in-memory
+list; every RECORD_BUFFER bytes the list is handed to a writer thread which
+joins, compresses and writes it. Files are never touched by the loop.
+"""
+
+import os
+import time
+import threading
+import Queue
+
+from ..common.recording import *
+from log import logger
+import settings
+
+class Writer(object):
+    """
+    Background thread doing the file work of all recorders. The first job
+    failing stops the recording: the later ones are dropped.
+    """
+
+    def __init__(self):
+        self.queue = None
+        self.thread = None
+        self.pid = None
+        self.failed = False
+
+    def put(self, job):
+        if self.failed:
+            return
+        if self.pid != os.getpid():
+            # First job of this process (workers are forked)
+            self.pid = os.getpid()
+            self.queue = Queue.Queue()
+            self.thread = threading.Thread(target=self.run)
+            self.thread.daemon = True
+            self.thread.start()
+        self.queue.put(job)
+
+    def run(self):
+        queue = self.queue
+        while True:
+            job = queue.get()
+            if job is None:
+                break
+            if self.failed:
+                continue
+            try:
+                job()
+            except Exception, e:
+                self.failed = True
+                logger.error("Recording failed (%s), recording stopped.", e)
+
+    def close(self):
+        """Finishes the pending jobs."""
+        if self.thread is not None and self.pid == os.getpid():
+            self.queue.put(None)
+            self.thread.join()
+        self.thread = self.queue = self.pid = None
+
+writer = Writer()
+
+class Recorder(object):
+    """
+    Records one room. Only frame(), snapshot() and close() are called by
+    the loop, the other methods run in the writer thread.
+    """
+
+    def __init__(self, room, directory):
+        self.room = room
+        self.started = time.time()
+        self.filename = os.path.join(directory, "game-%s-%d-%d.tron" % (
+            time.strftime("%Y%m%d-%H%M%S", time.localtime(self.started)),
+            os.getpid(), room.number))
+        self.next_snapshot = self.started + settings.RECORD_SNAPSHOT
+        self.chunks = []
+        self.size = 0 # of the chunks
+        self.file = None
+        self.snapshots = [] # (ms, offset), kept by the writer
+        writer.put(self.open)
+
+    def frame(self, now, frame):
+        """Records a v2 frame the room broadcast."""
+        ms = int((now - self.started) * 1000)
+        self.chunks.append(RECORD.pack(REC_FRAME, ms, len(frame)))
+        self.chunks.append(frame)
+        self.size += RECORD.size + len(frame)
+        if now >= self.next_snapshot:
+            self.snapshot(now)
+        elif self.size >= settings.RECORD_BUFFER:
+            self.flush()
+
+    def snapshot(self, now):
+        self.next_snapshot = now + settings.RECORD_SNAPSHOT
+        self.flush()
+        ms = int((now - self.started) * 1000)
+        room = self.room
+        # Copies only, the writer compresses them
+        args = (room.width, room.height, room.authoritative,
+                room.encoder.snapshot(),
+                [(player.player_id,
+                  room.map.indexes(player.player_id).tostring())
+                 for player in room.players if player.length])
+        writer.put(lambda: self.write_snapshot(ms, args))
+
+    def flush(self):
+        if not self.chunks:
+            return
+        chunks = self.chunks
+        self.chunks = []
+        self.size = 0
+        writer.put(lambda: self.file.write("".join(chunks)))
+
+    def close(self):
+        self.flush()
+        writer.put(self.finish)
+
+    def open(self):
+        self.file = open(self.filename, "wb")
+        self.file.write(HEADER.pack(MAGIC, RECORDING_VERSION, self.started))
+
+    def write_snapshot(self, ms, args):
+        self.snapshots.append((ms, self.file.tell()))
+        self.file.write(pack_record(REC_SNAPSHOT, ms, pack_snapshot(*args)))
+
+    def finish(self):
+        offset = self.file.tell()
+        index = "".join([INDEX_ENTRY.pack(ms, snapshot_offset)
+                         for ms, snapshot_offset in self.snapshots])
+        self.file.write(pack_record(REC_INDEX, 0, index))
+        self.file.write(TRAILER.pack(offset, INDEX_MAGIC))
+        self.file.close()
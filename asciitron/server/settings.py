@@ -13,6 +13,107 @@ SPEED_NITRO = 90 # speed will be subtracted from normal speed
 
 NITRO_TIME = 3
 
+# Server-authoritative mode: the server moves all cycles itself, clients only
+# send direction changes and nitro requests.
+AUTHORITATIVE = False
+TICK = 10 # in ms, fixed simulation timestep (authoritative mode only)
+
+# Games hosted at once, 0 = unlimited (new players always get a room)
+MAX_ROOMS = 0
+
+# Worker processes sharing the port, 1 = serve from a single process
+WORKERS = 1
+
+# Connection timers (seconds): players have to say hello (send their id)
+# within HELLO_TIMEOUT, get a heartbeat (cmd 8) every HEARTBEAT (v1 clients
+# from their game's start on) and, if their client answers heartbeats, are
+# disconnected after IDLE_TIMEOUT without any packet
+HELLO_TIMEOUT = 10
+HEARTBEAT = 5
+IDLE_TIMEOUT = 30
+
+# Output backpressure (bytes pending per player): past OUTPUT_HIGH_WATER the
+# position updates for that player are coalesced to the latest one per
+# player, past OUTPUT_LIMIT it is disconnected
+OUTPUT_HIGH_WATER = 64 * 1024
+OUTPUT_LIMIT = 1024 * 1024
+
+# Spectators (cmd 6) get the frames of their room every SPECTATOR_INTERVAL
+# seconds; past SPECTATOR_HIGH_WATER bytes pending they skip frames until
+# they catch up, after SPECTATOR_STALL seconds behind they are disconnected
+SPECTATOR_INTERVAL = .05
+SPECTATOR_HIGH_WATER = 64 * 1024
+SPECTATOR_STALL = 10
+
+# Instrumentation, off unless exported: Prometheus text format on a local
+# HTTP port (0 = none) and/or written to a file every METRICS_INTERVAL seconds
+METRICS_PORT = 0
+METRICS_FILE = None
+METRICS_INTERVAL = 10
+
+# Server log: minimum level ("debug", "info", "warning", "error"), file
+# (None = stdout), records queued for the writer thread (0 = write
+# synchronously, when full records are dropped) and repeated messages per
+# connection allowed every LOG_RATE_WINDOW seconds
+LOG_LEVEL = "info"
+LOG_FILE = None
+LOG_QUEUE = 10000
+LOG_RATE = 10
+LOG_RATE_WINDOW = 10
+
+# Game recordings (serve --record): directory (None = off), seconds between
+# the snapshots a replay can seek to and bytes buffered before the writer
+# thread gets them
+RECORD_DIR = None
+RECORD_SNAPSHOT = 5
+RECORD_BUFFER = 64 * 1024
+
+# UDP transport (serve --udp): datagrams carry at most UDP_DATAGRAM bytes,
+# the newest positions and unacknowledged events ride along in the next
+# UDP_COPIES datagrams, events are then resent every UDP_RESEND seconds
+# until acknowledged
+UDP_DATAGRAM = 1200
+UDP_COPIES = 3
+UDP_RESEND = .1
+
+# AI players (serve --bots) seated in every game, counted in its player count,
+# and the board they ask for (the humans' one is taken if it is smaller)
+BOTS = 0
+BOT_WIDTH = 200
+BOT_HEIGHT = 60
+
+# Arenas (serve --arena): every board is ARENA = (width, height) fields
+# instead of the smallest terminal of its players, the clients scroll their
+# view. Players then only get the positions within their terminal size
+# around their cycle, indexed in cells of AOI_CELL x AOI_CELL fields (0 =
+# everybody gets everything)
+ARENA = None
+AOI_CELL = 32
+
+# Checkpoints of the running games (serve --checkpoint FILE, None = off):
+# every CHECKPOINT_INTERVAL seconds the changes since the last one are
+# appended to the memory-mapped FILE of CHECKPOINT_SIZE bytes, the rooms in
+# CHECKPOINT_SLICES turns spread over the interval. A server started with
+# the file again waits RESUME_TIMEOUT seconds for the players of the games
+# in it to come back (one process, TCP only)
+CHECKPOINT = None
+CHECKPOINT_INTERVAL = .1
+CHECKPOINT_SLICES = 10
+CHECKPOINT_SIZE = 32 * 1024 * 1024
+RESUME_TIMEOUT = 5
+
+# Storage of the trails on the board: "grid" one byte per field of the
+# board, "segments" their straight runs (memory grows with the turns, a step
+# costs about three times as much). None: segments for boards of
+# SEGMENTS_FIELDS fields or more (arenas, serve --arena), else the grid
+TRAILS = None
+SEGMENTS_FIELDS = 250000
+
+# Event engine of the server loop: "epoll", "select" or None (best
+# available), "asyncio" serves from an asyncio event loop instead (trollius
+# on Python 2, uvloop if installed; single process only)
+ENGINE = None
+
 FEATURES = [
     #BorderSpeedup
 ]
\ No newline at end of file
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+
+"""
+Spectators: read-only connections watching a room (c -> s cmd 6).
+"""
+
+import time
+
+from ..common import *
+from log import logger, INFO, WARNING
+import settings
+
+class Spectator(object):
+    """
+    Takes over the connection of a Player which asked to watch a room
+    (GameServer.watch). It gets the board as it is when it starts watching
+    (Room.snapshot), then the room's v2 frames: they are collected and
+    joined into one chunk every SPECTATOR_INTERVAL, which is queued by
+    reference to all spectators (Room.flush_spectators).
+
+    Spectators never hold back the players: one with SPECTATOR_HIGH_WATER
+    bytes pending skips the chunks and gets a fresh snapshot once it has
+    read half of its backlog, if it is still behind after SPECTATOR_STALL
+    seconds it is disconnected.
+    """
+
+    room = None # never playing in a room
+
+    def __init__(self, server, player):
+        self.server = server
+        self.connection = player.connection
+        self.connection.handler = self
+        self.address = player.address
+        self.buf_in = player.buf_in
+        self.buf_out = player.buf_out # hello and version confirmation
+        self.watching = None # the Room
+        self.stall_timer = None # set while skipping chunks
+
+    def queue(self, data):
+        if not data:
+            return
+        if not self.buf_out:
+            self.connection.want_write()
+        self.buf_out.append(data)
+
+    def queue_chunk(self, chunk, room):
+        """Queues a chunk of frames, see Room.flush_spectators."""
+        size = self.buf_out.size
+        if self.stall_timer is None:
+            if size < settings.SPECTATOR_HIGH_WATER:
+                self.queue(chunk)
+                return
+            self.log("%d bytes pending, skipping frames", size, level=WARNING)
+            self.stall_timer = self.server.timers.call_at(
+                time.time() + settings.SPECTATOR_STALL, self.stall)
+        elif size < settings.SPECTATOR_HIGH_WATER // 2:
+            # The board as it is after this chunk replaces the skipped ones
+            self.stall_timer.cancel()
+            self.stall_timer = None
+            self.queue(room.snapshot())
+            return
+        self.server.skipped_bytes += len(chunk)
+
+    def stall(self):
+        self.stall_timer = None
+        self.server.evicted += 1
+        self.server.dropped_bytes += self.buf_out.size
+        self.log("Behind for %d seconds, disconnecting",
+                 settings.SPECTATOR_STALL, level=WARNING)
+        self.buf_out = OutputQueue()
+        self.connection.abort(encode_event(0, 9, 0, 0))
+        self.remove()
+
+    def received(self, count):
+        # Spectators have nothing to say
+        self.buf_in.clear()
+
+    def written(self):
+        pass
+
+    def disconnect(self):
+        self.queue(encode_event(0, 9, 0, 0))
+        self.connection.close()
+        self.remove()
+        self.log("Gracefully disconnected by server")
+
+    def remove(self):
+        if self.stall_timer is not None:
+            self.stall_timer.cancel()
+            self.stall_timer = None
+        self.connection.detach()
+        if self.watching is not None:
+            self.watching.unwatch(self)
+            self.log("Stopped watching")
+            self.watching = None
+
+    def log(self, msg, *args, **kwargs):
+        if self.watching is not None:
+            context = "Room %s] [Spectator %s" % (self.watching.number,
+                                                 self.address[0])
+        else:
+            context = "Spectator %s" % self.address[0]
+        logger.log(kwargs.get('level', INFO), context, msg, *args)
+
+    def __repr__(self):
+        return '<Spectator %s>' % (self.address,)
@@ -0,0 +1,247 @@
+# -*- coding: utf-8 -*-
+
+"""
+Multi-process mode: a supervisor forks worker processes which share its
+listening socket, each one hosting its own rooms (see TronServer).
+
+Only one worker accepts connections at a time. As soon as its open room is
+full it stops accepting and tells the supervisor, which hands accepting over
+to the least loaded worker. All players of a room therefore end up in the
+same process, and every new room goes to the worker with the fewest players.
+A paused worker whose room gets a free seat again (a player left before the
+game started) reports it, the supervisor pauses the accepting worker and
+hands accepting back to it, so the room fills up before new ones open.
+
+Control channel (one socketpair per worker, one line per message):
+
+    worker -> supervisor:  "load <players>"  (a room was closed)
+                           "full <players>"  (stopped accepting)
+                           "open <players>"  (paused with a free seat)
+    supervisor -> worker:  "accept"
+                           "pause"
+"""
+
+import errno
+import os
+import select
+import signal
+import socket
+
+from tronserver import TronServer, listen
+from log import logger
+
+class Control(object):
+    """Line based end of a control channel."""
+
+    room = None # never belongs to a room, see TronServer.run_once
+
+    def __init__(self, sock):
+        self.socket = sock
+        self.buf_in = ""
+
+    def send(self, *args):
+        try:
+            self.socket.sendall(" ".join(map(str, args)) + "\n")
+        except socket.error:
+            pass
+
+    def read_lines(self):
+        """Returns all complete lines received, None on a closed channel."""
+        try:
+            data = self.socket.recv(4096)
+        except socket.error:
+            data = ""
+        if not data:
+            return None
+        lines = (self.buf_in + data).split("\n")
+        self.buf_in = lines.pop()
+        return [line.split() for line in lines if line]
+
+    def fileno(self):
+        return self.socket.fileno()
+
+class Worker(TronServer):
+    """TronServer which only accepts connections when told to."""
+
+    def __init__(self, number, control, *args, **kwargs):
+        # One metrics port/file per worker
+        if kwargs.get('metrics_port'):
+            kwargs['metrics_port'] += number - 1
+        if kwargs.get('metrics_file'):
+            kwargs['metrics_file'] += ".%d" % number
+        TronServer.__init__(self, *args, **kwargs)
+        self.number = number
+        self.control = control
+        self.control.handle_read = self.handle_control
+        self.engine.register(self.control)
+        self.reported = False # "open" sent since the last pause
+        self.pause()
+
+    def pause(self):
+        self.engine.unregister(self.socket)
+        self.reported = False
+
+    def unpause(self):
+        self.engine.register(self.socket)
+
+    def report_open(self):
+        """Tells the supervisor when a room has a free seat while paused."""
+        if self.reported or self.engine.is_registered(self.socket):
+            return
+        if [room for room in self.rooms if room.is_open()]:
+            self.reported = True
+            self.control.send("open", self.load())
+
+    def handle_control(self):
+        lines = self.control.read_lines()
+        if lines is None:
+            # The supervisor is gone
+            raise KeyboardInterrupt
+        for line in lines:
+            if line[0] == "accept":
+                self.unpause()
+            elif line[0] == "pause":
+                self.pause()
+                self.report_open()
+
+    def load(self):
+        return sum(len(room.players) for room in self.rooms)
+
+    def accept(self):
+        try:
+            TronServer.accept(self)
+        except socket.error, e:
+            if e.args[0] not in (errno.EAGAIN, errno.EWOULDBLOCK):
+                raise
+            # Another worker was faster
+            return
+        if not [room for room in self.rooms if room.is_open()]:
+            self.pause()
+            self.control.send("full", self.load())
+
+    def update_rooms(self, now):
+        TronServer.update_rooms(self, now)
+        self.report_open()
+
+    def close_room(self, room):
+        TronServer.close_room(self, room)
+        self.control.send("load", self.load())
+
+class Supervisor(object):
+    def __init__(self, worker_count, player_count, port, **kwargs):
+        self.socket = listen(port)
+        self.socket.setblocking(0) # all workers poll it
+        self.worker_count = worker_count
+        self.player_count = player_count
+        self.port = port
+        self.kwargs = kwargs
+        self.workers = {} # pid -> [Control, load]
+        self.acceptor = None # pid of the accepting worker
+        self.waiting = [] # pids of paused workers with a free seat
+        self.preempted = set() # pids told to pause for one of them
+
+        logger.info("Supervising %d workers at port %d.", worker_count, port)
+
+    def start(self):
+        for number in xrange(self.worker_count):
+            ours, theirs = socket.socketpair()
+            pid = os.fork()
+            if pid == 0:
+                ours.close()
+                for control, load in self.workers.values():
+                    control.socket.close()
+                self.run_worker(number + 1, Control(theirs))
+                os._exit(0)
+            theirs.close()
+            self.workers[pid] = [Control(ours), 0]
+        self.hand_over()
+
+    def run_worker(self, number, control):
+        server = Worker(number, control, player_count=self.player_count,
+                        port=self.port, sock=self.socket, **self.kwargs)
+        try:
+            server.serve()
+        except KeyboardInterrupt:
+            signal.signal(signal.SIGINT, signal.SIG_IGN)
+            server.stop()
+
+    def hand_over(self):
+        """
+        Lets the next worker accept players: the first one waiting with a
+        free seat, else the least loaded.
+        """
+        if not self.workers:
+            self.acceptor = None
+            return
+        if self.waiting:
+            self.acceptor = self.waiting.pop(0)
+        else:
+            self.acceptor = min(self.workers,
+                                key=lambda pid: self.workers[pid][1])
+        self.preempted.discard(self.acceptor)
+        self.workers[self.acceptor][0].send("accept")
+
+    def reopen(self, pid):
+        """
+        Worker pid is paused with a free seat: it takes over accepting, a
+        worker paused for it gets its turn again after the waiting ones.
+        """
+        if pid == self.acceptor or pid in self.waiting:
+            return
+        if pid in self.preempted:
+            self.preempted.discard(pid)
+            self.waiting.append(pid)
+            return
+        if self.acceptor is not None:
+            # Answers "open" if its own room has players waiting
+            self.workers[self.acceptor][0].send("pause")
+            self.preempted.add(self.acceptor)
+        self.waiting.insert(0, pid)
+        self.hand_over()
+
+    def serve(self):
+        while self.workers:
+            controls = dict((worker[0], pid) for pid, worker in
+                            self.workers.items())
+            try:
+                r, _, _ = select.select(controls.keys(), [], [])
+            except select.error, e:
+                if e.args[0] == errno.EINTR:
+                    continue
+                raise
+            for control in r:
+                pid = controls[control]
+                lines = control.read_lines()
+                if lines is None:
+                    logger.info("Worker %d exited.", pid)
+                    del self.workers[pid]
+                    os.waitpid(pid, 0)
+                    if pid in self.waiting:
+                        self.waiting.remove(pid)
+                    self.preempted.discard(pid)
+                    if pid == self.acceptor:
+                        self.hand_over()
+                    continue
+                for line in lines:
+                    self.workers[pid][1] = int(line[1])
+                    if line[0] == "full" and pid == self.acceptor:
+                        self.hand_over()
+                    elif line[0] == "open":
+                        self.reopen(pid)
+
+    def pids(self):
+        return self.workers.keys()
+
+    def stop(self):
+        logger.info("Stopping workers...")
+        for pid in self.workers.keys():
+            try:
+                os.kill(pid, signal.SIGINT)
+            except OSError:
+                pass
+        for pid in self.workers.keys():
+            os.waitpid(pid, 0)
+        self.workers = {}
+        self.socket.close()
+        logger.info("Supervisor halted.")
+        logger.close()
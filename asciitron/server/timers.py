@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+
+"""
+Timers of the server loop: everything that has to happen at a certain time
+(room updates, heartbeats, connection timeouts, metrics dumps) is a Timer,
+the loop sleeps until the earliest one is due.
+"""
+
+import heapq
+
+class Timer(object):
+    __slots__ = ('when', 'callback', 'args', 'cancelled')
+
+    def __init__(self, when, callback, args):
+        self.when = when
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+class Timers(object):
+    """
+    Heap of Timers ordered by due time (then by creation); cancelled ones
+    stay in the heap until they come up and are skipped then.
+    """
+
+    def __init__(self):
+        self.heap = [] # (time, sequence, Timer)
+        self.sequence = 0
+
+    def __len__(self):
+        return len(self.heap)
+
+    def call_at(self, when, callback, *args):
+        """Calls callback(*args) once at time when, returns the Timer."""
+        timer = Timer(when, callback, args)
+        self.sequence += 1
+        heapq.heappush(self.heap, (when, self.sequence, timer))
+        return timer
+
+    def next_at(self):
+        """Due time of the earliest timer, None if there is none."""
+        heap = self.heap
+        while heap and heap[0][2].cancelled:
+            heapq.heappop(heap)
+        if not heap:
+            return None
+        return heap[0][0]
+
+    def run(self, now):
+        """Calls every timer due at now, returns how many."""
+        heap = self.heap
+        count = 0
+        while heap and heap[0][0] <= now:
+            timer = heapq.heappop(heap)[2]
+            if timer.cancelled:
+                continue
+            timer.cancelled = True # done, cancel() doesn't matter anymore
+            timer.callback(*timer.args)
+            count += 1
+        return count
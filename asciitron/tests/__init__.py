@@ -0,0 +1,10 @@
+# -*- coding: utf-8 -*-
+
+"""
+Tests of asciitron, run them from the top directory:
+
+    python -m unittest discover -s asciitron/tests -t .
+
+Most of them play the scenarios of the benchmarks (see bench/) and check
+their outcome.
+"""
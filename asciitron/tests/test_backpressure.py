@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+
+"""
+Slow consumers (settings.OUTPUT_HIGH_WATER/OUTPUT_LIMIT): the room of
+bench/backpressure.py with a slow and a stalled reader.
+"""
+
+import unittest
+
+from ..common import FMT_SIZE_TOPLAYER
+from ..server import settings
+from ..server.log import logger
+from ..bench.backpressure import PLAYERS, SLOW, STALLED, create, play
+
+TICKS = 3000
+HIGH_WATER = 16 * 1024
+LIMIT = 128 * 1024
+
+def setUpModule():
+    logger.configure(level="error")
+
+class StalledReaderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.settings = settings.OUTPUT_HIGH_WATER, settings.OUTPUT_LIMIT
+        settings.OUTPUT_HIGH_WATER, settings.OUTPUT_LIMIT = HIGH_WATER, LIMIT
+        self.room, self.players = create()
+
+    def tearDown(self):
+        settings.OUTPUT_HIGH_WATER, settings.OUTPUT_LIMIT = self.settings
+        self.room.server.socket.close()
+
+    def test_stalled_reader(self):
+        room, players = self.room, self.players
+        (elapsed, slow, stalled, coalesced, dropped, evicted,
+         received) = play(room, players, TICKS)
+        # The stalled reader is disconnected at the limit
+        self.assertFalse(players[STALLED] in room.players)
+        self.assertEqual(evicted, 1)
+        self.assertTrue(stalled <= LIMIT)
+        self.assertTrue(dropped > 0)
+        # The slow one stays, its positions coalesced near the high water
+        self.assertTrue(players[SLOW] in room.players)
+        self.assertTrue(coalesced > 0)
+        self.assertTrue(slow < 2 * HIGH_WATER)
+        # Nobody else is held back
+        others = [player for player_id, player in players.iteritems()
+                  if player_id not in (SLOW, STALLED)]
+        for player in others:
+            self.assertTrue(player in room.players)
+        self.assertEqual(received,
+                         len(others) * TICKS * PLAYERS * FMT_SIZE_TOPLAYER)
+
+if __name__ == '__main__':
+    unittest.main()
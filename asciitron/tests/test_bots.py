@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+
+"""
+AI players hosted by the server (serve --bots): more bots than the digits
+of the old ids, next to a human on a low id.
+"""
+
+import os
+import unittest
+
+from ..common import MAX_PLAYER_ID
+from ..server import settings
+from ..server.log import logger
+from ..bench import spawn_server, stop_server
+from ..bench.bots import Bot, run_bots
+
+PORT = 9380
+BOTS = 11
+PLAY = 2.0 # seconds after the countdown
+
+def setUpModule():
+    logger.configure(level="error")
+
+class WatchingBot(Bot):
+    """Bot noting the commands and the player ids it gets."""
+
+    def __init__(self, *args, **kwargs):
+        Bot.__init__(self, *args, **kwargs)
+        self.cmds = set()
+        self.movers = set() # player ids of the positions
+
+    def handle_packet(self, packet):
+        Bot.handle_packet(self, packet)
+        self.cmds.add(packet[1])
+        if packet[1] == 2:
+            self.movers.add(packet[0])
+
+class ManyBotsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.seconds = settings.SECONDS
+        settings.SECONDS = 1 # the forked server inherits it
+        self.server = spawn_server(BOTS + 1, PORT, bots=BOTS)
+
+    def tearDown(self):
+        settings.SECONDS = self.seconds
+        if self.server is not None:
+            stop_server(self.server)
+
+    def test_human_on_low_id(self):
+        human = WatchingBot(1, PORT)
+        run_bots([human], settings.SECONDS + PLAY)
+        human.close()
+        # The server lives on, the human got its seat
+        self.assertEqual(os.waitpid(self.server, os.WNOHANG), (0, 0))
+        self.assertFalse(12 in human.cmds or 13 in human.cmds)
+        self.assertTrue(1 in human.cmds)
+        # The bots moved, each on a valid id of its own
+        bots = human.movers - set([1])
+        self.assertEqual(len(bots), BOTS)
+        for player_id in bots:
+            self.assertTrue(1 < player_id <= MAX_PLAYER_ID, player_id)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+
+"""
+Checkpoints of the running games (serve --checkpoint): a server restored
+from what another one wrote, the cost per checkpoint, and a kill and
+restart with bots playing (the scenarios of bench/checkpoint.py).
+"""
+
+import math
+import os
+import tempfile
+import unittest
+
+from ..server import settings
+from ..server.log import logger
+from ..bench import percentile, trails
+from ..bench.checkpoint import BOARD, create_server, start_room, cost, \
+    kill_and_restart
+
+PORT = 9370
+ROOMS = 3
+STEPS = 2000
+COST_ROOMS = 100
+COST_SECONDS = 10.0 # of simulated time
+KILL_ROOMS = 4
+RESUME = 1.0 # seconds from the restart until the seats are back
+
+def setUpModule():
+    logger.configure(level="error")
+
+class RestoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.filename = tempfile.mktemp(".ck")
+        self.servers = []
+
+    def tearDown(self):
+        for server in self.servers:
+            if server.checkpoint is not None:
+                server.checkpoint.close()
+            server.socket.close()
+        os.unlink(self.filename)
+
+    def create_server(self):
+        server = create_server(self.filename)
+        self.servers.append(server)
+        return server
+
+    def test_restore(self):
+        server = self.create_server()
+        rooms = [start_room(server) for _ in xrange(ROOMS)]
+        players = dict((room, dict((player.player_id, player)
+                                   for player in room.players))
+                       for room in rooms)
+        for i, (x, y, player_id) in enumerate(trails.drive(*BOARD)[:STEPS]):
+            for room in rooms:
+                players[room][player_id].move_to(x, y)
+            if i % 50 == 0:
+                server.checkpoint.write()
+        players[rooms[1]][2].remove_from_map()
+        for _ in xrange(settings.CHECKPOINT_SLICES):
+            server.checkpoint.write() # every room's turn
+        server.checkpoint.close()
+
+        restored = self.create_server()
+        games = dict((room.number, room) for room in restored.rooms)
+        self.assertEqual(sorted(games), sorted(room.number for room in rooms))
+        for room in rooms:
+            game = games[room.number]
+            self.assertEqual(game.game_state, "resuming")
+            self.assertEqual((game.width, game.height),
+                             (room.width, room.height))
+            self.assertEqual(
+                sorted(game.map.trails(0, 0, game.width, game.height)),
+                sorted(room.map.trails(0, 0, room.width, room.height)))
+            self.assertEqual(sorted(game.seats), sorted(players[room]))
+            for player_id, seat in game.seats.iteritems():
+                player = players[room][player_id]
+                self.assertEqual((seat.x, seat.y, seat.length, seat.key),
+                                 (player.x, player.y, player.length,
+                                  player.key))
+
+class CostTest(unittest.TestCase):
+
+    def test_cost(self):
+        times, written, ticks, fields, compaction = cost(
+            COST_ROOMS, trails.drive(*BOARD), COST_SECONDS)
+        tick = settings.TICK / 1000.0
+        # Far less than the tick budget, per call and over the ticks
+        self.assertTrue(percentile(times, 50) < tick / 4,
+                        percentile(times, 50))
+        self.assertTrue(sum(times) / ticks < tick / 5, sum(times) / ticks)
+        self.assertTrue(written > 0)
+
+class KillAndRestartTest(unittest.TestCase):
+
+    def setUp(self):
+        self.filename = tempfile.mktemp(".ck")
+        self.seconds = settings.SECONDS
+        settings.SECONDS = 1 # the forked servers inherit it
+
+    def tearDown(self):
+        settings.SECONDS = self.seconds
+        if os.path.exists(self.filename):
+            os.unlink(self.filename)
+
+    def test_kill_and_restart(self):
+        bots, over, resumed, delays, lost, going_on = kill_and_restart(
+            self.filename, KILL_ROOMS, PORT)
+        # Every bot with a game left has its seat back within a second
+        self.assertTrue(resumed)
+        self.assertEqual(len(resumed), len(bots) - len(over))
+        self.assertTrue(max(delays) < RESUME, max(delays))
+        # At most the steps since the last checkpoint are lost
+        steps = int(math.ceil(settings.CHECKPOINT_INTERVAL * 1000 /
+                              settings.SPEED_NORMAL))
+        self.assertTrue(max(lost) <= steps + 1, lost)
+        self.assertEqual(going_on, len(resumed) // 2)
+
+if __name__ == '__main__':
+    unittest.main()
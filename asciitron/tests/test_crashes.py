@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+
+"""
+End of round detection with several crashes in one tick: the scenarios of
+bench/crashes.py played with Room.alive and with a scan of the players.
+"""
+
+import unittest
+
+from ..server.game import Room
+from ..server.log import logger
+from ..bench.crashes import SCENARIOS, ScanRoom, play
+
+# Results per tick (player:cmd, 3 = crashed, 4 = won) of every scenario
+RESULTS = {
+    "3 ticks, 1 survivor": "1:3 2:3 3:3 | 4:3 5:3 6:3 | 7:3 8:3 9:4",
+    "all in one tick": "1:3 2:3 3:3 4:3 5:3 6:3 7:3 8:3 9:4",
+    "last two together": "1:3 2:3 3:3 4:3 5:3 6:3 7:3 | 8:3 9:4",
+    "leave, then crashes": "2:3 | 3:3 4:3 5:4",
+    "duel, both crash": "1:3 2:4",
+}
+
+def setUpModule():
+    logger.configure(level="error")
+
+class CrashesTest(unittest.TestCase):
+
+    def test_results(self):
+        for name, count, ticks in SCENARIOS:
+            results, state = play(Room, count, ticks)
+            self.assertEqual(results, RESULTS[name], name)
+            self.assertEqual(state, "over", name)
+
+    def test_same_as_scan(self):
+        for name, count, ticks in SCENARIOS:
+            self.assertEqual(play(Room, count, ticks),
+                             play(ScanRoom, count, ticks), name)
+
+if __name__ == '__main__':
+    unittest.main()
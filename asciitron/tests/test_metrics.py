@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+
+"""
+The metrics port (serve --metrics-port): a client which doesn't read its
+response holds up neither the server nor the next requests.
+"""
+
+import socket
+import time
+import unittest
+
+from ..server import metrics
+from ..server.log import logger
+from ..bench import spawn_server, stop_server
+
+PORT = 9400
+METRICS_PORT = 9401
+SIZE = 10000000 # response body, far more than the socket buffers take
+
+def setUpModule():
+    logger.configure(level="error")
+
+def request(sock):
+    sock.sendall("GET / HTTP/1.0\r\n\r\n")
+
+def read_all(sock):
+    data = []
+    while True:
+        chunk = sock.recv(65536)
+        if not chunk:
+            return "".join(data)
+        data.append(chunk)
+
+class SlowReaderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.render = metrics.Metrics.render
+        # The forked server inherits it
+        metrics.Metrics.render = lambda self: "x" * SIZE
+        self.server = spawn_server(2, PORT, metrics_port=METRICS_PORT)
+
+    def tearDown(self):
+        metrics.Metrics.render = self.render
+        stop_server(self.server)
+
+    def test_slow_reader(self):
+        slow = socket.create_connection(('127.0.0.1', METRICS_PORT))
+        request(slow)
+        time.sleep(.2)
+        fast = socket.create_connection(('127.0.0.1', METRICS_PORT))
+        fast.settimeout(5)
+        request(fast)
+        self.assertTrue(read_all(fast).endswith("x" * 100))
+        fast.close()
+        slow.settimeout(5)
+        response = read_all(slow)
+        slow.close()
+        self.assertTrue(response.startswith("HTTP/1.0 200 OK\r\n"))
+        self.assertEqual(len(response.split("\r\n\r\n", 1)[1]), SIZE)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+
+"""
+Multi-process mode (serve --workers): a room which loses a player before
+the game starts is filled up again, although its worker had stopped
+accepting.
+"""
+
+import os
+import signal
+import socket
+import unittest
+
+from ..server import settings
+from ..server.log import logger
+from ..bench.bots import Bot, run_bots
+from ..bench.workers import spawn
+
+PORT = 9390
+
+def setUpModule():
+    logger.configure(level="error")
+
+class StartingBot(Bot):
+    """Bot noting whether its game started (cmd 1)."""
+
+    started = False
+
+    def handle_packet(self, packet):
+        Bot.handle_packet(self, packet)
+        if packet[1] == 1:
+            self.started = True
+
+class ReopenTest(unittest.TestCase):
+
+    def setUp(self):
+        self.seconds = settings.SECONDS
+        settings.SECONDS = 1 # the forked workers inherit it
+        self.supervisor, self.workers = spawn(2, PORT, player_count=3)
+
+    def tearDown(self):
+        settings.SECONDS = self.seconds
+        os.kill(self.supervisor, signal.SIGINT)
+        os.waitpid(self.supervisor, 0)
+
+    def test_free_seat_filled(self):
+        bots = [StartingBot(1, PORT), StartingBot(2, PORT)]
+        run_bots(bots, .3)
+        # The third seat fills the room, its worker stops accepting...
+        silent = socket.create_connection(('127.0.0.1', PORT))
+        run_bots(bots, .3)
+        # ... and has a free seat again before the game started
+        silent.close()
+        run_bots(bots, .3)
+        bots.append(StartingBot(3, PORT))
+        run_bots(bots, settings.SECONDS + .5)
+        for bot in bots:
+            bot.close()
+            self.assertTrue(bot.started, bot.player_id)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+
+"""
+Timers of the server loop: the heap itself, then the accuracy of the loop
+idle and under load (the probes of bench/timers.py).
+"""
+
+import unittest
+
+from ..server import settings
+from ..server.log import logger
+from ..server.timers import Timers
+from ..bench import spawn_server, stop_server
+from ..bench.bots import Bot, run_bots
+from ..bench.timers import PROBE_EVERY, run
+
+PORT = 9360
+HEARTBEAT = .5 # seconds, for the lobby test
+DURATION = 2.0
+# Seconds late. The bots play in this process and compete with the server
+# for the CPU, the tail is up to the scheduler; timers run on idle passes
+# (as before the heap) would be up to 300 ms late
+LATE_P50 = .002
+LATE_P99 = .1
+LATE_MAX = .25
+
+def setUpModule():
+    logger.configure(level="error")
+
+class TimersTest(unittest.TestCase):
+
+    def test_order(self):
+        timers = Timers()
+        calls = []
+        for when, name in ((3, "c"), (1, "a"), (2, "b1"), (2, "b2")):
+            timers.call_at(when, calls.append, name)
+        self.assertEqual(timers.next_at(), 1)
+        self.assertEqual(timers.run(2), 3)
+        self.assertEqual(calls, ["a", "b1", "b2"])
+        self.assertEqual(timers.next_at(), 3)
+
+    def test_cancel(self):
+        timers = Timers()
+        calls = []
+        first = timers.call_at(1, calls.append, "first")
+        timers.call_at(2, calls.append, "second")
+        first.cancel()
+        self.assertEqual(timers.next_at(), 2)
+        self.assertEqual(timers.run(5), 1)
+        self.assertEqual(calls, ["second"])
+        self.assertEqual(timers.next_at(), None)
+
+class AccuracyTest(unittest.TestCase):
+    """Probes due every PROBE_EVERY seconds, for DURATION seconds."""
+
+    def check(self, bots, authoritative, port):
+        p50, p99, worst, count, cpu = run(bots, authoritative, port,
+                                          DURATION)
+        # Probes are scheduled from the last one, lateness adds up
+        self.assertTrue(count >= .5 * DURATION / PROBE_EVERY, count)
+        self.assertTrue(p50 < LATE_P50, p50)
+        self.assertTrue(p99 < LATE_P99, p99)
+        self.assertTrue(worst < LATE_MAX, worst)
+
+    def test_idle(self):
+        self.check(0, False, PORT)
+
+    def test_client_driven(self):
+        self.check(100, False, PORT + 1)
+
+    def test_authoritative(self):
+        self.check(100, True, PORT + 2)
+
+class LobbyBot(Bot):
+    """Bot noting the commands it gets."""
+
+    def __init__(self, *args, **kwargs):
+        Bot.__init__(self, *args, **kwargs)
+        self.cmds = []
+
+    def handle_packet(self, packet):
+        self.cmds.append(packet[1])
+        Bot.handle_packet(self, packet)
+
+class LobbyHeartbeatTest(unittest.TestCase):
+    """
+    Clients waiting in the lobby for longer than HEARTBEAT: v1 ones take
+    any record after the hello for the game start.
+    """
+
+    def setUp(self):
+        self.heartbeat = settings.HEARTBEAT
+        settings.HEARTBEAT = HEARTBEAT # the forked server inherits it
+        self.server = spawn_server(3, PORT + 3)
+
+    def tearDown(self):
+        settings.HEARTBEAT = self.heartbeat
+        stop_server(self.server)
+
+    def test_lobby(self):
+        old = LobbyBot(1, PORT + 3, version=1)
+        new = LobbyBot(2, PORT + 3)
+        run_bots([old, new], HEARTBEAT * 3)
+        for bot in (old, new):
+            bot.close()
+        # Nothing but the hello for v1, v2 gets its heartbeats
+        self.assertEqual(old.cmds, [0])
+        self.assertTrue(8 in new.cmds)
+        self.assertFalse(1 in new.cmds or 3 in new.cmds)
+
+if __name__ == '__main__':
+    unittest.main()